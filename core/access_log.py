@@ -0,0 +1,165 @@
+"""
+Structured access logging.
+
+RequestLogMiddleware gives every request an id (taken from X-Request-ID when
+the client sends a sane one) and logs one JSON line per request to the
+``core.access`` logger: view, status, latency, user id and query count.
+Requests picked by ACCESS_LOG_SQL_SAMPLE_RATE, or slower than
+ACCESS_LOG_SLOW_MS, also carry their SQL with per-query timings. The
+recorder is published in a context variable so /batch/ worker threads can add
+the queries of their sub-requests to the batch request's line.
+
+Records are handed to a QueueHandler and written by a QueueListener thread,
+so formatting and I/O stay off the request thread. When the queue is full
+records are dropped rather than blocking the request.
+"""
+
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connection
+
+from .metrics import metrics
+
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+request_id = contextvars.ContextVar("request_id", default=None)
+query_recorder = contextvars.ContextVar("query_recorder", default=None)
+logger = logging.getLogger("core.access")
+
+
+class RequestIdFilter(logging.Filter):
+    # Stamp every record with the id of the request being handled
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        entry.update(getattr(record, "payload", None) or {})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class BackgroundStreamHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler feeding a StreamHandler on a QueueListener thread. Usable
+    from LOGGING like a StreamHandler; ``queue_size`` bounds the backlog.
+    """
+
+    def __init__(self, stream=None, queue_size=10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.target = logging.StreamHandler(stream)
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+        self.running = True
+
+    def setFormatter(self, fmt):
+        # The listener's handler formats; the request thread only enqueues
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr("access_log.dropped")
+
+    def close(self):
+        # logging.shutdown() closes handlers at exit, flushing the queue
+        if self.running:
+            self.running = False
+            self.listener.stop()
+        super().close()
+
+
+class QueryRecorder:
+    # connection.execute_wrapper hook timing every query of the request
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+        self.queries = []
+        # Batch sub-requests record from several threads at once
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = round((time.perf_counter() - start) * 1000, 3)
+            with self.lock:
+                self.count += 1
+                if len(self.queries) < self.limit:
+                    self.queries.append({"sql": sql, "ms": ms})
+
+
+class RequestLogMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        incoming = request.headers.get(REQUEST_ID_HEADER, "")
+        rid = incoming if REQUEST_ID_PATTERN.match(incoming) else uuid.uuid4().hex
+        request.request_id = rid
+        token = request_id.set(rid)
+        recorder = QueryRecorder(getattr(settings, "ACCESS_LOG_MAX_QUERIES", 200))
+        recorder_token = query_recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(recorder):
+                response = self.get_response(request)
+        finally:
+            query_recorder.reset(recorder_token)
+            request_id.reset(token)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        response[REQUEST_ID_HEADER] = rid
+        if logger.isEnabledFor(logging.INFO):
+            self.log(request, response, rid, elapsed_ms, recorder)
+        return response
+
+    def log(self, request, response, rid, elapsed_ms, recorder):
+        match = request.resolver_match
+        user = getattr(request, "user", None)
+        payload = {
+            "request_id": rid,
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "latency_ms": round(elapsed_ms, 2),
+            "user_id": user.pk if user is not None and user.is_authenticated else None,
+            "queries": recorder.count,
+        }
+        slow = elapsed_ms >= getattr(settings, "ACCESS_LOG_SLOW_MS", 500)
+        if slow or random.random() < getattr(settings, "ACCESS_LOG_SQL_SAMPLE_RATE", 0.01):
+            payload["slow"] = slow
+            payload["sql"] = recorder.queries
+        logger.info("request", extra={"payload": payload})
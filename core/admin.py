@@ -1,39 +1,178 @@
+import csv
+from itertools import chain
+
+from django.conf import settings
 from django.contrib import admin
-from .models import *
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.http import StreamingHttpResponse
+from django.utils.functional import cached_property
+from .models import (
+    Address, ArchivedNotification, ArchivedOrder, Brand, Cart, CartItem, Category, ChangeEvent, Coupon, Discount,
+    Notification, Order, OrderItem, Product, ProductImage, ProductRecommendation, ProductVariant,
+    Review, SalesRollup, UserProfile
+)
+
+
+def estimate_rows(queryset):
+    # Table size from the database's statistics instead of COUNT(*)
+    model = queryset.model
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+                [model._meta.db_table]
+            )
+        else:
+            return model._default_manager.using(queryset.db).aggregate(estimate=Max('pk'))['estimate']
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses the table size estimate for unfiltered changelists of large tables;
+    filtered changelists still get an exact count.
+    """
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimate_rows(self.object_list)
+            if estimate is not None and estimate >= getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 10000):
+                return estimate
+        return super().count
+
+class Echo:
+    def write(self, value):
+        return value
+
+@admin.action(description='Export selected rows to CSV')
+def export_as_csv(modeladmin, request, queryset):
+    fields = modeladmin.csv_fields or [field.attname for field in queryset.model._meta.concrete_fields]
+    writer = csv.writer(Echo())
+    rows = queryset.values_list(*fields).iterator(chunk_size=2000)
+    response = StreamingHttpResponse(
+        (writer.writerow(row) for row in chain([fields], rows)), content_type='text/csv'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{queryset.model._meta.model_name}.csv"'
+    return response
+
+class ScalableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for large tables: no full COUNT(*) next to the
+    filtered count, estimated counts when unfiltered and streaming CSV export.
+    """
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    actions = [export_as_csv]
+    csv_fields = None
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'role', 'phone_number']
     list_filter = ['role']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'slug', 'parent']
+    list_select_related = ['parent']
     prepopulated_fields = {'slug': ('name',)}
+    search_fields = ['name']
 
 @admin.register(Brand)
 class BrandAdmin(admin.ModelAdmin):
     list_display = ['name']
+    search_fields = ['name']
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ScalableAdmin):
     list_display = ['name', 'category', 'brand', 'base_price', 'stock', 'is_active']
     list_filter = ['category', 'brand', 'is_active']
+    list_select_related = ['category', 'brand']
+    autocomplete_fields = ['category', 'brand']
+    raw_id_fields = ['created_by']
+    search_fields = ['name', 'slug']
     prepopulated_fields = {'slug': ('name',)}
+    csv_fields = ['id', 'name', 'slug', 'category__name', 'brand__name', 'base_price', 'stock', 'is_active', 'created_at']
 
 @admin.register(ProductVariant)
-class ProductVariantAdmin(admin.ModelAdmin):
+class ProductVariantAdmin(ScalableAdmin):
     list_display = ['product', 'name', 'sku', 'price', 'stock']
+    list_select_related = ['product']
+    raw_id_fields = ['product']
+    search_fields = ['sku', 'name']
+    csv_fields = ['id', 'product_id', 'product__name', 'sku', 'name', 'price', 'stock']
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(ScalableAdmin):
     list_display = ['id', 'user', 'grand_total', 'order_status', 'payment_status', 'created_at']
     list_filter = ['order_status', 'payment_status']
+    list_select_related = ['user']
+    raw_id_fields = ['user', 'address', 'approved_by']
+    date_hierarchy = 'created_at'
+    csv_fields = [
+        'id', 'user_id', 'user__username', 'total_amount', 'discount', 'grand_total',
+        'order_status', 'payment_status', 'created_at'
+    ]
+
+@admin.register(OrderItem)
+class OrderItemAdmin(ScalableAdmin):
+    list_display = ['id', 'order', 'sku', 'variant_name', 'quantity', 'price']
+    list_select_related = ['order__user']
+    raw_id_fields = ['order', 'product_variant']
+    csv_fields = ['id', 'order_id', 'product_variant_id', 'sku', 'variant_name', 'product_name', 'quantity', 'price']
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(ScalableAdmin):
     list_display = ['user', 'product', 'rating', 'created_at']
     list_filter = ['rating']
+    list_select_related = ['user', 'product']
+    raw_id_fields = ['user', 'product']
+    date_hierarchy = 'created_at'
+    csv_fields = ['id', 'user_id', 'user__username', 'product_id', 'product__name', 'rating', 'comment', 'created_at']
+
+@admin.register(Notification)
+class NotificationAdmin(ScalableAdmin):
+    list_display = ['title', 'user', 'is_read', 'created_at']
+    list_filter = ['is_read']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+
+@admin.register(SalesRollup)
+class SalesRollupAdmin(admin.ModelAdmin):
+    list_display = ['day', 'category', 'brand', 'orders', 'units', 'gross', 'discount', 'net']
+    list_select_related = ['category', 'brand']
+    list_filter = ['category', 'brand']
+    date_hierarchy = 'day'
+
+@admin.register(ProductRecommendation)
+class ProductRecommendationAdmin(admin.ModelAdmin):
+    list_display = ['product', 'related_product', 'score']
+    list_select_related = ['product', 'related_product']
+    raw_id_fields = ['product', 'related_product']
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(ScalableAdmin):
+    list_display = ['id', 'user', 'grand_total', 'order_status', 'created_at', 'archived_at']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+
+@admin.register(ArchivedNotification)
+class ArchivedNotificationAdmin(ScalableAdmin):
+    list_display = ['title', 'user', 'created_at', 'archived_at']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+
+@admin.register(ChangeEvent)
+class ChangeEventAdmin(ScalableAdmin):
+    list_display = ['id', 'entity', 'entity_id', 'op', 'created_at']
+    list_filter = ['entity', 'op']
 
 admin.site.register(Address)
 admin.site.register(ProductImage)
@@ -41,6 +180,3 @@ admin.site.register(Discount)
 admin.site.register(Coupon)
 admin.site.register(Cart)
 admin.site.register(CartItem)
-admin.site.register(OrderItem)
-admin.site.register(Notification)
-    
\ No newline at end of file
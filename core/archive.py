@@ -0,0 +1,114 @@
+"""
+Retention for the append-heavy tables: old read notifications and delivered
+orders are moved, a batch at a time, into the compact ArchivedNotification
+and ArchivedOrder tables so the hot tables stay small. Archived orders stay
+part of the sales history: the rollup and recommendation rebuilds read their
+lines through archived_order_lines().
+"""
+
+import json
+from decimal import Decimal
+
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from .fast_serializers import order_values, serialize_orders
+from .models import (
+    ArchivedNotification,
+    ArchivedOrder,
+    Notification,
+    Order,
+    ProductVariant,
+)
+
+
+def archive_notifications(before, batch_size=1000):
+    # Move read notifications created before ``before``; returns the count
+    notifications = Notification.objects.filter(is_read=True, created_at__lt=before)
+    moved = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                notifications.order_by("id").values(
+                    "id", "user_id", "title", "message", "created_at"
+                )[:batch_size]
+            )
+            if not batch:
+                return moved
+            ArchivedNotification.objects.bulk_create(
+                [ArchivedNotification(**row) for row in batch], ignore_conflicts=True
+            )
+            Notification.objects.filter(id__in=[row["id"] for row in batch]).delete()
+        moved += len(batch)
+
+
+def archive_orders(before, batch_size=500):
+    # Move orders delivered before ``before`` together with their items
+    orders = Order.objects.filter(order_status="DELIVERED", updated_at__lt=before)
+    moved = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                orders.select_for_update()
+                .order_by("id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                return moved
+            payloads = json.loads(
+                JSONRenderer().render(
+                    serialize_orders(order_values(Order.objects.filter(id__in=ids)))
+                )
+            )
+            ArchivedOrder.objects.bulk_create(
+                [
+                    ArchivedOrder(
+                        id=payload["id"],
+                        user_id=payload["user"],
+                        order_status=payload["order_status"],
+                        grand_total=payload["grand_total"],
+                        created_at=payload["created_at"],
+                        payload=payload,
+                    )
+                    for payload in payloads
+                ],
+                ignore_conflicts=True,
+            )
+            Order.objects.filter(id__in=ids).delete()
+        moved += len(ids)
+
+
+def archived_order_lines(archived, batch_size=1000):
+    """
+    Yield (archived order, lines) for every order in the ``archived``
+    queryset, each line as (product_id, category_id, brand_id, quantity,
+    price). Products come from the line's variant as it is now; lines whose
+    variant has since been deleted are left out, as they are for live orders.
+    """
+    last_id = 0
+    while True:
+        batch = list(archived.filter(id__gt=last_id).order_by("id")[:batch_size])
+        if not batch:
+            return
+        last_id = batch[-1].id
+        variant_ids = {
+            item["product_variant"]["id"]
+            for order in batch
+            for item in order.payload["items"]
+        }
+        products = {
+            variant_id: product
+            for variant_id, *product in ProductVariant.objects.filter(
+                id__in=variant_ids
+            ).values_list("id", "product_id", "product__category_id", "product__brand_id")
+        }
+        for order in batch:
+            yield order, [
+                (
+                    *products[item["product_variant"]["id"]],
+                    item["quantity"],
+                    Decimal(item["price"]),
+                )
+                for item in order.payload["items"]
+                if item["product_variant"]["id"] in products
+            ]
@@ -0,0 +1,23 @@
+from rest_framework.authentication import BaseAuthentication
+
+
+class LazyJWTAuthentication(BaseAuthentication):
+    """
+    simplejwt's JWTAuthentication, imported on the first request that needs
+    it instead of when the views (and their authentication_classes) load.
+    """
+    _backend = None
+
+    @classmethod
+    def backend(cls):
+        if cls._backend is None:
+            from rest_framework_simplejwt.authentication import JWTAuthentication
+
+            cls._backend = JWTAuthentication
+        return cls._backend()
+
+    def authenticate(self, request):
+        return self.backend().authenticate(request)
+
+    def authenticate_header(self, request):
+        return self.backend().authenticate_header(request)
@@ -0,0 +1,30 @@
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+
+from . import passwords
+
+
+class OffloadedModelBackend(ModelBackend):
+    """
+    ModelBackend that verifies passwords on the hashing pool and rehashes
+    them with the current hasher profile after a successful login.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # Spend the same time hashing as for an existing user
+            passwords.make_password(password)
+            return None
+
+        if not passwords.check_password(password, user.password):
+            return None
+        if passwords.must_update(user.password):
+            user.password = passwords.make_password(password)
+            user.save(update_fields=["password"])
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,167 @@
+"""
+In-process execution of /batch/ sub-requests.
+
+Every sub-request is dispatched straight to its view from ``core.urls``,
+authenticated as the batch request's user, without going through the
+middleware stack again. Runs of consecutive reads execute concurrently on a
+thread pool; writes run one at a time, in order, and act as barriers so
+reads never observe a half-applied sequence of writes.
+"""
+
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection, connections
+from django.urls import Resolver404, resolve
+
+from .access_log import query_recorder
+from .identity import identity_map
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Headers of the batch request that must not leak into its sub-requests
+DROPPED_META_PREFIXES = ("HTTP_IF_", "HTTP_IDEMPOTENCY_KEY", "CONTENT_")
+RETURNED_HEADERS = ("ETag", "Last-Modified", "Cache-Control", "Retry-After", "Location")
+
+
+class BatchError(ValueError):
+    pass
+
+
+def method_of(operation):
+    return str(operation.get("method", "GET")).upper()
+
+
+def validate(operations):
+    max_requests = getattr(settings, "BATCH_MAX_REQUESTS", 20)
+    if not isinstance(operations, list) or not operations:
+        raise BatchError("requests must be a non-empty list")
+    if len(operations) > max_requests:
+        raise BatchError(f"A batch can contain at most {max_requests} requests")
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise BatchError("Each request must be an object")
+        method = method_of(operation)
+        if method not in READ_METHODS | WRITE_METHODS:
+            raise BatchError(f"Unsupported method: {method}")
+        path = operation.get("path")
+        if not isinstance(path, str) or not path.startswith("/"):
+            raise BatchError("Each request needs an absolute path")
+        if not isinstance(operation.get("headers", {}), dict):
+            raise BatchError("headers must be an object")
+
+
+def build_request(request, operation):
+    method = method_of(operation)
+    url = urlsplit(operation["path"])
+    body = b""
+    if operation.get("body") is not None:
+        body = json.dumps(operation["body"]).encode()
+
+    environ = {
+        key: value
+        for key, value in request.META.items()
+        if not key.startswith(DROPPED_META_PREFIXES)
+    }
+    environ.update(
+        {
+            "REQUEST_METHOD": method,
+            "PATH_INFO": url.path,
+            "QUERY_STRING": url.query,
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.input": io.BytesIO(body),
+        }
+    )
+    for name, value in operation.get("headers", {}).items():
+        environ["HTTP_" + name.upper().replace("-", "_")] = str(value)
+
+    sub_request = WSGIRequest(environ)
+    # One authentication for the whole batch
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    return sub_request
+
+
+def execute(request, operation):
+    try:
+        match = resolve(urlsplit(operation["path"]).path, urlconf="core.urls")
+    except Resolver404:
+        return {"status": 404, "headers": {}, "body": {"error": "Not found"}}
+    if match.url_name == "batch":
+        return {"status": 400, "headers": {}, "body": {"error": "Batches cannot be nested"}}
+
+    try:
+        response = match.func(build_request(request, operation), *match.args, **match.kwargs)
+    except Exception:
+        logger.exception("Batch sub-request %s failed", operation["path"])
+        return {"status": 500, "headers": {}, "body": {"error": "Internal server error"}}
+
+    if hasattr(response, "data"):
+        body = response.data
+    elif response.get("Content-Type", "").startswith("application/json") and response.content:
+        body = json.loads(response.content)
+    else:
+        body = None
+    headers = {name: response[name] for name in RETURNED_HEADERS if response.has_header(name)}
+    return {"status": response.status_code, "headers": headers, "body": body}
+
+
+def execute_in_worker(request, operation):
+    # Count the worker's queries on the batch request's access log line
+    recorder = query_recorder.get()
+    try:
+        if recorder is None:
+            return execute(request, operation)
+        with connection.execute_wrapper(recorder):
+            return execute(request, operation)
+    finally:
+        # Worker threads own their connections
+        connections.close_all()
+
+
+def run_batch(request, operations):
+    """
+    Execute ``operations`` and return one result per operation, in order.
+    """
+    workers = getattr(settings, "BATCH_MAX_WORKERS", 4)
+    results = [None] * len(operations)
+
+    with identity_map() as identity, ThreadPoolExecutor(max(workers, 1)) as executor:
+        # Load the caller's profile once instead of in every sub-request
+        if request.user.is_authenticated and hasattr(request.user, "profile"):
+            identity.add(request.user)
+            identity.add(request.user.profile)
+
+        index = 0
+        while index < len(operations):
+            if method_of(operations[index]) not in READ_METHODS:
+                results[index] = execute(request, operations[index])
+                index += 1
+                continue
+
+            end = index
+            while end < len(operations) and method_of(operations[end]) in READ_METHODS:
+                end += 1
+            if workers <= 1 or end - index == 1:
+                for position in range(index, end):
+                    results[position] = execute(request, operations[position])
+            else:
+                futures = {
+                    position: executor.submit(
+                        copy_context().run, execute_in_worker, request, operations[position]
+                    )
+                    for position in range(index, end)
+                }
+                for position, future in futures.items():
+                    results[position] = future.result()
+            index = end
+    return results
@@ -0,0 +1,125 @@
+"""
+Replace a cart's contents with a desired set of lines in a fixed number of
+queries, for clients that edit several items at once.
+"""
+
+from django.db import transaction
+
+from .cart_totals import adjust_totals, manual_totals
+from .models import CartItem, ProductVariant
+
+
+class CartLinesError(Exception):
+    def __init__(self, message, variant_ids=()):
+        super().__init__(message)
+        self.message = message
+        self.variant_ids = sorted(variant_ids)
+
+
+def parse_lines(lines):
+    """
+    Map variant id -> quantity from ``[{"product_variant", "quantity"}]``.
+    Repeated variants are added together; a total of 0 removes the line.
+    """
+    if not isinstance(lines, list):
+        raise CartLinesError("items must be a list")
+    quantities = {}
+    for line in lines:
+        if not isinstance(line, dict):
+            raise CartLinesError(
+                "Each item needs an integer product_variant and quantity"
+            )
+        variant_id = parse_integer(line.get("product_variant"))
+        quantity = parse_integer(line.get("quantity", 1))
+        if variant_id is None or quantity is None:
+            raise CartLinesError(
+                "Each item needs an integer product_variant and quantity"
+            )
+        if quantity < 0:
+            raise CartLinesError("quantity must not be negative", [variant_id])
+        quantities[variant_id] = quantities.get(variant_id, 0) + quantity
+    return {pk: quantity for pk, quantity in quantities.items() if quantity}
+
+
+def parse_integer(value):
+    # An integer from a JSON number or numeric string; bools and floats are None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def parse_quantity(value):
+    # A positive integer quantity, else None
+    quantity = parse_integer(value)
+    return quantity if quantity is not None and quantity >= 1 else None
+
+
+def apply_lines(cart, quantities):
+    """
+    Diff ``quantities`` against the cart's items and apply the difference
+    with at most one bulk_update, one bulk_create and one delete. Stock for
+    every requested variant is checked with a single query first.
+    """
+    variants = {
+        pk: (stock, price)
+        for pk, stock, price in ProductVariant.objects.filter(
+            pk__in=quantities
+        ).values_list("pk", "stock", "price")
+    }
+    missing = quantities.keys() - variants.keys()
+    if missing:
+        raise CartLinesError("Product variant not found", missing)
+    short = [pk for pk, quantity in quantities.items() if quantity > variants[pk][0]]
+    if short:
+        raise CartLinesError("Insufficient stock", short)
+
+    with transaction.atomic():
+        current = {
+            item.product_variant_id: item
+            for item in CartItem.objects.select_for_update()
+            .filter(cart=cart)
+            .only("id", "cart_id", "product_variant_id", "quantity", "unit_price")
+        }
+        count_delta = amount_delta = 0
+        changed = []
+        removed = []
+        for variant_id, item in current.items():
+            quantity = quantities.get(variant_id, 0)
+            if quantity != item.quantity:
+                count_delta += quantity - item.quantity
+                amount_delta += (quantity - item.quantity) * item.unit_price
+                if quantity:
+                    item.quantity = quantity
+                    changed.append(item)
+                else:
+                    removed.append(item.pk)
+        added = []
+        for variant_id, quantity in quantities.items():
+            if variant_id not in current:
+                price = variants[variant_id][1]
+                count_delta += quantity
+                amount_delta += quantity * price
+                added.append(
+                    CartItem(
+                        cart=cart,
+                        product_variant_id=variant_id,
+                        quantity=quantity,
+                        unit_price=price,
+                    )
+                )
+
+        if changed:
+            CartItem.objects.bulk_update(changed, ["quantity"])
+        if added:
+            CartItem.objects.bulk_create(added)
+        if removed:
+            with manual_totals():
+                CartItem.objects.filter(pk__in=removed).delete()
+        if changed or added or removed:
+            # Bulk writes and manual_totals skip the per-item recount, so
+            # update the totals here
+            adjust_totals(cart.pk, count_delta, amount_delta)
+    return cart
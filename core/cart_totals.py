@@ -0,0 +1,165 @@
+"""
+Maintained cart totals.
+
+Cart.item_count and Cart.subtotal are kept in step with the cart's items,
+and CartItem.unit_price with the variant's current price, so totals and the
+cart badge are read from the Cart row without touching CartItem. The
+helpers here change items and totals together with F() expressions; item
+changes made through model save()/delete() (the admin, cascades) recompute
+the cart from its items instead.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Cart, CartItem, ProductVariant
+
+ZERO = Decimal("0.00")
+
+_manual = ContextVar("cart_totals_manual", default=False)
+
+
+@contextmanager
+def manual_totals():
+    """
+    Skip the recount the CartItem signals do for every saved or deleted item
+    inside the block; the caller keeps the totals itself.
+    """
+    token = _manual.set(True)
+    try:
+        yield
+    finally:
+        _manual.reset(token)
+
+
+def signals_recount():
+    return not _manual.get()
+
+
+def adjust_totals(cart_id, quantity, amount):
+    # Shift the cart's totals by a delta; also bumps updated_at for the ETag
+    Cart.objects.filter(pk=cart_id).update(
+        item_count=F("item_count") + quantity,
+        subtotal=F("subtotal") + amount,
+        updated_at=timezone.now(),
+    )
+
+
+def recompute_totals(cart_ids):
+    """
+    Recompute item_count and subtotal from the items of the given carts with
+    one UPDATE.
+    """
+    items = CartItem.objects.filter(cart=OuterRef("pk")).order_by().values("cart")
+    Cart.objects.filter(pk__in=cart_ids).update(
+        item_count=Coalesce(
+            Subquery(items.annotate(total=Sum("quantity")).values("total")),
+            0,
+            output_field=IntegerField(),
+        ),
+        subtotal=Coalesce(
+            Subquery(
+                items.annotate(total=Sum(F("quantity") * F("unit_price"))).values("total")
+            ),
+            ZERO,
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def add_item(cart, variant, quantity):
+    """
+    Add ``quantity`` of ``variant`` to the cart, creating the line if needed.
+    Returns the CartItem.
+    """
+    with transaction.atomic():
+        lines = CartItem.objects.filter(cart=cart, product_variant=variant)
+        if not lines.update(quantity=F("quantity") + quantity):
+            try:
+                with transaction.atomic():
+                    # bulk_create skips the post_save signal that recomputes the cart
+                    CartItem.objects.bulk_create(
+                        [
+                            CartItem(
+                                cart=cart,
+                                product_variant=variant,
+                                quantity=quantity,
+                                unit_price=variant.price,
+                            )
+                        ]
+                    )
+            except IntegrityError:
+                # Created concurrently by another request
+                lines.update(quantity=F("quantity") + quantity)
+        adjust_totals(cart.pk, quantity, quantity * variant.price)
+        return lines.select_related("product_variant").get()
+
+
+def set_quantity(item, quantity):
+    with transaction.atomic():
+        current = (
+            CartItem.objects.select_for_update()
+            .filter(pk=item.pk)
+            .values_list("quantity", "unit_price")
+            .get()
+        )
+        CartItem.objects.filter(pk=item.pk).update(quantity=quantity)
+        delta = quantity - current[0]
+        adjust_totals(item.cart_id, delta, delta * current[1])
+    item.quantity = quantity
+    return item
+
+
+def remove_item(item):
+    with transaction.atomic():
+        current = (
+            CartItem.objects.select_for_update()
+            .filter(pk=item.pk)
+            .values_list("quantity", "unit_price")
+            .first()
+        )
+        if current is None:
+            return
+        with manual_totals():
+            CartItem.objects.filter(pk=item.pk).delete()
+        adjust_totals(item.cart_id, -current[0], -current[0] * current[1])
+
+
+def clear_cart(cart):
+    with transaction.atomic():
+        with manual_totals():
+            CartItem.objects.filter(cart=cart).delete()
+        Cart.objects.filter(pk=cart.pk).update(
+            item_count=0, subtotal=ZERO, updated_at=timezone.now()
+        )
+
+
+def reprice_variants(variant_ids):
+    """
+    Bring CartItem.unit_price in line with the variants' current price and
+    recompute the carts whose lines changed. Call after updating prices with
+    QuerySet.update(), which skips the ProductVariant signals.
+    """
+    stale = CartItem.objects.filter(product_variant__in=variant_ids).exclude(
+        unit_price=F("product_variant__price")
+    )
+    cart_ids = list(stale.values_list("cart_id", flat=True).distinct())
+    if not cart_ids:
+        return 0
+    with transaction.atomic():
+        stale.update(
+            unit_price=Subquery(
+                ProductVariant.objects.filter(pk=OuterRef("product_variant")).values(
+                    "price"
+                )[:1]
+            )
+        )
+        recompute_totals(cart_ids)
+    return len(cart_ids)
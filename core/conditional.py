@@ -0,0 +1,108 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(request, version):
+    """
+    Weak ETag from a version key (ids and updated_at columns) plus
+    everything else that changes the representation: the host (absolute
+    image URLs), the query string and the negotiated format.
+    """
+    renderer = getattr(request, "accepted_renderer", None)
+    fmt = getattr(renderer, "format", "")
+    raw = f"{version}|{request.get_host()}|{request.META.get('QUERY_STRING', '')}|{fmt}"
+    return "W/" + quote_etag(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+
+
+def conditional_get(method):
+    """
+    Answer GET requests with 304 before the view serializes anything when the
+    client's If-None-Match / If-Modified-Since validators still match.
+
+    The view provides ``get_version(request, *args, **kwargs)`` returning a
+    (version key, last modified datetime) pair, or None to skip validation
+    (e.g. when the object does not exist), and a ``cache_control`` dict
+    passed to patch_cache_control().
+    """
+
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        version = self.get_version(request, *args, **kwargs)
+        if version is None:
+            return apply_cache_control(self, method(self, request, *args, **kwargs))
+
+        key, last_modified = version
+        etag = make_etag(request, key)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = method(self, request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            if timestamp is not None:
+                response["Last-Modified"] = http_date(timestamp)
+        return apply_cache_control(self, response)
+
+    return wrapper
+
+
+def apply_cache_control(view, response):
+    cache_control = getattr(view, "cache_control", None)
+    if cache_control and response.status_code in (200, 304):
+        patch_cache_control(response, **cache_control)
+        vary = ["Accept", "Authorization"] if cache_control.get("private") else ["Accept"]
+        patch_vary_headers(response, vary)
+    return response
+
+
+PUBLIC_CATALOG = {"public": True, "max_age": 60}
+PRIVATE_NO_CACHE = {"private": True, "no_cache": True}
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified support for the list and retrieve actions of a
+    ModelViewSet, computed from the ``version_fields`` datetime columns.
+    List responses only get an ETag.
+    """
+
+    cache_control = PUBLIC_CATALOG
+    version_fields = ["updated_at"]
+
+    def get_version(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+
+        if lookup_url_kwarg in kwargs:
+            try:
+                row = (
+                    queryset.filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+                    .values_list("pk", *self.version_fields)
+                    .first()
+                )
+            except (TypeError, ValueError):
+                return None
+            if row is None:
+                return None
+            return "-".join(map(str, row)), max(filter(None, row[1:]), default=None)
+
+        # Lists send no Last-Modified: deleting or deactivating a row leaves
+        # the newest updated_at where it was, but changes the count in the ETag
+        aggregates = queryset.aggregate(
+            count=Count("pk"),
+            **{f"last_{index}": Max(field) for index, field in enumerate(self.version_fields)},
+        )
+        versions = [aggregates[f"last_{index}"] for index in range(len(self.version_fields))]
+        return "-".join(map(str, [aggregates["count"], *versions])), None
+
+    @conditional_get
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_get
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
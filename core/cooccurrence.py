@@ -0,0 +1,88 @@
+"""
+Sparse item-item co-occurrence counting with NumPy/SciPy.
+
+This module must not import Django: top_k_block() runs in worker processes
+that unpickle it by reference.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+def occurrence_matrix(rows):
+    """
+    Build the binary orders x products CSR matrix from (order_id, product_id)
+    rows. Returns the matrix and the product id of every column.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    order_index = {}
+    product_index = {}
+    order_positions = []
+    product_positions = []
+    for order_id, product_id in rows:
+        order_positions.append(order_index.setdefault(order_id, len(order_index)))
+        product_positions.append(product_index.setdefault(product_id, len(product_index)))
+
+    matrix = sparse.csr_matrix(
+        (
+            np.ones(len(order_positions), dtype=np.int32),
+            (
+                np.asarray(order_positions, dtype=np.int64),
+                np.asarray(product_positions, dtype=np.int64),
+            ),
+        ),
+        shape=(len(order_index), len(product_index)),
+    )
+    # A product bought twice in one order still counts once
+    matrix.data[:] = 1
+    product_ids = np.fromiter(product_index, dtype=np.int64, count=len(product_index))
+    return matrix, product_ids
+
+
+def top_k_block(transposed_block, matrix, start, top_k):
+    """
+    Co-occurrence counts for the products in rows [start, start + n) of the
+    products x orders matrix, reduced to the top-K neighbours of each.
+    Runs in worker processes, so it only touches NumPy/SciPy objects.
+    """
+    import numpy as np
+
+    counts = (transposed_block @ matrix).tocsr()
+    results = []
+    for offset in range(counts.shape[0]):
+        row = counts.getrow(offset)
+        columns, values = row.indices, row.data
+        keep = columns != start + offset
+        columns, values = columns[keep], values[keep]
+        if not len(columns):
+            continue
+        if len(columns) > top_k:
+            best = np.argpartition(-values, top_k - 1)[:top_k]
+            columns, values = columns[best], values[best]
+        results.append((start + offset, columns.tolist(), values.tolist()))
+    return results
+
+
+def compute_neighbours(matrix, top_k, workers=1, block_size=2000):
+    """
+    Yield (product position, neighbour positions, counts) for every product,
+    computing X.T @ X in row blocks spread over ``workers`` processes.
+    """
+    transposed = matrix.T.tocsr()
+    blocks = [
+        (transposed[start:start + block_size], start)
+        for start in range(0, transposed.shape[0], block_size)
+    ]
+    if workers <= 1:
+        for block, start in blocks:
+            yield from top_k_block(block, matrix, start, top_k)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(top_k_block, block, matrix, start, top_k)
+            for block, start in blocks
+        ]
+        for future in futures:
+            yield from future.result()
@@ -0,0 +1,97 @@
+"""
+In-process coupon index.
+
+Coupon validation runs on every keystroke of the coupon field, so live
+coupons are held in memory: the index is loaded on first use, dropped by
+the Coupon save/delete signals in this process and reloaded after
+COUPON_INDEX_TTL seconds to pick up changes made by other processes. The
+index holds every live coupon, so a miss is a definitive "invalid code"
+without a database query. Only redemption touches the database, with an
+atomic conditional increment of used_count.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .metrics import metrics
+from .models import Coupon
+
+
+class CouponUnavailable(Exception):
+    pass
+
+
+class CouponIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._coupons = None
+        self._loaded_at = 0.0
+
+    def get_ttl(self):
+        return getattr(settings, "COUPON_INDEX_TTL", 60)
+
+    def coupons(self):
+        coupons = self._coupons
+        if coupons is None or time.monotonic() - self._loaded_at > self.get_ttl():
+            with self._lock:
+                if self._coupons is coupons:
+                    self._coupons = {
+                        coupon.code: coupon
+                        for coupon in Coupon.objects.filter(
+                            expiry_date__gte=timezone.now(),
+                            used_count__lt=F("usage_limit"),
+                        )
+                    }
+                    self._loaded_at = time.monotonic()
+                    metrics.incr("coupons.index.loaded")
+                coupons = self._coupons
+        return coupons
+
+    def lookup(self, code):
+        # The live coupon for ``code``, or None; codes that are not strings
+        # (a list or object in a JSON body) match nothing
+        coupon = self.coupons().get(code) if code and isinstance(code, str) else None
+        if coupon is None or coupon.expiry_date < timezone.now():
+            return None
+        if coupon.used_count >= coupon.usage_limit:
+            return None
+        return coupon
+
+    def invalidate(self):
+        with self._lock:
+            self._coupons = None
+
+
+index = CouponIndex()
+
+
+def discount_for(coupon, total_amount):
+    # Discount ``coupon`` gives on ``total_amount``; 0 below its minimum
+    if total_amount < coupon.min_amount:
+        return 0
+    if coupon.discount_type == "PERCENT":
+        return (total_amount * coupon.value) / 100
+    return coupon.value
+
+
+def redeem(coupon):
+    """
+    Use up one redemption of ``coupon``. The increment only applies while
+    used_count is below usage_limit, so concurrent checkouts cannot exceed
+    the limit; raises CouponUnavailable when it is used up or expired.
+    """
+    redeemed = Coupon.objects.filter(
+        pk=coupon.pk,
+        used_count__lt=F("usage_limit"),
+        expiry_date__gte=timezone.now(),
+    ).update(used_count=F("used_count") + 1)
+    if not redeemed:
+        index.invalidate()
+        raise CouponUnavailable(coupon.code)
+    # Keep this process's copy close; other processes catch up on reload
+    transaction.on_commit(lambda: setattr(coupon, "used_count", coupon.used_count + 1))
@@ -0,0 +1,367 @@
+"""
+Synthetic data for performance tests and profiling.
+
+generate() fills the database with users, a category tree, brands,
+products with variants, orders with their items and reviews, all inserted
+with bulk_create in batches. The data is a function of the seed: every
+batch draws from its own random.Random seeded with (seed, kind, batch), so
+the same seed gives the same rows whatever the number of workers.
+
+Popularity is skewed like a real catalogue: products are ordered and
+reviewed with Zipfian weights, and products fall into categories and
+brands with Zipfian weights too, giving a few large categories and a long
+tail. Orders are spread over the ``days`` before generation started.
+Orders and reviews, the bulk of the rows, can be generated by
+several processes at once (not on SQLite, which has a single writer).
+
+Rows are inserted without signals, so run rebuild_sales_rollups and
+build_recommendations afterwards if those tables are needed.
+"""
+
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .inventory import sync_product_stock
+from .models import (
+    Address,
+    Brand,
+    Category,
+    Order,
+    OrderItem,
+    Product,
+    ProductVariant,
+    Review,
+    UserProfile,
+)
+from .slugs import bulk_create_with_slugs
+
+ZIPF_EXPONENT = 1.1
+LINES_PER_ORDER = ([1, 2, 3, 4, 5], [40, 25, 15, 12, 8])
+VARIANTS_PER_PRODUCT = ([1, 2, 3, 4], [50, 25, 15, 10])
+ORDER_STATUSES = (
+    ["DELIVERED", "SHIPPED", "APPROVED", "PENDING", "CANCELLED"],
+    [60, 10, 10, 15, 5],
+)
+RATINGS = ([5, 4, 3, 2, 1], [40, 30, 15, 7, 8])
+
+# Catalogue ids shared with worker processes
+_context = None
+
+
+def zipf_cum_weights(n, exponent=ZIPF_EXPONENT):
+    # Cumulative weights of ranks 1..n for random.choices(cum_weights=...)
+    return list(itertools.accumulate(1 / rank**exponent for rank in range(1, n + 1)))
+
+
+def batch_rng(seed, kind, index):
+    return random.Random(f"{seed}:{kind}:{index}")
+
+
+def batches(total, batch_size):
+    # (index, size) of each batch of ``total`` rows
+    for index, start in enumerate(range(0, total, batch_size)):
+        yield index, min(batch_size, total - start)
+
+
+def money(value):
+    return Decimal(value).quantize(Decimal("0.01"))
+
+
+def create_users(count, prefix, password, seed, batch_size):
+    # One hash shared by every user keeps this from being bound by the hasher
+    encoded = make_password(password)
+    user_ids = []
+    address_ids = []
+    for index, size in batches(count, batch_size):
+        rng = batch_rng(seed, "users", index)
+        start = index * batch_size
+        users = User.objects.bulk_create(
+            [
+                User(
+                    username=f"{prefix}-user-{start + n}",
+                    email=f"{prefix}-user-{start + n}@example.com",
+                    password=encoded,
+                )
+                for n in range(size)
+            ]
+        )
+        UserProfile.objects.bulk_create(
+            [UserProfile(user=user, role="USER") for user in users]
+        )
+        addresses = Address.objects.bulk_create(
+            [
+                Address(
+                    user=user,
+                    name="Home",
+                    street=f"{rng.randint(1, 999)} Main Street",
+                    city=f"City {rng.randint(1, 200)}",
+                    state=f"State {rng.randint(1, 30)}",
+                    country="Country",
+                    zipcode=f"{rng.randint(10000, 99999)}",
+                    is_default=True,
+                )
+                for user in users
+            ]
+        )
+        user_ids.extend(user.pk for user in users)
+        address_ids.extend(address.pk for address in addresses)
+    return user_ids, address_ids
+
+
+def create_categories(count, prefix, seed):
+    """
+    A two-level tree: about a tenth of the categories are roots, and the
+    rest hang off them with Zipfian weights, so a few roots are large.
+    """
+    rng = batch_rng(seed, "categories", 0)
+    root_count = max(1, count // 10)
+    roots = bulk_create_with_slugs(
+        Category,
+        [Category(name=f"{prefix} Category {n}") for n in range(root_count)],
+    )
+    parents = rng.choices(
+        roots, cum_weights=zipf_cum_weights(len(roots)), k=count - root_count
+    )
+    children = bulk_create_with_slugs(
+        Category,
+        [
+            Category(name=f"{prefix} Category {root_count + n}", parent=parent)
+            for n, parent in enumerate(parents)
+        ],
+    )
+    return [category.pk for category in roots + children]
+
+
+def create_brands(count, prefix):
+    brands = Brand.objects.bulk_create(
+        [Brand(name=f"{prefix} Brand {n}") for n in range(count)]
+    )
+    return [brand.pk for brand in brands]
+
+
+def create_products(count, prefix, category_ids, brand_ids, seed, batch_size):
+    """
+    Products and their variants. Returns (product_id, variants) per product,
+    each variant as (variant_id, price, sku, variant name, product name).
+    """
+    rng = batch_rng(seed, "catalogue", 0)
+    # Shuffle so popularity does not follow insertion order
+    category_ids = rng.sample(category_ids, len(category_ids))
+    brand_ids = rng.sample(brand_ids, len(brand_ids))
+    category_weights = zipf_cum_weights(len(category_ids))
+    brand_weights = zipf_cum_weights(len(brand_ids))
+
+    catalogue = []
+    for index, size in batches(count, batch_size):
+        rng = batch_rng(seed, "products", index)
+        start = index * batch_size
+        products = bulk_create_with_slugs(
+            Product,
+            [
+                Product(
+                    name=f"{prefix} Product {start + n}",
+                    description=f"Synthetic product {start + n}",
+                    category_id=rng.choices(category_ids, cum_weights=category_weights)[0],
+                    brand_id=rng.choices(brand_ids, cum_weights=brand_weights)[0],
+                    base_price=money(max(1.0, rng.lognormvariate(3.5, 1.0))),
+                )
+                for n in range(size)
+            ],
+            batch_size=batch_size,
+        )
+        variants = []
+        for product in products:
+            for n in range(rng.choices(*VARIANTS_PER_PRODUCT)[0]):
+                variants.append(
+                    ProductVariant(
+                        product=product,
+                        sku=f"{prefix}-{product.pk}-{n}",
+                        name=f"Variant {n}",
+                        price=money(product.base_price * Decimal(rng.uniform(0.9, 1.3))),
+                        stock=rng.randint(0, 500),
+                    )
+                )
+        ProductVariant.objects.bulk_create(variants)
+        sync_product_stock(product_ids=[product.pk for product in products])
+
+        lines = {product.pk: [] for product in products}
+        for variant in variants:
+            lines[variant.product_id].append(
+                (variant.pk, variant.price, variant.sku, variant.name, variant.product.name)
+            )
+        catalogue.extend(lines.items())
+    return catalogue
+
+
+def create_orders(index, size, seed):
+    context = _context
+    rng = batch_rng(seed, "orders", index)
+    catalogue = context["catalogue"]
+    popularity = context["popularity"]
+    window = context["days"] * 86400
+    orders = []
+    lines = []
+    placed = []
+    for _ in range(size):
+        user = rng.randrange(len(context["user_ids"]))
+        picked = {}
+        for product in rng.choices(
+            catalogue, cum_weights=popularity, k=rng.choices(*LINES_PER_ORDER)[0]
+        ):
+            variant = rng.choice(product[1])
+            picked[variant[0]] = (variant, rng.randint(1, 3))
+        total = sum(variant[1] * quantity for variant, quantity in picked.values())
+        order_status = rng.choices(*ORDER_STATUSES)[0]
+        orders.append(
+            Order(
+                user_id=context["user_ids"][user],
+                address_id=context["address_ids"][user],
+                total_amount=total,
+                grand_total=total,
+                order_status=order_status,
+                payment_status="PENDING" if order_status in ("PENDING", "CANCELLED") else "PAID",
+            )
+        )
+        lines.append(picked.values())
+        placed.append(context["now"] - timedelta(seconds=rng.uniform(0, window)))
+
+    with transaction.atomic():
+        Order.objects.bulk_create(orders)
+        # auto_now_add stamps bulk_create too; backdate the orders afterwards
+        for order, created_at in zip(orders, placed):
+            order.created_at = order.updated_at = created_at
+        Order.objects.bulk_update(orders, ["created_at", "updated_at"])
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(
+                    order=order,
+                    product_variant_id=variant_id,
+                    quantity=quantity,
+                    price=price,
+                    sku=sku,
+                    variant_name=variant_name,
+                    product_name=product_name,
+                )
+                for order, picked in zip(orders, lines)
+                for (variant_id, price, sku, variant_name, product_name), quantity in picked
+            ]
+        )
+    return size
+
+
+def create_reviews(index, size, seed):
+    context = _context
+    rng = batch_rng(seed, "reviews", index)
+    products = rng.choices(context["product_ids"], cum_weights=context["popularity"], k=size)
+    Review.objects.bulk_create(
+        [
+            Review(
+                user_id=rng.choice(context["user_ids"]),
+                product_id=product_id,
+                rating=rng.choices(*RATINGS)[0],
+                comment=f"Synthetic review {index}-{n}",
+            )
+            for n, product_id in enumerate(products)
+        ]
+    )
+    return size
+
+
+def init_context(context):
+    global _context
+    _context = context
+
+
+def init_worker(context):
+    # Spawned workers need Django configured before they touch the models
+    if not apps.ready:
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ecommerce_project.settings")
+        django.setup()
+    init_context(context)
+
+
+def run_batches(task, total, seed, batch_size, workers, context):
+    jobs = list(batches(total, batch_size))
+    if workers <= 1:
+        init_context(context)
+        return sum(task(index, size, seed) for index, size in jobs)
+    # Children open their own connections; don't share the parent's sockets
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(context,),
+    ) as pool:
+        futures = [pool.submit(task, index, size, seed) for index, size in jobs]
+        return sum(future.result() for future in futures)
+
+
+def generate(
+    users=1000,
+    categories=50,
+    brands=20,
+    products=10000,
+    orders=50000,
+    reviews=20000,
+    seed=0,
+    days=365,
+    workers=1,
+    batch_size=2000,
+    prefix="gen",
+    password="password",
+    log=None,
+):
+    """
+    Create the synthetic dataset and return the number of rows of each kind.
+    ``prefix`` namespaces usernames, names and SKUs so several datasets (or
+    real data) can live side by side.
+    """
+    log = log or (lambda message: None)
+    if workers > 1 and connections["default"].vendor == "sqlite":
+        log("SQLite allows one writer at a time; generating in this process.")
+        workers = 1
+
+    user_ids, address_ids = create_users(users, prefix, password, seed, batch_size)
+    log(f"{len(user_ids)} users")
+    category_ids = create_categories(categories, prefix, seed)
+    brand_ids = create_brands(brands, prefix)
+    log(f"{len(category_ids)} categories, {len(brand_ids)} brands")
+    catalogue = create_products(products, prefix, category_ids, brand_ids, seed, batch_size)
+    variant_count = sum(len(variants) for _, variants in catalogue)
+    log(f"{len(catalogue)} products, {variant_count} variants")
+
+    # Product popularity: Zipfian over a seeded shuffle of the catalogue
+    catalogue = batch_rng(seed, "popularity", 0).sample(catalogue, len(catalogue))
+    context = {
+        "user_ids": user_ids,
+        "address_ids": address_ids,
+        "catalogue": catalogue,
+        "product_ids": [product_id for product_id, _ in catalogue],
+        "popularity": zipf_cum_weights(len(catalogue)),
+        "now": timezone.now(),
+        "days": days,
+    }
+    order_count = run_batches(create_orders, orders, seed, batch_size, workers, context)
+    log(f"{order_count} orders")
+    review_count = run_batches(create_reviews, reviews, seed, batch_size, workers, context)
+    log(f"{review_count} reviews")
+    return {
+        "users": len(user_ids),
+        "categories": len(category_ids),
+        "brands": len(brand_ids),
+        "products": len(catalogue),
+        "variants": variant_count,
+        "orders": order_count,
+        "reviews": review_count,
+    }
@@ -0,0 +1,286 @@
+"""
+Read-only serialization for the hot list endpoints.
+
+These functions build the same dicts as ProductSerializer, OrderSerializer
+and CartSerializer, but straight from ``.values()`` rows: every field is a
+precompiled (key, column, converter) accessor, so there is no per-field
+Field object, source lookup or model instantiation. Any change to those
+serializers must be mirrored here; the tests compare both outputs byte for
+byte.
+"""
+
+from collections import defaultdict
+from decimal import ROUND_HALF_EVEN, Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+from .fieldsets import expands, includes, nested
+from .models import CartItem, OrderItem, ProductImage, ProductVariant
+
+
+def decimal_string(decimal_places):
+    # Same as serializers.DecimalField with COERCE_DECIMAL_TO_STRING
+    exponent = Decimal(1).scaleb(-decimal_places)
+
+    def convert(value):
+        if not isinstance(value, Decimal):
+            value = Decimal(str(value).strip())
+        return format(value.quantize(exponent, rounding=ROUND_HALF_EVEN), "f")
+
+    return convert
+
+
+def datetime_string(value):
+    # Same as serializers.DateTimeField with the default ISO 8601 format
+    if settings.USE_TZ and timezone.is_aware(value):
+        value = timezone.localtime(value)
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+price = decimal_string(2)
+
+
+class RowBuilder:
+    """
+    Precompiled (key, column, converter) accessors that turn a ``.values()``
+    row into a dict. ``None`` values are passed through without calling the
+    converter.
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.columns = tuple(dict.fromkeys(column for _, column, _ in self.fields))
+        self._selected = {}
+
+    def __call__(self, row):
+        data = {}
+        for key, column, convert in self.fields:
+            value = row[column]
+            data[key] = value if convert is None or value is None else convert(value)
+        return data
+
+    def select(self, selection):
+        # Builder restricted to the keys picked by ?fields=
+        if selection is None or selection.fields is None:
+            return self
+        keys = frozenset(selection.fields)
+        if keys not in self._selected:
+            self._selected[keys] = RowBuilder(
+                field for field in self.fields if field[0] in keys
+            )
+        return self._selected[keys]
+
+
+def image_url_builder(request):
+    storage = ProductImage._meta.get_field("image_url").storage
+
+    def convert(name):
+        if not name:
+            return None
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+
+    return convert
+
+
+variant_fields = RowBuilder(
+    [
+        ("id", "id", None),
+        ("sku", "sku", None),
+        ("name", "name", None),
+        ("price", "price", price),
+        ("stock", "stock", None),
+    ]
+)
+
+nested_variant_fields = RowBuilder(
+    [
+        ("id", "product_variant_id", None),
+        ("sku", "product_variant__sku", None),
+        ("name", "product_variant__name", None),
+        ("price", "product_variant__price", price),
+        ("stock", "product_variant__stock", None),
+    ]
+)
+
+product_fields = RowBuilder(
+    [
+        ("id", "id", None),
+        ("name", "name", None),
+        ("slug", "slug", None),
+        ("description", "description", None),
+        ("category", "category_id", None),
+        ("category_name", "category__name", None),
+        ("brand", "brand_id", None),
+        ("brand_name", "brand__name", None),
+        ("base_price", "base_price", price),
+        ("stock", "stock", None),
+        ("is_active", "is_active", None),
+        ("created_at", "created_at", datetime_string),
+    ]
+)
+
+order_fields = RowBuilder(
+    [
+        ("id", "id", None),
+        ("user", "user_id", None),
+        ("user_name", "user__username", None),
+        ("address", "address_id", None),
+        ("total_amount", "total_amount", price),
+        ("discount", "discount", price),
+        ("grand_total", "grand_total", price),
+        ("payment_status", "payment_status", None),
+        ("order_status", "order_status", None),
+        ("created_at", "created_at", datetime_string),
+        ("approved_by", "approved_by_id", None),
+    ]
+)
+
+
+order_item_fields = RowBuilder(
+    [
+        ("id", "id", None),
+        ("product_variant", "product_variant_id", None),
+        ("product_name", "product_name", None),
+        ("image_url", "image_url", None),
+        ("quantity", "quantity", None),
+        ("price", "price", price),
+    ]
+)
+
+# The order line's snapshot of its variant
+order_line_variant_fields = RowBuilder(
+    [
+        ("id", "product_variant_id", None),
+        ("sku", "sku", None),
+        ("name", "variant_name", None),
+        ("price", "price", price),
+    ]
+)
+
+
+def product_values(queryset, selection=None):
+    return queryset.values(*dict.fromkeys(("id", *product_fields.select(selection).columns)))
+
+
+def serialize_products(rows, request=None, selection=None):
+    """
+    Render ``product_values()`` rows like ProductSerializer(many=True).
+    """
+    rows = list(rows)
+    product_ids = [row["id"] for row in rows]
+    build = product_fields.select(selection)
+
+    images = None
+    if includes(selection, "images"):
+        image_fields = nested(selection, "images")
+        image_url = image_url_builder(request)
+        images = defaultdict(list)
+        for product_id, image_id, name in (
+            ProductImage.objects.filter(product_id__in=product_ids)
+            .order_by("id")
+            .values_list("product_id", "id", "image_url")
+        ):
+            image = {"id": image_id, "image_url": image_url(name)}
+            if image_fields is not None and image_fields.fields is not None:
+                image = {key: value for key, value in image.items() if key in image_fields.fields}
+            images[product_id].append(image)
+
+    variants = None
+    if includes(selection, "variants"):
+        build_variant = variant_fields.select(nested(selection, "variants"))
+        variants = defaultdict(list)
+        for row in (
+            ProductVariant.objects.filter(product_id__in=product_ids)
+            .order_by("id")
+            .values("product_id", *build_variant.columns)
+        ):
+            variants[row["product_id"]].append(build_variant(row))
+
+    data = []
+    for row in rows:
+        product = build(row)
+        if images is not None:
+            product["images"] = images.get(row["id"], [])
+        if variants is not None:
+            product["variants"] = variants.get(row["id"], [])
+        data.append(product)
+    return data
+
+
+def order_values(queryset, selection=None):
+    return queryset.values(*dict.fromkeys(("id", *order_fields.select(selection).columns)))
+
+
+def serialize_orders(rows, selection=None):
+    """
+    Render ``order_values()`` rows like OrderSerializer(many=True).
+    """
+    rows = list(rows)
+    build = order_fields.select(selection)
+
+    items = None
+    if includes(selection, "items"):
+        item_selection = nested(selection, "items")
+        build_item = order_item_fields.select(item_selection)
+        embed_variant = includes(item_selection, "product_variant") and expands(
+            item_selection, "product_variant"
+        )
+        build_variant = order_line_variant_fields.select(
+            nested(item_selection, "product_variant")
+        )
+        columns = ["order_id", *build_item.columns]
+        if embed_variant:
+            columns.extend(build_variant.columns)
+
+        items = defaultdict(list)
+        for row in (
+            OrderItem.objects.filter(order_id__in=[row["id"] for row in rows])
+            .order_by("id")
+            .values(*dict.fromkeys(columns))
+        ):
+            item = build_item(row)
+            if embed_variant:
+                item["product_variant"] = build_variant(row)
+            items[row["order_id"]].append(item)
+
+    data = []
+    for row in rows:
+        order = build(row)
+        if items is not None:
+            order["items"] = items.get(row["id"], [])
+        data.append(order)
+    return data
+
+
+def serialize_cart(cart):
+    """
+    Render a Cart like CartSerializer.
+    """
+    item_rows = (
+        CartItem.objects.filter(cart=cart)
+        .order_by("id")
+        .values("id", "quantity", "unit_price", *nested_variant_fields.columns)
+    )
+    items = [
+        {
+            "id": row["id"],
+            "product_variant": nested_variant_fields(row),
+            "quantity": row["quantity"],
+            "subtotal": price(row["quantity"] * row["unit_price"]),
+        }
+        for row in item_rows
+    ]
+
+    return {
+        "id": cart.id,
+        "user": cart.user_id,
+        "items": items,
+        "item_count": cart.item_count,
+        "total": cart.subtotal,
+        "created_at": datetime_string(cart.created_at),
+    }
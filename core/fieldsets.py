@@ -0,0 +1,109 @@
+class FieldSelection:
+    """
+    Sparse fieldsets from the ``?fields=`` and ``?expand=`` query parameters.
+
+    ``fields`` lists the keys to render, with dotted paths for nested objects
+    (``fields=id,items.quantity``). ``expand`` lists the related objects to
+    embed (``expand=items.product_variant``); when it is given, related
+    objects that are not listed are rendered as their primary key. Without
+    either parameter the full representation is rendered.
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand
+
+    @classmethod
+    def from_request(cls, request):
+        if request is None:
+            return None
+        fields = request.query_params.get("fields")
+        expand = request.query_params.get("expand")
+        if fields is None and expand is None:
+            return None
+        return cls(
+            parse_fields(fields) if fields is not None else None,
+            set(split(expand)) if expand is not None else None,
+        )
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def expands(self, name):
+        return self.expand is None or name in self.expand
+
+    def nested(self, name):
+        fields = None
+        if self.fields is not None:
+            fields = self.fields.get(name) or None
+        expand = None
+        if self.expand is not None:
+            prefix = f"{name}."
+            expand = {path[len(prefix):] for path in self.expand if path.startswith(prefix)}
+        if fields is None and expand is None:
+            return None
+        return FieldSelection(fields, expand)
+
+
+def split(value):
+    return [part.strip() for part in value.split(",") if part.strip()]
+
+
+def parse_fields(value):
+    # "id,items.id,items.quantity" -> {"id": {}, "items": {"id": {}, "quantity": {}}}
+    tree = {}
+    for path in split(value):
+        node = tree
+        for part in path.split("."):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def includes(selection, name):
+    return selection is None or selection.includes(name)
+
+
+def expands(selection, name):
+    return selection is None or selection.expands(name)
+
+
+def nested(selection, name):
+    return None if selection is None else selection.nested(name)
+
+
+def only_fields(selection, field_map):
+    """
+    Model field paths for QuerySet.only() covering the selected top-level
+    fields. ``field_map`` maps serializer field names to model paths;
+    fields that are not in the map (nested relations) are skipped.
+    """
+    if selection is None or selection.fields is None:
+        return None
+    paths = ["id"]
+    for name in selection.fields:
+        if name in field_map:
+            paths.append(field_map[name])
+    return paths
+
+
+def select_fields(data, selection):
+    """
+    Apply a selection to an already rendered representation (e.g. a stored
+    JSON payload): drop unselected keys and collapse related objects that
+    are not expanded to their ``id``.
+    """
+    if selection is None:
+        return data
+    if isinstance(data, list):
+        return [select_fields(item, selection) for item in data]
+
+    result = {}
+    for name, value in data.items():
+        if not selection.includes(name):
+            continue
+        if isinstance(value, dict) and not selection.expands(name):
+            value = value.get("id")
+        elif isinstance(value, (dict, list)):
+            value = select_fields(value, selection.nested(name))
+        result[name] = value
+    return result
@@ -0,0 +1,160 @@
+"""
+Server-side carts for anonymous shoppers.
+
+A guest cart is a Cart without a user. The client holds a signed token for
+it, sent back in the X-Cart-Token header, and the cart expires after
+GUEST_CART_TTL without activity. On login, the guest cart is merged into
+the user's cart.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cart_totals import manual_totals, recompute_totals
+from .models import Cart, CartItem
+
+HEADER = "X-Cart-Token"
+SALT = "core.guest-cart"
+
+
+def get_ttl():
+    return getattr(settings, "GUEST_CART_TTL", timedelta(days=7))
+
+
+def issue_token(cart):
+    return signing.TimestampSigner(salt=SALT).sign(str(cart.pk))
+
+
+def guest_cart_id(token):
+    # Cart id from a valid, unexpired token, or None
+    if not token:
+        return None
+    try:
+        value = signing.TimestampSigner(salt=SALT).unsign(
+            token, max_age=get_ttl()
+        )
+    except signing.BadSignature:
+        return None
+    return int(value)
+
+
+def guest_carts():
+    return Cart.objects.filter(user__isnull=True, expires_at__gt=timezone.now())
+
+
+def get_guest_cart(token):
+    cart_id = guest_cart_id(token)
+    if cart_id is None:
+        return None
+    return guest_carts().filter(pk=cart_id).first()
+
+
+def get_request_cart(request, create=False):
+    """
+    The user's cart, or the guest cart named by the request's token. With
+    ``create`` a missing cart is created. Guest carts fetched with ``create``
+    are returned with a fresh ``cart.token`` for the view to hand to the
+    client, since the token would otherwise expire before the cart does.
+    """
+    if request.user.is_authenticated:
+        if create:
+            return Cart.objects.get_or_create(user=request.user)[0]
+        return Cart.objects.filter(user=request.user).first()
+
+    cart = get_guest_cart(request.headers.get(HEADER))
+    if cart is not None and create:
+        # Sliding expiry while the shopper is active
+        cart.expires_at = timezone.now() + get_ttl()
+        Cart.objects.filter(pk=cart.pk).update(expires_at=cart.expires_at)
+        cart.token = issue_token(cart)
+    elif cart is None and create:
+        cart = Cart.objects.create(expires_at=timezone.now() + get_ttl())
+        cart.token = issue_token(cart)
+    return cart
+
+
+def attach_token(response, cart):
+    token = getattr(cart, "token", None)
+    if token:
+        response[HEADER] = token
+    return response
+
+
+MERGE_SQL = {
+    "postgresql": (
+        "INSERT INTO {items} (cart_id, product_variant_id, quantity, unit_price) "
+        "SELECT %s, product_variant_id, quantity, unit_price FROM {items} WHERE cart_id = %s "
+        "ON CONFLICT (cart_id, product_variant_id) "
+        "DO UPDATE SET quantity = {items}.quantity + EXCLUDED.quantity"
+    ),
+    "sqlite": (
+        "INSERT INTO {items} (cart_id, product_variant_id, quantity, unit_price) "
+        "SELECT %s, product_variant_id, quantity, unit_price FROM {items} WHERE cart_id = %s "
+        "ON CONFLICT (cart_id, product_variant_id) "
+        "DO UPDATE SET quantity = {items}.quantity + excluded.quantity"
+    ),
+    "mysql": (
+        "INSERT INTO {items} (cart_id, product_variant_id, quantity, unit_price) "
+        "SELECT %s, guest.product_variant_id, guest.quantity, guest.unit_price "
+        "FROM {items} AS guest WHERE guest.cart_id = %s "
+        "ON DUPLICATE KEY UPDATE quantity = {items}.quantity + guest.quantity"
+    ),
+}
+
+
+def merge_items(cart, guest):
+    # Portable upsert for other backends: one UPDATE per variant in both carts
+    guest_items = list(CartItem.objects.select_for_update().filter(cart=guest))
+    existing = {
+        item.product_variant_id: item
+        for item in CartItem.objects.select_for_update().filter(
+            cart=cart,
+            product_variant_id__in=[item.product_variant_id for item in guest_items],
+        )
+    }
+    for item in guest_items:
+        if item.product_variant_id in existing:
+            CartItem.objects.filter(pk=existing[item.product_variant_id].pk).update(
+                quantity=F("quantity") + item.quantity
+            )
+        else:
+            CartItem.objects.filter(pk=item.pk).update(cart=cart)
+
+
+def merge_guest_cart(guest, user):
+    """
+    Move the guest cart's items into the user's cart. When the user already
+    has one, all items are upserted with one INSERT ... SELECT that adds up
+    the quantities of variants present in both carts; backends without an
+    upsert statement here fall back to ``merge_items``.
+    """
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update().filter(user=user).first()
+        if cart is None:
+            # Adopt the guest cart as the user's cart
+            Cart.objects.filter(pk=guest.pk).update(
+                user=user, expires_at=None, updated_at=timezone.now()
+            )
+            return guest
+
+        sql = MERGE_SQL.get(connection.vendor)
+        if sql is None:
+            merge_items(cart, guest)
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.format(
+                        items=connection.ops.quote_name(CartItem._meta.db_table)
+                    ),
+                    [cart.pk, guest.pk],
+                )
+        # The user's cart is recounted once below, not once per guest item
+        with manual_totals():
+            guest.delete()
+        recompute_totals([cart.pk])
+    return cart
@@ -0,0 +1,46 @@
+"""
+Password hashers whose cost comes from the PASSWORD_HASHER_PROFILE setting,
+so the parameters picked by ``manage.py tune_password_hasher`` for this host
+can be applied without code changes. Hashes made with other parameters are
+upgraded on the next successful login.
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, ScryptPasswordHasher
+
+
+def profile(algorithm):
+    return getattr(settings, "PASSWORD_HASHER_PROFILE", {}).get(algorithm, {})
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return profile("scrypt").get("work_factor", ScryptPasswordHasher.work_factor)
+
+    @property
+    def block_size(self):
+        return profile("scrypt").get("block_size", ScryptPasswordHasher.block_size)
+
+    @property
+    def parallelism(self):
+        return profile("scrypt").get("parallelism", ScryptPasswordHasher.parallelism)
+
+    @property
+    def maxmem(self):
+        # hashlib.scrypt refuses more than 32 MiB unless told otherwise
+        return max(64 * 1024 * 1024, 256 * self.work_factor * self.block_size)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return profile("argon2").get("time_cost", Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return profile("argon2").get("memory_cost", Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return profile("argon2").get("parallelism", Argon2PasswordHasher.parallelism)
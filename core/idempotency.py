@@ -0,0 +1,166 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .guest_carts import HEADER as GUEST_CART_HEADER, guest_cart_id
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADERS = (GUEST_CART_HEADER, "Location")
+
+
+def get_ttl():
+    return getattr(settings, "IDEMPOTENCY_KEY_TTL", timedelta(hours=24))
+
+
+def get_lock_timeout():
+    return getattr(settings, "IDEMPOTENCY_LOCK_TIMEOUT", timedelta(seconds=30))
+
+
+def request_scope(request):
+    # Keys are per user, or per guest cart for anonymous shoppers
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    cart_id = guest_cart_id(request.headers.get(GUEST_CART_HEADER))
+    if cart_id is not None:
+        return f"cart:{cart_id}"
+    return None
+
+
+def request_fingerprint(request):
+    payload = json.dumps(request.data, sort_keys=True, default=str)
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.path}\n".encode())
+    digest.update(payload.encode())
+    return digest.hexdigest()
+
+
+def idempotent(view_method):
+    """
+    Replay the recorded response when a request is retried with the same
+    Idempotency-Key header instead of running the view again.
+
+    The key row doubles as a lock: a duplicate that arrives while the first
+    request is still running gets 409 and should retry after a moment. The
+    response is recorded in the same transaction as the view's writes, so a
+    crash cannot leave the side effects committed without the record.
+    """
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        scope = request_scope(request)
+        if not key or scope is None:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response(
+                {"error": f"{HEADER} must be at most 255 characters"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        request_hash = request_fingerprint(request)
+        record, replay = acquire(scope, key, request_hash)
+        if replay is not None:
+            return replay
+
+        try:
+            with transaction.atomic():
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code < 500:
+                    record.status_code = response.status_code
+                    record.response_body = json.loads(
+                        JSONRenderer().render(response.data) or "null"
+                    )
+                    record.response_headers = {
+                        name: response[name]
+                        for name in REPLAYED_HEADERS
+                        if response.has_header(name)
+                    }
+                    record.locked_at = None
+                    record.save(
+                        update_fields=[
+                            "status_code",
+                            "response_body",
+                            "response_headers",
+                            "locked_at",
+                        ]
+                    )
+        except Exception:
+            record.delete()
+            raise
+
+        if response.status_code >= 500:
+            # Let the client retry server errors
+            record.delete()
+        return response
+
+    return wrapper
+
+
+def acquire(scope, key, request_hash):
+    """
+    Return (record, None) when the caller should execute the request, or
+    (None, response) when it must answer with ``response`` instead.
+    """
+    now = timezone.now()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    scope=scope,
+                    key=key,
+                    request_hash=request_hash,
+                    locked_at=now,
+                    expires_at=now + get_ttl(),
+                )
+            return record, None
+        except IntegrityError:
+            pass
+
+        record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+        if record is not None and record.expires_at > now:
+            break
+        # The previous key expired or was just released, claim it again
+        IdempotencyKey.objects.filter(scope=scope, key=key, expires_at__lte=now).delete()
+    else:
+        return None, conflict()
+
+    if record.request_hash != request_hash:
+        return None, Response(
+            {"error": f"{HEADER} was already used with a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+
+    if record.status_code is None:
+        stale = record.locked_at is None or record.locked_at <= now - get_lock_timeout()
+        claimed = stale and IdempotencyKey.objects.filter(
+            pk=record.pk, status_code__isnull=True, locked_at=record.locked_at
+        ).update(locked_at=now)
+        if claimed:
+            record.locked_at = now
+            return record, None
+        return None, conflict()
+
+    response = Response(record.response_body, status=record.status_code)
+    for name, value in record.response_headers.items():
+        response[name] = value
+    response["Idempotent-Replayed"] = "true"
+    return None, response
+
+
+def conflict():
+    response = Response(
+        {"error": "A request with this Idempotency-Key is in progress"},
+        status=status.HTTP_409_CONFLICT,
+    )
+    response["Retry-After"] = "1"
+    return response
+
@@ -0,0 +1,224 @@
+"""
+Identity map: at most one loaded instance per (model, pk) within a unit of
+work (a request, or a /batch/ request and all of its sub-requests), so code
+that needs the same rows shares them instead of loading them again.
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, models
+from django.db.models import Q
+
+_current = ContextVar("identity_map", default=None)
+
+
+class IdentityMap:
+    """
+    Instances keyed by (model, field, value) for the primary key and for
+    the unique ``identity_fields`` declared on the model's manager, plus a
+    queue of primary keys waiting to be loaded together (dataloader style).
+    """
+
+    def __init__(self):
+        self._objects = {}
+        self._pending = {}
+        # Batch sub-requests may share one map across threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def label(model):
+        return model._meta.concrete_model._meta.label_lower
+
+    def lookup(self, model, field, value):
+        with self._lock:
+            return self._objects.get((self.label(model), field, value))
+
+    def get(self, model, pk):
+        return self.lookup(model, "pk", pk)
+
+    def add(self, instance):
+        if instance is None or instance.pk is None:
+            return instance
+        model = type(instance)
+        label = self.label(model)
+        with self._lock:
+            self._objects[label, "pk", instance.pk] = instance
+            for field in identity_fields(model):
+                value = getattr(instance, model._meta.get_field(field).attname)
+                self._objects[label, field, value] = instance
+            self._pending.get(label, set()).discard(instance.pk)
+        return instance
+
+    def discard(self, model, pk):
+        label = self.label(model)
+        with self._lock:
+            instance = self._objects.pop((label, "pk", pk), None)
+            if instance is not None:
+                for field in identity_fields(model):
+                    value = getattr(instance, model._meta.get_field(field).attname)
+                    self._objects.pop((label, field, value), None)
+
+    def defer(self, model, pks):
+        # Queue primary keys to be fetched with the next miss on ``model``
+        label = self.label(model)
+        with self._lock:
+            missing = {pk for pk in pks if (label, "pk", pk) not in self._objects}
+            self._pending.setdefault(label, set()).update(missing)
+
+    def take_pending(self, model):
+        with self._lock:
+            return self._pending.pop(self.label(model), set())
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
+            self._pending.clear()
+
+    def __len__(self):
+        return len(self._objects)
+
+
+def current_identity_map():
+    return _current.get()
+
+
+@contextmanager
+def identity_map():
+    """
+    Activate a fresh identity map for the enclosed block; code run through
+    contextvars.copy_context() (e.g. on a thread pool) shares it.
+    """
+    token = _current.set(IdentityMap())
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+def get_cached(model, pk, load):
+    # ``load()`` the instance unless the current identity map already has it
+    identity = _current.get()
+    if identity is None:
+        return load()
+    instance = identity.get(model, pk)
+    if instance is None:
+        instance = identity.add(load())
+    return instance
+
+
+def identity_fields(model):
+    return getattr(model._default_manager, "identity_fields", ())
+
+
+def prime(instances, field_name):
+    """
+    Queue the targets of the ``field_name`` foreign key on ``instances``; the
+    first access to any of them loads them all with one query.
+    """
+    identity = _current.get()
+    instances = list(instances)
+    if identity is None or not instances:
+        return
+    field = instances[0]._meta.get_field(field_name)
+    identity.defer(
+        field.related_model,
+        {getattr(instance, field.attname) for instance in instances} - {None},
+    )
+
+
+def evict(model, pks):
+    identity = _current.get()
+    if identity is not None:
+        for pk in pks:
+            identity.discard(model, pk)
+
+
+class IdentityMapQuerySet(models.QuerySet):
+    """
+    Serve get() lookups by primary key or by one of the manager's unique
+    ``identity_fields`` from the current identity map. Only unfiltered
+    querysets qualify; anything else goes to the database as usual.
+    """
+
+    def get(self, *args, **kwargs):
+        identity = _current.get()
+        lookup = self._identity_lookup(args, kwargs) if identity is not None else None
+        if lookup is None:
+            return super().get(*args, **kwargs)
+
+        field, value = lookup
+        instance = identity.lookup(self.model, field, value)
+        if instance is not None:
+            return instance
+        if field == "pk":
+            pks = identity.take_pending(self.model) | {value}
+            for loaded in self.filter(pk__in=pks):
+                identity.add(loaded)
+            instance = identity.lookup(self.model, field, value)
+            if instance is None:
+                raise self.model.DoesNotExist(
+                    f"{self.model._meta.object_name} matching query does not exist."
+                )
+            return instance
+        return identity.add(super().get(*args, **kwargs))
+
+    def _identity_lookup(self, args, kwargs):
+        query = self.query
+        if (
+            query.where
+            or query.select_related
+            or query.deferred_loading != (frozenset(), True)
+            or query.annotations
+            or query.select_for_update
+            or query.is_sliced
+            or self._fields is not None
+            or self._prefetch_related_lookups
+            or self._db not in (None, DEFAULT_DB_ALIAS)
+        ):
+            return None
+
+        if args:
+            if kwargs or len(args) != 1 or not isinstance(args[0], Q):
+                return None
+            condition = args[0]
+            if condition.negated or len(condition.children) != 1:
+                return None
+            if not isinstance(condition.children[0], tuple):
+                return None
+            name, value = condition.children[0]
+        elif len(kwargs) == 1:
+            (name, value), = kwargs.items()
+        else:
+            return None
+
+        name = name.removesuffix("__exact")
+        opts = self.model._meta
+        if name in ("pk", opts.pk.name, opts.pk.attname):
+            field = "pk"
+        else:
+            field = next(
+                (
+                    candidate
+                    for candidate in identity_fields(self.model)
+                    if name
+                    in (candidate, f"{candidate}_id", f"{candidate}__id", f"{candidate}__pk")
+                ),
+                None,
+            )
+            if field is None:
+                return None
+        if isinstance(value, models.Model):
+            value = value.pk
+        try:
+            return field, opts.pk.to_python(value) if field == "pk" else value
+        except ValidationError:
+            return None
+
+
+class IdentityMapManager(models.Manager.from_queryset(IdentityMapQuerySet)):
+    def __init__(self, identity_fields=()):
+        super().__init__()
+        self.identity_fields = tuple(identity_fields)
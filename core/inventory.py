@@ -0,0 +1,92 @@
+"""
+Stock changes for ProductVariant, with Product.stock kept as the sum of its
+variants' stock.
+"""
+
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .changes import record_changes
+from .identity import evict
+from .models import Product, ProductVariant
+from .sku_index import index as sku_index
+
+
+class InsufficientStock(Exception):
+    def __init__(self, variant_ids):
+        self.variant_ids = variant_ids
+        super().__init__(f"Insufficient stock for variants {variant_ids}")
+
+
+def reserve_stock(quantities):
+    """
+    Take ``{variant_id: quantity}`` out of stock. Each variant is decremented
+    with a conditional UPDATE ... WHERE stock >= quantity, so stock can never
+    go negative; if any variant is short nothing is reserved and
+    InsufficientStock is raised.
+    """
+    now = timezone.now()
+    short = []
+    with transaction.atomic():
+        for variant_id, quantity in sorted(quantities.items()):
+            updated = ProductVariant.objects.filter(
+                pk=variant_id, stock__gte=quantity
+            ).update(stock=F("stock") - quantity, updated_at=now)
+            if not updated:
+                short.append(variant_id)
+        if short:
+            raise InsufficientStock(short)
+        record_changes(ProductVariant, quantities)
+        sync_product_stock(variant_ids=quantities)
+    evict(ProductVariant, quantities)
+    sku_index.evict(quantities)
+
+
+def release_stock(quantities):
+    # Put ``{variant_id: quantity}`` back in one UPDATE across all variants
+    if not quantities:
+        return
+    with transaction.atomic():
+        ProductVariant.objects.filter(id__in=quantities).update(
+            updated_at=timezone.now(),
+            stock=F("stock")
+            + Case(
+                *[
+                    When(id=variant_id, then=Value(quantity))
+                    for variant_id, quantity in quantities.items()
+                ],
+                default=Value(0),
+            ),
+        )
+        record_changes(ProductVariant, quantities)
+        sync_product_stock(variant_ids=quantities)
+    evict(ProductVariant, quantities)
+    sku_index.evict(quantities)
+
+
+def sync_product_stock(product_ids=None, variant_ids=None):
+    """
+    Recompute Product.stock as the sum of its variants' stock for the given
+    products (or the products owning ``variant_ids``), or for every product.
+    The new totals are logged to the change feed in the same transaction.
+    """
+    products = Product.objects.all()
+    if variant_ids is not None:
+        products = products.filter(variants__id__in=variant_ids).distinct()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    totals = (
+        ProductVariant.objects.filter(product=OuterRef("pk"))
+        .order_by()
+        .values("product")
+        .annotate(total=Sum("stock"))
+        .values("total")
+    )
+    with transaction.atomic():
+        updated = Product.objects.filter(pk__in=products.values("pk")).update(
+            stock=Coalesce(Subquery(totals), Value(0)), updated_at=timezone.now()
+        )
+        record_changes(Product, products.values("pk"))
+    return updated
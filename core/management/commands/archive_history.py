@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.archive import archive_notifications, archive_orders
+
+
+class Command(BaseCommand):
+    help = "Move old read notifications and delivered orders into the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--notification-days",
+            type=int,
+            default=getattr(settings, "ARCHIVE_NOTIFICATIONS_AFTER_DAYS", 90),
+            help="Archive read notifications older than this many days.",
+        )
+        parser.add_argument(
+            "--order-days",
+            type=int,
+            default=getattr(settings, "ARCHIVE_ORDERS_AFTER_DAYS", 365),
+            help="Archive orders delivered more than this many days ago.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        notifications = archive_notifications(
+            now - timedelta(days=options["notification_days"]), options["batch_size"]
+        )
+        orders = archive_orders(
+            now - timedelta(days=options["order_days"]), options["batch_size"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Archived {notifications} notifications and {orders} orders.")
+        )
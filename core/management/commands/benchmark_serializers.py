@@ -0,0 +1,111 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.fast_serializers import (
+    order_values, product_values, serialize_orders, serialize_products
+)
+from core.models import (
+    Address, Brand, Category, Order, OrderItem, Product, ProductVariant
+)
+from core.renderers import FastJSONRenderer
+from core.serializers import OrderSerializer, ProductSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the DRF serializers with the fast serialization path on "
+        "synthetic products and orders. The data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.create_data(options["items"])
+            request = Request(APIRequestFactory().get("/products/"))
+            products = Product.objects.filter(name__startswith="bench-").order_by("id")
+            orders = Order.objects.filter(user__username="bench-user").order_by("id")
+
+            cases = [
+                (
+                    "products",
+                    lambda: JSONRenderer().render(
+                        ProductSerializer(products, many=True, context={"request": request}).data
+                    ),
+                    lambda: FastJSONRenderer().render(
+                        serialize_products(product_values(products), request)
+                    ),
+                ),
+                (
+                    "orders",
+                    lambda: JSONRenderer().render(OrderSerializer(orders, many=True).data),
+                    lambda: FastJSONRenderer().render(serialize_orders(order_values(orders))),
+                ),
+            ]
+            for name, baseline, fast in cases:
+                baseline_time = self.best_of(baseline, options["repeat"])
+                fast_time = self.best_of(fast, options["repeat"])
+                self.stdout.write(
+                    f"{name} x{options['items']}: serializer {baseline_time * 1000:.1f} ms, "
+                    f"fast path {fast_time * 1000:.1f} ms, "
+                    f"speedup {baseline_time / fast_time:.1f}x"
+                )
+            transaction.set_rollback(True)
+
+    def best_of(self, func, repeat):
+        timings = []
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def create_data(self, count):
+        user = User.objects.create(username="bench-user")
+        category = Category.objects.create(name="bench-category", slug="bench-category")
+        brand = Brand.objects.create(name="bench-brand")
+        address = Address.objects.create(
+            user=user, name="Home", street="1 Main St", city="Pune",
+            state="MH", country="India", zipcode="411001",
+        )
+
+        products = Product.objects.bulk_create(
+            Product(
+                name=f"bench-{index}", slug=f"bench-{index}", category=category,
+                brand=brand, base_price=Decimal("99.99"), stock=10,
+            )
+            for index in range(count)
+        )
+        variants = ProductVariant.objects.bulk_create(
+            ProductVariant(
+                product=product, sku=f"bench-{product.pk}-{size}", name=size,
+                price=Decimal("99.99"), stock=10,
+            )
+            for product in products
+            for size in ("S", "M")
+        )
+
+        orders = Order.objects.bulk_create(
+            Order(
+                user=user, address=address, total_amount=Decimal("199.98"),
+                grand_total=Decimal("199.98"),
+            )
+            for _ in range(count)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(
+                order=order, product_variant=variants[(index * 2 + line) % len(variants)],
+                quantity=1, price=Decimal("99.99"),
+            )
+            for index, order in enumerate(orders)
+            for line in range(2)
+        )
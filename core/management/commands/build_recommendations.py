@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import recommendations
+
+
+class Command(BaseCommand):
+    help = "Rebuild the frequently-bought-together recommendations from the order history."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top-k", type=int, default=getattr(settings, "RECOMMENDATIONS_TOP_K", 20)
+        )
+        parser.add_argument("--workers", type=int, default=1)
+
+    def handle(self, *args, **options):
+        try:
+            import numpy  # noqa: F401
+            import scipy  # noqa: F401
+        except ImportError:
+            raise CommandError("build_recommendations requires numpy and scipy.")
+
+        count = recommendations.build(top_k=options["top_k"], workers=options["workers"])
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} recommendations."))
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Forecast days until stockout per SKU and notify admins about low stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threshold", type=int, default=getattr(settings, "LOW_STOCK_THRESHOLD", 10)
+        )
+        parser.add_argument(
+            "--lead-days", type=int, default=getattr(settings, "STOCKOUT_LEAD_DAYS", 7)
+        )
+        parser.add_argument(
+            "--windows",
+            default="7,28",
+            help="Comma separated rolling windows in days.",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Report without sending notifications."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            from core import stock_forecast
+        except ImportError:
+            raise CommandError("forecast_stock requires numpy.")
+
+        try:
+            windows = [int(window) for window in options["windows"].split(",")]
+        except ValueError:
+            raise CommandError("--windows must be a list of integers.")
+        if not windows or min(windows) < 1:
+            raise CommandError("--windows must be positive.")
+
+        low_stock = stock_forecast.forecast(
+            windows=windows,
+            threshold=options["threshold"],
+            lead_days=options["lead_days"],
+        )
+        for row in low_stock:
+            days = row["days_until_stockout"]
+            self.stdout.write(
+                f"{row['sku']}: stock {row['stock']}, {row['velocity']}/day, "
+                f"{'no recent sales' if days is None else f'{days} days left'}"
+            )
+
+        if options["dry_run"]:
+            return
+        sent = stock_forecast.notify_admins(low_stock)
+        self.stdout.write(
+            self.style.SUCCESS(f"{len(low_stock)} low-stock SKUs, {sent} notifications sent.")
+        )
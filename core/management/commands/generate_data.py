@@ -0,0 +1,76 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.datagen import generate
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a synthetic, seeded dataset of users, categories, "
+        "brands, products, orders and reviews for performance tests and profiling."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--categories", type=int, default=50)
+        parser.add_argument("--brands", type=int, default=20)
+        parser.add_argument("--products", type=int, default=10000)
+        parser.add_argument("--orders", type=int, default=50000)
+        parser.add_argument("--reviews", type=int, default=20000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=365,
+            help="Spread order dates over this many days before now.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processes generating orders and reviews (ignored on SQLite).",
+        )
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--prefix",
+            default="gen",
+            help="Prefix for usernames, names and SKUs; must not be in use yet.",
+        )
+        parser.add_argument(
+            "--password", default="password", help="Password of every generated user."
+        )
+
+    def handle(self, *args, **options):
+        counts = [options[name] for name in ("users", "categories", "brands", "products")]
+        if min(counts) < 1 or min(options["orders"], options["reviews"]) < 0:
+            raise CommandError(
+                "--users, --categories, --brands and --products must be at least 1."
+            )
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+        if options["days"] < 0:
+            raise CommandError("--days must not be negative.")
+
+        started = time.perf_counter()
+        created = generate(
+            users=options["users"],
+            categories=options["categories"],
+            brands=options["brands"],
+            products=options["products"],
+            orders=options["orders"],
+            reviews=options["reviews"],
+            seed=options["seed"],
+            days=options["days"],
+            workers=options["workers"],
+            batch_size=options["batch_size"],
+            prefix=options["prefix"],
+            password=options["password"],
+            log=self.stdout.write,
+        )
+        summary = ", ".join(f"{count} {name}" for name, count in created.items())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {summary} in {time.perf_counter() - started:.1f}s."
+            )
+        )
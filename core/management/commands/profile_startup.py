@@ -0,0 +1,110 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter: boot Django and serve one request through WSGI
+PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+os.environ["DJANGO_SETTINGS_MODULE"] = sys.argv[1]
+import django
+django.setup()
+setup = time.perf_counter()
+from wsgiref.util import setup_testing_defaults
+from django.core.wsgi import get_wsgi_application
+environ = {"REQUEST_METHOD": "GET", "PATH_INFO": sys.argv[2]}
+setup_testing_defaults(environ)
+statuses = []
+response = get_wsgi_application()(environ, lambda status, headers: statuses.append(status))
+b"".join(response)
+done = time.perf_counter()
+print(json.dumps({"setup": setup - start, "request": done - setup, "status": statuses[0]}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure worker boot: time from interpreter start to the first response, "
+        "and per-module import cost from python -X importtime."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="/categories/", help="URL of the first request.")
+        parser.add_argument("--repeat", type=int, default=5, help="Boots to time.")
+        parser.add_argument("--top", type=int, default=20, help="Slowest imports to list.")
+        parser.add_argument(
+            "--budget-ms",
+            type=float,
+            default=getattr(settings, "STARTUP_BUDGET_MS", None),
+            help="Fail when the median boot-to-first-request time exceeds this.",
+        )
+
+    def probe(self, path, importtime=False):
+        command = [sys.executable]
+        if importtime:
+            command += ["-X", "importtime"]
+        command += ["-c", PROBE, os.environ["DJANGO_SETTINGS_MODULE"], path]
+        started = time.perf_counter()
+        result = subprocess.run(
+            command, capture_output=True, text=True, cwd=settings.BASE_DIR
+        )
+        elapsed = time.perf_counter() - started
+        if result.returncode:
+            raise CommandError(f"Startup probe failed:\n{result.stderr[-2000:]}")
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        timings["total"] = elapsed
+        return timings, result.stderr
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1.")
+        runs = [self.probe(options["path"])[0] for _ in range(options["repeat"])]
+        totals = sorted(run["total"] * 1000 for run in runs)
+        median = statistics.median(totals)
+        self.stdout.write(
+            f"Boot to first request (GET {options['path']} -> {runs[0]['status']}): "
+            f"median {median:.0f} ms, best {totals[0]:.0f} ms over {len(runs)} runs"
+        )
+        self.stdout.write(
+            f"  django.setup(): {statistics.median(run['setup'] for run in runs) * 1000:.0f} ms"
+        )
+        self.stdout.write(
+            f"  URLconf, views and first response: "
+            f"{statistics.median(run['request'] for run in runs) * 1000:.0f} ms"
+        )
+
+        _, report = self.probe(options["path"], importtime=True)
+        imports = parse_importtime(report)
+        self.stdout.write("\nSlowest imports (cumulative ms, self ms):")
+        for name, own, cumulative in sorted(imports, key=lambda row: -row[2])[: options["top"]]:
+            self.stdout.write(f"  {cumulative / 1000:8.1f} {own / 1000:8.1f}  {name}")
+
+        project = ("core", "ecommerce_project")
+        self.stdout.write("\nProject modules (self ms):")
+        for name, own, _ in sorted(imports, key=lambda row: -row[1]):
+            if name.split(".")[0] in project:
+                self.stdout.write(f"  {own / 1000:8.1f}  {name}")
+
+        budget = options["budget_ms"]
+        if budget is not None and median > budget:
+            raise CommandError(
+                f"Boot to first request took {median:.0f} ms, over the {budget:.0f} ms budget."
+            )
+
+
+def parse_importtime(report):
+    # (module, self us, cumulative us) from -X importtime's stderr
+    imports = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        if own.strip().isdigit():
+            imports.append((name.strip(), int(own), int(cumulative)))
+    return imports
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import ChangeEvent
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete change events older than CHANGE_EVENT_RETENTION_DAYS in batches. "
+        "Consumers further behind than that must resync from the catalogue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=getattr(settings, "CHANGE_EVENT_RETENTION_DAYS", 30),
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        deleted = 0
+        while True:
+            ids = list(
+                ChangeEvent.objects.filter(created_at__lt=cutoff).values_list(
+                    "id", flat=True
+                )[: options["batch_size"]]
+            )
+            if not ids:
+                break
+            ChangeEvent.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} change events."))
@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.models import ArchivedOrder, Order
+from core.rollups import rebuild_range
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily sales rollups from the order history, archived orders "
+        "included, in parallel chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First day to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--end", help="Last day to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--chunk-days", type=int, default=30)
+        parser.add_argument("--workers", type=int, default=4)
+
+    def handle(self, *args, **options):
+        start, end = self.get_range(options)
+        if start is None:
+            self.stdout.write("No orders to roll up.")
+            return
+
+        chunk = timedelta(days=max(options["chunk_days"], 1))
+        chunks = []
+        day = start
+        while day <= end:
+            chunks.append((day, min(day + chunk, end + timedelta(days=1))))
+            day += chunk
+
+        buckets = 0
+        if options["workers"] <= 1:
+            for chunk_start, chunk_end in chunks:
+                count = rebuild_range(chunk_start, chunk_end)
+                buckets += count
+                self.stdout.write(f"{chunk_start}: {count} buckets")
+            self.report(buckets, start, end, chunks)
+            return
+
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            futures = {
+                pool.submit(self.rebuild_chunk, chunk_start, chunk_end): chunk_start
+                for chunk_start, chunk_end in chunks
+            }
+            for future in as_completed(futures):
+                count = future.result()
+                buckets += count
+                self.stdout.write(f"{futures[future]}: {count} buckets")
+        self.report(buckets, start, end, chunks)
+
+    def report(self, buckets, start, end, chunks):
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {buckets} buckets from {start} to {end} in {len(chunks)} chunks."
+            )
+        )
+
+    def get_range(self, options):
+        try:
+            start = parse_date(options["start"]) if options["start"] else None
+            end = parse_date(options["end"]) if options["end"] else None
+        except ValueError:
+            raise CommandError("Dates must be valid and in YYYY-MM-DD format.")
+        if (options["start"] and start is None) or (options["end"] and end is None):
+            raise CommandError("Dates must be in YYYY-MM-DD format.")
+
+        if start is None or end is None:
+            bounds = [
+                model.objects.aggregate(first=Min("created_at"), last=Max("created_at"))
+                for model in (Order, ArchivedOrder)
+            ]
+            firsts = [bound["first"] for bound in bounds if bound["first"] is not None]
+            if not firsts:
+                return None, None
+            start = start or timezone.localdate(min(firsts))
+            end = end or timezone.localdate(max(bound["last"] for bound in bounds if bound["last"]))
+        if start > end:
+            raise CommandError("--start must not be after --end.")
+        return start, end
+
+    def rebuild_chunk(self, start, end):
+        # Each worker thread uses its own database connection
+        try:
+            return rebuild_range(start, end)
+        finally:
+            connections.close_all()
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import statistics
+import time
+from pprint import pformat
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def median_ms(function, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark password hasher costs on this host and print the "
+        "PASSWORD_HASHER_PROFILE entry that is closest to --target-ms."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--algorithm", choices=["scrypt", "argon2"], default="scrypt")
+        parser.add_argument("--target-ms", type=float, default=250)
+        parser.add_argument("--rounds", type=int, default=3)
+
+    def handle(self, *args, **options):
+        target = options["target_ms"]
+        if options["algorithm"] == "scrypt":
+            params = self.tune_scrypt(target, options["rounds"])
+        else:
+            params = self.tune_argon2(target, options["rounds"])
+        self.stdout.write("\nPASSWORD_HASHER_PROFILE entry:")
+        self.stdout.write(pformat({options["algorithm"]: params}))
+
+    def tune_scrypt(self, target, rounds):
+        # Double the work factor (memory and time) until the target is passed
+        block_size, parallelism = 8, 1
+        best = None
+        for exponent in range(12, 21):
+            work_factor = 2**exponent
+            elapsed = median_ms(
+                lambda: hashlib.scrypt(
+                    b"password",
+                    salt=b"0123456789abcdef",
+                    n=work_factor,
+                    r=block_size,
+                    p=parallelism,
+                    maxmem=256 * work_factor * block_size,
+                    dklen=64,
+                ),
+                rounds,
+            )
+            self.stdout.write(f"scrypt n=2**{exponent}: {elapsed:.1f} ms")
+            if best is not None and elapsed > target:
+                break
+            best = {
+                "work_factor": work_factor,
+                "block_size": block_size,
+                "parallelism": parallelism,
+            }
+        return best
+
+    def tune_argon2(self, target, rounds):
+        try:
+            from argon2.low_level import Type, hash_secret_raw
+        except ImportError:
+            raise CommandError("Tuning argon2 requires argon2-cffi.")
+
+        # Fixed 64 MiB memory cost; raise the number of passes
+        memory_cost, parallelism = 65536, min(os.cpu_count() or 1, 4)
+        best = None
+        for time_cost in range(1, 11):
+            elapsed = median_ms(
+                lambda: hash_secret_raw(
+                    b"password",
+                    b"0123456789abcdef",
+                    time_cost=time_cost,
+                    memory_cost=memory_cost,
+                    parallelism=parallelism,
+                    hash_len=32,
+                    type=Type.ID,
+                ),
+                rounds,
+            )
+            self.stdout.write(f"argon2 t={time_cost}: {elapsed:.1f} ms")
+            if best is not None and elapsed > target:
+                break
+            best = {
+                "time_cost": time_cost,
+                "memory_cost": memory_cost,
+                "parallelism": parallelism,
+            }
+        return best
@@ -0,0 +1,69 @@
+import threading
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from .identity import identity_map
+from .metrics import metrics
+
+
+class LoadSheddingMiddleware:
+    """
+    Cap the number of requests handled concurrently by this process. A
+    request that cannot get a slot within LOAD_SHED_QUEUE_TIMEOUT seconds is
+    rejected with 503 and Retry-After instead of queueing behind the others.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.max_concurrency = getattr(settings, "LOAD_SHED_MAX_CONCURRENCY", 0)
+        self.queue_timeout = getattr(settings, "LOAD_SHED_QUEUE_TIMEOUT", 0.05)
+        self.retry_after = getattr(settings, "LOAD_SHED_RETRY_AFTER", 1)
+        self.slots = threading.BoundedSemaphore(max(self.max_concurrency, 1))
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+
+    def __call__(self, request):
+        if self.max_concurrency <= 0:
+            return self.get_response(request)
+
+        self.update(waiting=1)
+        acquired = self.slots.acquire(timeout=self.queue_timeout)
+        self.update(waiting=-1)
+        if not acquired:
+            metrics.incr("load_shed.rejected")
+            response = JsonResponse(
+                {"error": "Server is busy, please retry later."}, status=503
+            )
+            response["Retry-After"] = str(self.retry_after)
+            return response
+
+        metrics.incr("load_shed.accepted")
+        self.update(in_flight=1)
+        try:
+            return self.get_response(request)
+        finally:
+            self.update(in_flight=-1)
+            self.slots.release()
+
+    def update(self, in_flight=0, waiting=0):
+        with self.lock:
+            self.in_flight += in_flight
+            self.waiting += waiting
+            metrics.gauge("load_shed.in_flight", self.in_flight)
+            metrics.gauge("load_shed.waiting", self.waiting)
+
+
+class IdentityMapMiddleware:
+    """
+    Give every request its own identity map (see core.identity), discarded
+    when the response is returned.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with identity_map():
+            return self.get_response(request)
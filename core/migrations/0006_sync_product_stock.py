@@ -0,0 +1,27 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def sync_product_stock(apps, schema_editor):
+    Product = apps.get_model("core", "Product")
+    ProductVariant = apps.get_model("core", "ProductVariant")
+    totals = (
+        ProductVariant.objects.filter(product=OuterRef("pk"))
+        .order_by()
+        .values("product")
+        .annotate(total=Sum("stock"))
+        .values("total")
+    )
+    Product.objects.update(stock=Coalesce(Subquery(totals), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_product_recommendation"),
+    ]
+
+    operations = [
+        migrations.RunPython(sync_product_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:58
+
+from django.db import migrations, models
+
+
+def backfill_snapshots(apps, schema_editor):
+    OrderItem = apps.get_model("core", "OrderItem")
+    ProductImage = apps.get_model("core", "ProductImage")
+    storage = ProductImage._meta.get_field("image_url").storage
+
+    images = {}
+    for product_id, name in ProductImage.objects.order_by("id").values_list(
+        "product_id", "image_url"
+    ):
+        images.setdefault(product_id, storage.url(name) if name else "")
+
+    items = OrderItem.objects.select_related("product_variant__product").order_by("id")
+    batch = []
+    for item in items.iterator(chunk_size=2000):
+        variant = item.product_variant
+        item.sku = variant.sku
+        item.variant_name = variant.name
+        item.product_name = variant.product.name
+        item.image_url = images.get(variant.product_id, "")
+        batch.append(item)
+        if len(batch) >= 2000:
+            OrderItem.objects.bulk_update(
+                batch, ["sku", "variant_name", "product_name", "image_url"]
+            )
+            batch = []
+    OrderItem.objects.bulk_update(
+        batch, ["sku", "variant_name", "product_name", "image_url"]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='image_url',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='sku',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='variant_name',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:03
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_order_item_snapshot'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='brand',
+            options={'base_manager_name': 'objects'},
+        ),
+        migrations.AlterModelOptions(
+            name='category',
+            options={'base_manager_name': 'objects', 'verbose_name_plural': 'Categories'},
+        ),
+        migrations.AlterModelOptions(
+            name='productvariant',
+            options={'base_manager_name': 'objects'},
+        ),
+        migrations.AlterModelOptions(
+            name='userprofile',
+            options={'base_manager_name': 'objects'},
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:11
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    Cart = apps.get_model("core", "Cart")
+    CartItem = apps.get_model("core", "CartItem")
+    ProductVariant = apps.get_model("core", "ProductVariant")
+    CartItem.objects.update(
+        unit_price=Subquery(
+            ProductVariant.objects.filter(pk=OuterRef("product_variant")).values("price")[:1]
+        )
+    )
+    items = CartItem.objects.filter(cart=OuterRef("pk")).order_by().values("cart")
+    Cart.objects.update(
+        item_count=Coalesce(
+            Subquery(items.annotate(total=Sum("quantity")).values("total")),
+            0,
+            output_field=IntegerField(),
+        ),
+        subtotal=Coalesce(
+            Subquery(items.annotate(total=Sum(F("quantity") * F("unit_price"))).values("total")),
+            Decimal("0.00"),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_guest_carts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cartitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_cart_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='used_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -1,10 +1,30 @@
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
-from django.utils.text import slugify
+
+from .identity import IdentityMapManager
+from .slugs import save_with_slug
 
 # Create your models here.
 
 
+class ChangeLoggedModel(models.Model):
+    # save() and delete() run in one transaction with their post_save and
+    # post_delete receivers, so the ChangeEvent row commits with the change
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            return super().delete(using=using, keep_parents=keep_parents)
+
+
 class UserProfile(models.Model):
     ROLE_CHOICES = [
         ("SUPER_ADMIN", "Super Admin"),
@@ -26,6 +46,11 @@ class UserProfile(models.Model):
     profile_image = models.ImageField(upload_to="profiles/", blank=True, null=True)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default="USER")
 
+    objects = IdentityMapManager(identity_fields=["user"])
+
+    class Meta:
+        base_manager_name = "objects"
+
     def __str__(self):
         return f"{self.user.username} - {self.role}"
 
@@ -55,10 +80,13 @@ class Category(models.Model):
         blank=True,
         null=True,
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = IdentityMapManager(identity_fields=["slug"])
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            return save_with_slug(self, super().save, *args, **kwargs)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -66,18 +94,25 @@ class Category(models.Model):
 
     class Meta:
         verbose_name_plural = "Categories"
+        base_manager_name = "objects"
 
 
 class Brand(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
     logo = models.ImageField(upload_to="brands/", blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = IdentityMapManager()
+
+    class Meta:
+        base_manager_name = "objects"
 
     def __str__(self):
         return self.name
 
 
-class Product(models.Model):
+class Product(ChangeLoggedModel):
     name = models.CharField(max_length=200)
     slug = models.SlugField(unique=True, blank=True)
     description = models.TextField(blank=True, null=True)
@@ -92,10 +127,11 @@ class Product(models.Model):
     )
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            return save_with_slug(self, super().save, *args, **kwargs)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -112,7 +148,7 @@ class ProductImage(models.Model):
         return f"Image for {self.product.name}"
 
 
-class ProductVariant(models.Model):
+class ProductVariant(ChangeLoggedModel):
     product = models.ForeignKey(
         Product, on_delete=models.CASCADE, related_name="variants"
     )
@@ -120,12 +156,18 @@ class ProductVariant(models.Model):
     name = models.CharField(max_length=200)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = IdentityMapManager(identity_fields=["sku"])
+
+    class Meta:
+        base_manager_name = "objects"
 
     def __str__(self):
         return f"{self.product.name} - {self.name}"
 
 
-class Discount(models.Model):
+class Discount(ChangeLoggedModel):
     DISCOUNT_TYPE_CHOICES = [
         ("PERCENT", "Percentage"),
         ("FIXED", "Fixed Amount"),
@@ -155,6 +197,8 @@ class Coupon(models.Model):
     min_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     expiry_date = models.DateTimeField()
     usage_limit = models.IntegerField(default=1)
+    # Redemptions so far, incremented atomically by core.coupons.redeem
+    used_count = models.IntegerField(default=0)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
 
     def __str__(self):
@@ -162,21 +206,45 @@ class Coupon(models.Model):
 
 
 class Cart(models.Model):
-    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="cart")
+    # Guest carts have no user and expire at expires_at
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, related_name="cart", blank=True, null=True
+    )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    # Maintained by core.cart_totals
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     def __str__(self):
-        return f"Cart - {self.user.username}"
+        return f"Cart - {self.user.username}" if self.user_id else f"Guest cart #{self.id}"
 
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="items")
     product_variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
+    # The variant's current price, kept in step by core.cart_totals
+    unit_price = models.DecimalField(
+        max_digits=10, decimal_places=2, blank=True, default=None
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["cart", "product_variant"], name="unique_cart_item"
+            )
+        ]
 
     @property
     def subtotal(self):
-        return self.quantity * self.product_variant.price
+        return self.quantity * self.unit_price
+
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.unit_price = self.product_variant.price
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.product_variant.name} x {self.quantity}"
@@ -195,6 +263,13 @@ class Order(models.Model):
         ("DELIVERED", "Delivered"),
         ("CANCELLED", "Cancelled"),
     ]
+    STATUS_TRANSITIONS = {
+        "PENDING": ["APPROVED", "CANCELLED"],
+        "APPROVED": ["SHIPPED", "CANCELLED"],
+        "SHIPPED": ["DELIVERED"],
+        "DELIVERED": [],
+        "CANCELLED": [],
+    }
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="orders")
     address = models.ForeignKey(Address, on_delete=models.SET_NULL, null=True)
@@ -207,7 +282,8 @@ class Order(models.Model):
     order_status = models.CharField(
         max_length=20, choices=ORDER_STATUS_CHOICES, default="PENDING"
     )
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
     approved_by = models.ForeignKey(
         User,
         on_delete=models.SET_NULL,
@@ -216,6 +292,20 @@ class Order(models.Model):
         related_name="approved_orders",
     )
 
+    class Meta:
+        indexes = [models.Index(fields=["order_status", "updated_at"])]
+
+    @classmethod
+    def source_statuses(cls, order_status):
+        return [
+            source
+            for source, targets in cls.STATUS_TRANSITIONS.items()
+            if order_status in targets
+        ]
+
+    def can_transition_to(self, order_status):
+        return order_status in self.STATUS_TRANSITIONS.get(self.order_status, [])
+
     def __str__(self):
         return f"Order #{self.id} - {self.user.username}"
 
@@ -225,9 +315,14 @@ class OrderItem(models.Model):
     product_variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE)
     quantity = models.IntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # What was bought, as it was at checkout
+    sku = models.CharField(max_length=100, blank=True, default="")
+    variant_name = models.CharField(max_length=200, blank=True, default="")
+    product_name = models.CharField(max_length=200, blank=True, default="")
+    image_url = models.CharField(max_length=500, blank=True, default="")
 
     def __str__(self):
-        return f"{self.product_variant.name} x {self.quantity}"
+        return f"{self.variant_name or self.product_variant_id} x {self.quantity}"
 
 
 class Review(models.Model):
@@ -237,7 +332,7 @@ class Review(models.Model):
     )
     rating = models.IntegerField(choices=[(i, i) for i in range(1, 6)])
     comment = models.TextField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name} - {self.rating}★"
@@ -252,5 +347,137 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["is_read", "created_at"])]
+
     def __str__(self):
         return f"{self.title} - {self.user.username}"
+
+
+class ArchivedNotification(models.Model):
+    # Read notifications moved out of Notification by archive_history
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="archived_notifications"
+    )
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.title} - {self.user_id}"
+
+
+class ArchivedOrder(models.Model):
+    # Delivered orders moved out of Order/OrderItem by archive_history, with
+    # the order as OrderSerializer rendered it when it was archived
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="archived_orders"
+    )
+    order_status = models.CharField(max_length=20)
+    grand_total = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    payload = models.JSONField()
+
+    def __str__(self):
+        return f"Archived order #{self.id}"
+
+
+class SalesRollup(models.Model):
+    day = models.DateField()
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, related_name="sales_rollups"
+    )
+    brand = models.ForeignKey(
+        Brand, on_delete=models.CASCADE, related_name="sales_rollups"
+    )
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    gross = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    net = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "category", "brand"], name="unique_sales_rollup_bucket"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["category", "day"]),
+            models.Index(fields=["brand", "day"]),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.category_id}/{self.brand_id}"
+
+
+class IdempotencyKey(models.Model):
+    scope = models.CharField(max_length=64)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    response_body = models.JSONField(blank=True, null=True)
+    # Headers replayed with the body, e.g. a new guest cart's X-Cart-Token
+    response_headers = models.JSONField(blank=True, default=dict)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["scope", "key"], name="unique_idempotency_key"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.scope} - {self.key}"
+
+
+class ProductRecommendation(models.Model):
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="recommendations"
+    )
+    related_product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="+"
+    )
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "related_product"],
+                name="unique_product_recommendation",
+            )
+        ]
+        indexes = [models.Index(fields=["product", "-score"])]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_product_id} ({self.score})"
+
+
+class ChangeEvent(models.Model):
+    """
+    Append-only change log of catalogue rows for downstream consumers
+    (/changes/). The id is the consumers' cursor.
+    """
+
+    ENTITY_CHOICES = [
+        ("product", "Product"),
+        ("variant", "Product variant"),
+        ("discount", "Discount"),
+    ]
+    OP_CHOICES = [("upsert", "Upsert"), ("delete", "Delete")]
+
+    id = models.BigAutoField(primary_key=True)
+    entity = models.CharField(max_length=20, choices=ENTITY_CHOICES)
+    entity_id = models.BigIntegerField()
+    op = models.CharField(max_length=10, choices=OP_CHOICES)
+    data = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"#{self.id} {self.op} {self.entity} {self.entity_id}"
@@ -0,0 +1,108 @@
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .inventory import release_stock
+from .models import Notification, Order, OrderItem
+from .recommendations import record_orders
+from .rollups import apply_orders
+
+NOTIFICATION_TITLES = {
+    "APPROVED": "Order Approved",
+    "SHIPPED": "Order Shipped",
+    "DELIVERED": "Order Delivered",
+    "CANCELLED": "Order Cancelled",
+}
+
+
+class InvalidStatus(ValueError):
+    pass
+
+
+def transition_orders(order_ids, order_status, user, expected_status=None):
+    """
+    Move every order in ``order_ids`` to ``order_status`` with a single
+    UPDATE ... WHERE order_status IN (<allowed sources>).
+
+    Returns a list of per-id results in the order the ids were given.
+    """
+    if order_status not in Order.STATUS_TRANSITIONS:
+        raise InvalidStatus(f"Invalid order status: {order_status}")
+
+    sources = Order.source_statuses(order_status)
+    if expected_status is not None:
+        sources = [expected_status] if expected_status in sources else []
+
+    order_ids = list(dict.fromkeys(order_ids))
+    with transaction.atomic():
+        current = {
+            order_id: (current_status, user_id)
+            for order_id, current_status, user_id in Order.objects.select_for_update()
+            .filter(id__in=order_ids)
+            .values_list("id", "order_status", "user_id")
+        }
+        moved = [
+            order_id
+            for order_id in order_ids
+            if order_id in current and current[order_id][0] in sources
+        ]
+
+        if moved:
+            updates = {"order_status": order_status, "updated_at": timezone.now()}
+            if order_status == "APPROVED":
+                updates["approved_by"] = user
+            Order.objects.filter(id__in=moved, order_status__in=sources).update(
+                **updates
+            )
+            if order_status == "CANCELLED":
+                restore_stock(moved)
+                apply_orders(moved, -1)
+                record_orders(moved, -1)
+
+            notifications = [
+                Notification(
+                    user_id=current[order_id][1],
+                    title=NOTIFICATION_TITLES[order_status],
+                    message=f"Your order #{order_id} has been {order_status.lower()}.",
+                )
+                for order_id in moved
+            ]
+            transaction.on_commit(
+                lambda: Notification.objects.bulk_create(notifications, batch_size=500)
+            )
+
+    moved = set(moved)
+    results = []
+    for order_id in order_ids:
+        if order_id not in current:
+            results.append({"id": order_id, "result": "not_found"})
+        elif order_id in moved:
+            results.append(
+                {
+                    "id": order_id,
+                    "result": "ok",
+                    "from_status": current[order_id][0],
+                    "order_status": order_status,
+                }
+            )
+        else:
+            results.append(
+                {
+                    "id": order_id,
+                    "result": "invalid_transition",
+                    "order_status": current[order_id][0],
+                }
+            )
+    return results
+
+
+def restore_stock(order_ids):
+    # Put the ordered quantities back in one UPDATE across all variants
+    release_stock(
+        dict(
+            OrderItem.objects.filter(order_id__in=order_ids)
+            .values("product_variant")
+            .annotate(quantity=Sum("quantity"))
+            .values_list("product_variant", "quantity")
+        )
+    )
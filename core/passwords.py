@@ -0,0 +1,123 @@
+"""
+Password hashing off the request thread.
+
+make_password() and check_password() run on a bounded process pool
+(PASSWORD_HASH_WORKERS processes, at most PASSWORD_HASH_QUEUE_SIZE jobs in
+flight per web process), so a burst of signups or logins queues for the pool
+instead of pinning every worker on key stretching. The async variants await
+the pool without blocking the event loop. With PASSWORD_HASH_WORKERS = 0
+hashing runs inline.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.contrib.auth.models import User
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+def _init_worker():
+    # Spawned workers need Django configured before they can hash
+    if not apps.ready:
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ecommerce_project.settings")
+        django.setup()
+
+
+def _hash(password):
+    return hashers.make_password(password)
+
+
+def _verify(password, encoded):
+    return hashers.check_password(password, encoded)
+
+
+def get_executor():
+    global _executor, _slots
+    workers = getattr(settings, "PASSWORD_HASH_WORKERS", 0)
+    if workers <= 0:
+        return None
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            _slots = threading.BoundedSemaphore(
+                getattr(settings, "PASSWORD_HASH_QUEUE_SIZE", workers * 4)
+            )
+    return _executor
+
+
+def submit(function, *args):
+    """
+    Run ``function`` on the pool and return a Future, waiting for a free slot
+    when the queue is full.
+    """
+    executor = get_executor()
+    _slots.acquire()
+    try:
+        future = executor.submit(function, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def make_password(password):
+    if get_executor() is None:
+        return _hash(password)
+    return submit(_hash, password).result()
+
+
+def check_password(password, encoded):
+    if get_executor() is None:
+        return _verify(password, encoded)
+    return submit(_verify, password, encoded).result()
+
+
+async def amake_password(password):
+    if get_executor() is None:
+        return await asyncio.to_thread(_hash, password)
+    return await asyncio.wrap_future(await asyncio.to_thread(submit, _hash, password))
+
+
+async def acheck_password(password, encoded):
+    if get_executor() is None:
+        return await asyncio.to_thread(_verify, password, encoded)
+    return await asyncio.wrap_future(
+        await asyncio.to_thread(submit, _verify, password, encoded)
+    )
+
+
+def must_update(encoded):
+    # Whether ``encoded`` was made by another hasher or with other parameters
+    preferred = hashers.get_hasher("default")
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def create_user(username, email=None, password=None, **extra_fields):
+    """
+    User.objects.create_user() with the password hashed on the pool.
+    """
+    user = User(
+        username=User.normalize_username(username),
+        email=User.objects.normalize_email(email),
+        **extra_fields,
+    )
+    if password is None:
+        user.set_unusable_password()
+    else:
+        user.password = make_password(password)
+    user.save()
+    return user
@@ -0,0 +1,139 @@
+"""
+"Frequently bought together" recommendations from OrderItem co-occurrence.
+
+ProductRecommendation.score is the number of orders that contain both
+products. build() recomputes the top-K neighbours of every product offline
+with NumPy/SciPy; record_orders() adds new orders and removes cancelled
+ones incrementally, keeping at most RECOMMENDATIONS_TOP_K per product.
+"""
+
+from collections import Counter, defaultdict
+from itertools import chain, permutations
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+
+from .archive import archived_order_lines
+from .cooccurrence import compute_neighbours, occurrence_matrix
+from .models import ArchivedOrder, OrderItem, ProductRecommendation
+
+
+def order_product_pairs(queryset):
+    # (order_id, product_id) rows streamed in order id order
+    return (
+        queryset.exclude(order__order_status="CANCELLED")
+        .order_by("order_id")
+        .values_list("order_id", "product_variant__product_id")
+        .iterator(chunk_size=10000)
+    )
+
+
+def archived_product_pairs():
+    for order, lines in archived_order_lines(ArchivedOrder.objects.all()):
+        for product_id, *_ in lines:
+            yield order.id, product_id
+
+
+def build(top_k=20, workers=1, batch_size=5000):
+    """
+    Recompute every product's top-K neighbours from the full order history,
+    archived orders included.
+    """
+    matrix, product_ids = occurrence_matrix(
+        chain(order_product_pairs(OrderItem.objects.all()), archived_product_pairs())
+    )
+    recommendations = [
+        ProductRecommendation(
+            product_id=int(product_ids[position]),
+            related_product_id=int(product_ids[column]),
+            score=int(count),
+        )
+        for position, columns, counts in compute_neighbours(matrix, top_k, workers)
+        for column, count in zip(columns, counts)
+    ]
+
+    with transaction.atomic():
+        ProductRecommendation.objects.all().delete()
+        ProductRecommendation.objects.bulk_create(recommendations, batch_size=batch_size)
+    return len(recommendations)
+
+
+def top_k():
+    return getattr(settings, "RECOMMENDATIONS_TOP_K", 20)
+
+
+def record_order(order_id):
+    record_orders([order_id])
+
+
+def record_orders(order_ids, sign=1):
+    """
+    Count one more (sign=1) or one less (sign=-1, for cancelled orders)
+    co-occurrence for every pair of products in each order. Pairs that reach
+    zero are dropped, and products are trimmed back to their top-K
+    neighbours, so the table stays the size build() leaves it at. A pair
+    trimmed away starts again from its next order until the next build().
+    """
+    products = defaultdict(set)
+    for order_id, product_id in OrderItem.objects.filter(order_id__in=order_ids).values_list(
+        "order_id", "product_variant__product_id"
+    ):
+        products[order_id].add(product_id)
+    pairs = Counter()
+    for product_ids in products.values():
+        pairs.update(permutations(product_ids, 2))
+    if not pairs:
+        return
+    product_ids = {product_id for product_id, _ in pairs}
+
+    with transaction.atomic():
+        existing = {
+            (product_id, related_id): pk
+            for pk, product_id, related_id in ProductRecommendation.objects.filter(
+                product_id__in=product_ids, related_product_id__in=product_ids
+            ).values_list("pk", "product_id", "related_product_id")
+            if (product_id, related_id) in pairs
+        }
+        by_count = defaultdict(list)
+        for pair, pk in existing.items():
+            by_count[pairs[pair]].append(pk)
+        for count, pks in by_count.items():
+            ProductRecommendation.objects.filter(pk__in=pks).update(
+                score=F("score") + sign * count
+            )
+
+        if sign < 0:
+            ProductRecommendation.objects.filter(
+                pk__in=existing.values(), score__lte=0
+            ).delete()
+            return
+        ProductRecommendation.objects.bulk_create(
+            [
+                ProductRecommendation(
+                    product_id=product_id, related_product_id=related_id, score=count
+                )
+                for (product_id, related_id), count in pairs.items()
+                if (product_id, related_id) not in existing
+            ],
+            ignore_conflicts=True,
+        )
+        trim(product_ids, top_k())
+
+
+def trim(product_ids, limit):
+    # Drop all but the ``limit`` best neighbours of each product
+    crowded = (
+        ProductRecommendation.objects.filter(product_id__in=product_ids)
+        .values("product_id")
+        .annotate(neighbours=Count("pk"))
+        .filter(neighbours__gt=limit)
+        .values_list("product_id", flat=True)
+    )
+    for product_id in crowded:
+        surplus = ProductRecommendation.objects.filter(product_id=product_id).order_by(
+            "-score", "pk"
+        )[limit:]
+        ProductRecommendation.objects.filter(
+            pk__in=list(surplus.values_list("pk", flat=True))
+        ).delete()
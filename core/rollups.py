@@ -0,0 +1,166 @@
+from collections import defaultdict
+from datetime import datetime, time
+from decimal import Decimal
+from itertools import chain
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .archive import archived_order_lines
+from .models import ArchivedOrder, Order, OrderItem, SalesRollup
+
+CENTS = Decimal("0.01")
+
+
+def compute_buckets(orders, item_rows):
+    """
+    Fold order lines into day x category x brand buckets.
+
+    ``orders`` maps order id -> (day, total_amount, discount) and ``item_rows``
+    yields (order_id, category_id, brand_id, quantity, price) tuples. The order
+    discount is spread over its lines in proportion to their gross amount.
+    """
+    lines = defaultdict(list)
+    for order_id, category_id, brand_id, quantity, price in item_rows:
+        lines[order_id].append((category_id, brand_id, quantity, price * quantity))
+
+    buckets = defaultdict(lambda: [0, 0, Decimal("0"), Decimal("0")])
+    for order_id, order_lines in lines.items():
+        if order_id not in orders:
+            continue
+        day, total_amount, discount = orders[order_id]
+        remaining = discount
+        touched = set()
+        for index, (category_id, brand_id, quantity, gross) in enumerate(order_lines):
+            if index == len(order_lines) - 1:
+                share = remaining
+            elif total_amount:
+                share = (discount * gross / total_amount).quantize(CENTS)
+            else:
+                share = Decimal("0")
+            remaining -= share
+
+            key = (day, category_id, brand_id)
+            bucket = buckets[key]
+            if key not in touched:
+                bucket[0] += 1
+                touched.add(key)
+            bucket[1] += quantity
+            bucket[2] += gross
+            bucket[3] += share
+
+    return {
+        key: {
+            "orders": orders_count,
+            "units": units,
+            "gross": gross,
+            "discount": discount,
+            "net": gross - discount,
+        }
+        for key, (orders_count, units, gross, discount) in buckets.items()
+    }
+
+
+def item_rows(queryset):
+    return queryset.values_list(
+        "order_id",
+        "product_variant__product__category_id",
+        "product_variant__product__brand_id",
+        "quantity",
+        "price",
+    )
+
+
+def apply_order(order, sign=1):
+    # Add (sign=1) or remove (sign=-1) one order from the daily rollups
+    apply_orders([order.id], sign)
+
+
+def apply_orders(order_ids, sign=1):
+    orders = {
+        order_id: (
+            timezone.localdate(created_at),
+            Decimal(total_amount).quantize(CENTS),
+            Decimal(discount).quantize(CENTS),
+        )
+        for order_id, created_at, total_amount, discount in Order.objects.filter(
+            id__in=order_ids
+        ).values_list("id", "created_at", "total_amount", "discount")
+    }
+    buckets = compute_buckets(
+        orders, item_rows(OrderItem.objects.filter(order_id__in=order_ids))
+    )
+
+    with transaction.atomic():
+        for (day, category_id, brand_id), values in buckets.items():
+            _upsert_bucket(day, category_id, brand_id, values, sign)
+
+
+def _upsert_bucket(day, category_id, brand_id, values, sign):
+    lookup = {"day": day, "category_id": category_id, "brand_id": brand_id}
+    increments = {name: F(name) + sign * value for name, value in values.items()}
+
+    if SalesRollup.objects.filter(**lookup).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            SalesRollup.objects.create(
+                **lookup, **{name: sign * value for name, value in values.items()}
+            )
+    except IntegrityError:
+        # Another request created the bucket first
+        SalesRollup.objects.filter(**lookup).update(**increments)
+
+
+def rebuild_range(start, end):
+    """
+    Recompute the rollups for the days in [start, end) from the order
+    history, archived orders included.
+    """
+    tz = timezone.get_current_timezone()
+    start_at = timezone.make_aware(datetime.combine(start, time.min), tz)
+    end_at = timezone.make_aware(datetime.combine(end, time.min), tz)
+
+    order_qs = Order.objects.filter(
+        created_at__gte=start_at, created_at__lt=end_at
+    ).exclude(order_status="CANCELLED")
+    orders = {
+        order_id: (timezone.localdate(created_at), total_amount, discount)
+        for order_id, created_at, total_amount, discount in order_qs.values_list(
+            "id", "created_at", "total_amount", "discount"
+        ).iterator(chunk_size=2000)
+    }
+    rows = item_rows(
+        OrderItem.objects.filter(
+            order__created_at__gte=start_at, order__created_at__lt=end_at
+        ).exclude(order__order_status="CANCELLED")
+    ).iterator(chunk_size=2000)
+
+    archived_rows = []
+    for order, lines in archived_order_lines(
+        ArchivedOrder.objects.filter(created_at__gte=start_at, created_at__lt=end_at)
+    ):
+        orders[order.id] = (
+            timezone.localdate(order.created_at),
+            Decimal(order.payload["total_amount"]),
+            Decimal(order.payload["discount"]),
+        )
+        archived_rows.extend(
+            (order.id, category_id, brand_id, quantity, price)
+            for _, category_id, brand_id, quantity, price in lines
+        )
+    buckets = compute_buckets(orders, chain(rows, archived_rows))
+
+    with transaction.atomic():
+        SalesRollup.objects.filter(day__gte=start, day__lt=end).delete()
+        SalesRollup.objects.bulk_create(
+            [
+                SalesRollup(
+                    day=day, category_id=category_id, brand_id=brand_id, **values
+                )
+                for (day, category_id, brand_id), values in buckets.items()
+            ],
+            batch_size=1000,
+        )
+    return len(buckets)
@@ -1,6 +1,54 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import *
+from django.db.models.manager import BaseManager
+from .models import (
+    Address, Brand, Cart, CartItem, Category, Coupon, Discount, Notification, Order, OrderItem,
+    Product, ProductImage, ProductVariant, Review, UserProfile
+)
+from .fieldsets import nested
+from .identity import prime
+from .passwords import create_user
+
+class SelectableFieldsMixin:
+    """
+    Prune the rendered fields with a FieldSelection (?fields= / ?expand=).
+    Nested relations listed in `expandable_fields` collapse to their primary
+    key unless they are expanded.
+    """
+    expandable_fields = []
+    
+    def __init__(self, *args, **kwargs):
+        self.selection = kwargs.pop('selection', None)
+        super().__init__(*args, **kwargs)
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self.selection
+        if selection is None:
+            return fields
+        
+        for name in list(fields):
+            if not selection.includes(name):
+                del fields[name]
+            elif name in self.expandable_fields and not selection.expands(name):
+                fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+            else:
+                child = getattr(fields[name], 'child', fields[name])
+                if isinstance(child, SelectableFieldsMixin):
+                    child.selection = nested(selection, name)
+        return fields
+
+class PrimedListSerializer(serializers.ListSerializer):
+    """
+    Queue the child's `prime_fields` foreign keys in the identity map before
+    rendering, so every distinct target is loaded in one batch instead of
+    once per row.
+    """
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, BaseManager) else data)
+        for field in getattr(self.child, 'prime_fields', []):
+            prime(items, field)
+        return super().to_representation(items)
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -28,7 +76,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         phone_number = validated_data.pop('phone_number', None)
         role = validated_data.pop('role', 'USER')
         
-        user = User.objects.create_user(**validated_data)
+        user = create_user(**validated_data)
         UserProfile.objects.create(user=user, phone_number=phone_number, role=role)
         
         return user
@@ -49,17 +97,17 @@ class BrandSerializer(serializers.ModelSerializer):
         model = Brand
         fields = '__all__'
 
-class ProductImageSerializer(serializers.ModelSerializer):
+class ProductImageSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = ProductImage
         fields = ['id', 'image_url']
 
-class ProductVariantSerializer(serializers.ModelSerializer):
+class ProductVariantSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = ProductVariant
         fields = ['id', 'sku', 'name', 'price', 'stock']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     brand_name = serializers.CharField(source='brand.name', read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
@@ -70,15 +118,17 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug', 'description', 'category', 'category_name', 
                   'brand', 'brand_name', 'base_price', 'stock', 'is_active', 
                   'created_at', 'images', 'variants']
-        read_only_fields = ['created_by', 'slug']
+        read_only_fields = ['created_by', 'slug', 'stock']
 
 class CartItemSerializer(serializers.ModelSerializer):
     product_variant = ProductVariantSerializer(read_only=True)
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    prime_fields = ['product_variant']
     
     class Meta:
         model = CartItem
         fields = ['id', 'product_variant', 'quantity', 'subtotal']
+        list_serializer_class = PrimedListSerializer
 
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
@@ -86,19 +136,27 @@ class CartSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Cart
-        fields = ['id', 'user', 'items', 'total', 'created_at']
+        fields = ['id', 'user', 'items', 'item_count', 'total', 'created_at']
     
     def get_total(self, obj):
-        return sum(item.subtotal for item in obj.items.all())
-
-class OrderItemSerializer(serializers.ModelSerializer):
-    product_variant = ProductVariantSerializer(read_only=True)
+        return obj.subtotal
+
+class OrderLineVariantSerializer(SelectableFieldsMixin, serializers.Serializer):
+    # The variant as snapshotted on the order line, without touching ProductVariant
+    id = serializers.IntegerField(source='product_variant_id', read_only=True)
+    sku = serializers.CharField(read_only=True)
+    name = serializers.CharField(source='variant_name', read_only=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+class OrderItemSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+    product_variant = OrderLineVariantSerializer(source='*', read_only=True)
+    expandable_fields = ['product_variant']
     
     class Meta:
         model = OrderItem
-        fields = ['id', 'product_variant', 'quantity', 'price']
+        fields = ['id', 'product_variant', 'product_name', 'image_url', 'quantity', 'price']
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     user_name = serializers.CharField(source='user.username', read_only=True)
     
@@ -131,4 +189,4 @@ class CouponSerializer(serializers.ModelSerializer):
     class Meta:
         model = Coupon
         fields = '__all__'
-        read_only_fields = ['created_by']
\ No newline at end of file
+        read_only_fields = ['created_by', 'used_count']
\ No newline at end of file
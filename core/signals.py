@@ -0,0 +1,98 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .changes import record_deleted, record_saved
+from .coupons import index as coupon_index
+from .cart_totals import recompute_totals, reprice_variants, signals_recount
+from .inventory import sync_product_stock
+from .identity import evict
+from .models import (
+    Brand,
+    CartItem,
+    Category,
+    Coupon,
+    Discount,
+    Product,
+    ProductImage,
+    ProductVariant,
+    UserProfile,
+)
+from .sku_index import index as sku_index
+from .slugs import forget_slug
+
+
+# Keep the parent's updated_at (and so its ETag) in step with its children
+@receiver([post_save, post_delete], sender=ProductImage)
+def touch_product(sender, instance, **kwargs):
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+# Product.stock is the sum of its variants' stock
+@receiver([post_save, post_delete], sender=ProductVariant)
+def sync_variant_product(sender, instance, **kwargs):
+    sync_product_stock(product_ids=[instance.product_id])
+
+
+# Item saves and deletes outside core.cart_totals (admin, cascades) recount the cart
+@receiver([post_save, post_delete], sender=CartItem)
+def touch_cart(sender, instance, **kwargs):
+    if signals_recount():
+        recompute_totals([instance.cart_id])
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+def evict_sku(sender, instance, **kwargs):
+    sku_index.evict([instance.pk])
+
+
+# Cart lines follow the variant's price
+@receiver(post_save, sender=ProductVariant)
+def reprice_cart_lines(sender, instance, **kwargs):
+    reprice_variants([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Coupon)
+def refresh_coupon_index(sender, instance, **kwargs):
+    coupon_index.invalidate()
+
+
+# A renamed slug must stop resolving too, so remember the one being replaced
+@receiver(pre_save, sender=Product)
+def remember_product_slug(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._previous_slug = (
+            Product.objects.filter(pk=instance.pk).values_list("slug", flat=True).first()
+        )
+
+
+@receiver([post_save, post_delete], sender=Product)
+def forget_product_slug(sender, instance, **kwargs):
+    forget_slug(Product, instance.slug)
+    previous = getattr(instance, "_previous_slug", None)
+    if previous and previous != instance.slug:
+        forget_slug(Product, previous)
+
+
+# Append to the change feed inside the save's or delete's transaction
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_save, sender=Discount)
+def log_saved_change(sender, instance, **kwargs):
+    record_saved(instance)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_delete, sender=Discount)
+def log_deleted_change(sender, instance, **kwargs):
+    record_deleted(instance)
+
+
+# Drop saved or deleted rows from the request's identity map
+@receiver([post_save, post_delete], sender=UserProfile)
+@receiver([post_save, post_delete], sender=ProductVariant)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Brand)
+def evict_identity(sender, instance, **kwargs):
+    evict(sender, [instance.pk])
@@ -0,0 +1,82 @@
+"""
+In-process SKU -> variant index for bulk SKU resolution.
+
+Entries hold a variant's id, price and stock. Lookups are answered from
+memory and all misses are loaded with one ``sku IN (...)`` query. Saving or
+deleting a variant and the stock helpers in core.inventory evict its entry
+in this process; entries also expire after SKU_INDEX_TTL seconds so other
+processes' changes show up. The index keeps at most SKU_INDEX_MAX_SIZE
+entries, dropping the least recently used.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .metrics import metrics
+from .models import ProductVariant
+
+
+class SkuIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._skus = {}
+
+    def resolve(self, skus):
+        """
+        ``{sku: {"id", "price", "stock"}}`` for the known SKUs among ``skus``.
+        """
+        ttl = getattr(settings, "SKU_INDEX_TTL", 60)
+        now = time.monotonic()
+        found = {}
+        misses = []
+        with self._lock:
+            for sku in dict.fromkeys(skus):
+                entry = self._entries.get(sku)
+                if entry is not None and now - entry[0] <= ttl:
+                    self._entries.move_to_end(sku)
+                    found[sku] = entry[1]
+                else:
+                    misses.append(sku)
+        metrics.incr("sku_index.hits", len(found))
+        metrics.incr("sku_index.misses", len(misses))
+
+        if misses:
+            loaded = {
+                sku: {"id": pk, "price": str(price), "stock": stock}
+                for pk, sku, price, stock in ProductVariant.objects.filter(
+                    sku__in=misses
+                ).values_list("pk", "sku", "price", "stock")
+            }
+            self.store(loaded, now)
+            found.update(loaded)
+        return found
+
+    def store(self, variants, now):
+        limit = getattr(settings, "SKU_INDEX_MAX_SIZE", 100000)
+        with self._lock:
+            for sku, variant in variants.items():
+                self._entries[sku] = (now, variant)
+                self._entries.move_to_end(sku)
+                self._skus[variant["id"]] = sku
+            while len(self._entries) > limit:
+                _, (_, variant) = self._entries.popitem(last=False)
+                self._skus.pop(variant["id"], None)
+
+    def evict(self, variant_ids):
+        with self._lock:
+            for pk in variant_ids:
+                sku = self._skus.pop(pk, None)
+                if sku is not None:
+                    self._entries.pop(sku, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._skus.clear()
+
+
+index = SkuIndex()
@@ -0,0 +1,117 @@
+"""
+Unique slug allocation.
+
+Names are slugified to a base, and every existing slug equal to a base or
+starting with ``<base>-`` is read with one prefix scan over the unique slug
+index per batch. Taken bases get the next free numeric suffix
+(``iphone-case``, ``iphone-case-2``, ...). Allocation is optimistic: a
+concurrent insert that wins the same slug makes ours fail the unique
+constraint, and the save is retried with a fresh allocation.
+"""
+
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+# Room kept at the end of a base for "-<n>"
+SUFFIX_ROOM = 6
+ATTEMPTS = 5
+
+
+def slug_base(name, max_length):
+    return slugify(name)[: max_length - SUFFIX_ROOM].strip("-") or "item"
+
+
+def allocate_slugs(model, names, field="slug"):
+    # Unique slugs for ``names``, distinct from each other and from the table
+    max_length = model._meta.get_field(field).max_length
+    bases = [slug_base(name, max_length) for name in names]
+    if not bases:
+        return []
+
+    query = Q()
+    for base in set(bases):
+        query |= Q(**{field: base}) | Q(**{f"{field}__startswith": f"{base}-"})
+    taken = set(model._default_manager.filter(query).values_list(field, flat=True))
+
+    next_suffix = {}
+    slugs = []
+    for base in bases:
+        if base not in taken:
+            slug = base
+        else:
+            if base not in next_suffix:
+                pattern = re.compile(rf"^{re.escape(base)}-(\d+)$")
+                suffixes = [int(m.group(1)) for m in map(pattern.match, taken) if m]
+                next_suffix[base] = max(suffixes, default=1) + 1
+            while f"{base}-{next_suffix[base]}" in taken:
+                next_suffix[base] += 1
+            slug = f"{base}-{next_suffix[base]}"
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def save_with_slug(instance, save, *args, **kwargs):
+    """
+    Call ``save`` (the model's super().save) after giving ``instance`` a
+    unique slug from its name, retrying if a concurrent insert takes it.
+    """
+    model = type(instance)
+    for attempt in range(ATTEMPTS):
+        instance.slug = allocate_slugs(model, [instance.name])[0]
+        try:
+            with transaction.atomic():
+                return save(*args, **kwargs)
+        except IntegrityError:
+            lost_race = model._default_manager.filter(slug=instance.slug).exists()
+            if not lost_race or attempt == ATTEMPTS - 1:
+                instance.slug = ""
+                raise
+
+
+def bulk_create_with_slugs(model, objs, batch_size=500):
+    """
+    bulk_create() for models with a name-derived slug: objects without a slug
+    get one, allocated with a single query per batch.
+    """
+    created = []
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start : start + batch_size]
+        missing = [obj for obj in batch if not obj.slug]
+        for attempt in range(ATTEMPTS):
+            for obj, slug in zip(
+                missing, allocate_slugs(model, [obj.name for obj in missing])
+            ):
+                obj.slug = slug
+            try:
+                with transaction.atomic():
+                    created.extend(model._default_manager.bulk_create(batch))
+                break
+            except IntegrityError:
+                if attempt == ATTEMPTS - 1:
+                    raise
+    return created
+
+
+def slug_cache_key(model, slug):
+    return f"slug:{model._meta.label_lower}:{slug}"
+
+
+def resolve_slug(model, slug):
+    # Primary key for ``slug`` through the cached slug -> id map, or None
+    key = slug_cache_key(model, slug)
+    pk = cache.get(key)
+    if pk is None:
+        pk = model._default_manager.filter(slug=slug).values_list("pk", flat=True).first()
+        if pk is not None:
+            cache.set(key, pk, getattr(settings, "SLUG_CACHE_TIMEOUT", 300))
+    return pk
+
+
+def forget_slug(model, slug):
+    cache.delete(slug_cache_key(model, slug))
@@ -0,0 +1,30 @@
+from .models import ProductImage, ProductVariant
+
+
+def line_snapshots(variant_ids):
+    """
+    OrderItem snapshot fields for each variant id: the current price, the
+    sku, variant and product names and the product's first image URL, read
+    in two queries.
+    """
+    storage = ProductImage._meta.get_field("image_url").storage
+    images = {}
+    for product_id, name in (
+        ProductImage.objects.filter(product__variants__id__in=variant_ids)
+        .order_by("id")
+        .values_list("product_id", "image_url")
+    ):
+        images.setdefault(product_id, storage.url(name) if name else "")
+
+    return {
+        variant_id: {
+            "price": price,
+            "sku": sku,
+            "variant_name": variant_name,
+            "product_name": product_name,
+            "image_url": images.get(product_id, ""),
+        }
+        for variant_id, price, sku, variant_name, product_id, product_name in ProductVariant.objects.filter(
+            id__in=variant_ids
+        ).values_list("id", "price", "sku", "name", "product_id", "product__name")
+    }
@@ -0,0 +1,134 @@
+"""
+Low-stock alerts from per-SKU sales velocity.
+
+Daily units sold per variant are laid out as a variants x days NumPy matrix;
+rolling means over each window are taken from its cumulative sums, and the
+fastest recent rate is used to forecast the days left until stock runs out.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Notification, OrderItem, ProductVariant
+
+
+def rolling_mean(matrix, window):
+    # Mean over the trailing ``window`` days for every day from ``window`` on
+    totals = np.cumsum(matrix, axis=1)
+    totals = np.concatenate([np.zeros((matrix.shape[0], 1)), totals], axis=1)
+    return (totals[:, window:] - totals[:, :-window]) / window
+
+
+def days_until_stockout(stock, velocity):
+    stock = np.maximum(stock, 0).astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(velocity > 0, stock / velocity, np.inf)
+
+
+def daily_sales(variant_ids, start, days):
+    index = {variant_id: position for position, variant_id in enumerate(variant_ids)}
+    rows = (
+        OrderItem.objects.filter(order__created_at__date__gte=start)
+        .exclude(order__order_status="CANCELLED")
+        .annotate(day=TruncDate("order__created_at"))
+        .values("product_variant", "day")
+        .annotate(units=Sum("quantity"))
+        .values_list("product_variant", "day", "units")
+    )
+    matrix = np.zeros((len(variant_ids), days))
+    positions, offsets, units = [], [], []
+    for variant_id, day, quantity in rows:
+        offset = (day - start).days
+        if variant_id in index and 0 <= offset < days:
+            positions.append(index[variant_id])
+            offsets.append(offset)
+            units.append(quantity)
+    np.add.at(
+        matrix, (np.array(positions, dtype=int), np.array(offsets, dtype=int)), units
+    )
+    return matrix
+
+
+def forecast(windows=(7, 28), threshold=10, lead_days=7, today=None):
+    """
+    Forecast every variant's days until stockout and return the ones at or
+    below ``threshold`` units or expected to run out within ``lead_days``,
+    soonest first.
+    """
+    today = today or timezone.localdate()
+    days = max(windows)
+    start = today - timedelta(days=days - 1)
+
+    variants = list(ProductVariant.objects.order_by("id").values_list("id", "sku", "stock"))
+    if not variants:
+        return []
+    variant_ids, skus, stock = zip(*variants)
+    stock = np.array(stock)
+
+    matrix = daily_sales(variant_ids, start, days)
+    velocity = np.max([rolling_mean(matrix, window)[:, -1] for window in windows], axis=0)
+    remaining = days_until_stockout(stock, velocity)
+
+    flagged = np.flatnonzero((stock <= threshold) | (remaining <= lead_days))
+    flagged = flagged[np.argsort(remaining[flagged], kind="stable")]
+    return [
+        {
+            "product_variant": variant_ids[position],
+            "sku": skus[position],
+            "stock": int(stock[position]),
+            "velocity": round(float(velocity[position]), 2),
+            "days_until_stockout": (
+                round(float(remaining[position]), 1)
+                if np.isfinite(remaining[position])
+                else None
+            ),
+        }
+        for position in flagged
+    ]
+
+
+def alert_title(sku):
+    return f"Low Stock: {sku}"
+
+
+def notify_admins(low_stock):
+    """
+    Send each admin one notification per low-stock SKU, skipping SKUs the
+    admin still has an unread alert for, so a periodic run does not repeat
+    itself until the alert is read.
+    """
+    admin_ids = list(
+        User.objects.filter(profile__role__in=["ADMIN", "SUPER_ADMIN"]).values_list(
+            "id", flat=True
+        )
+    )
+    titles = {row["sku"]: alert_title(row["sku"]) for row in low_stock}
+    pending = set(
+        Notification.objects.filter(
+            user_id__in=admin_ids, title__in=titles.values(), is_read=False
+        ).values_list("user_id", "title")
+    )
+    notifications = [
+        Notification(
+            user_id=admin_id,
+            title=titles[row["sku"]],
+            message=(
+                f"{row['sku']} has {row['stock']} left"
+                + (
+                    f", about {row['days_until_stockout']:g} days of sales."
+                    if row["days_until_stockout"] is not None
+                    else "."
+                )
+            ),
+        )
+        for row in low_stock
+        for admin_id in admin_ids
+        if (admin_id, titles[row["sku"]]) not in pending
+    ]
+    Notification.objects.bulk_create(notifications, batch_size=500)
+    return len(notifications)
@@ -1,3 +1,1709 @@
-from django.test import TestCase
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+from importlib.util import find_spec
+from io import StringIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db.models import F, Sum
+from django.http import HttpResponse
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase, APITransactionTestCase
+
+from .access_log import BackgroundStreamHandler, JsonFormatter, RequestIdFilter, request_id
+from .coupons import index as coupon_index
+from .management.commands import profile_startup
+from .datagen import generate
+from .fast_serializers import (
+    order_values, product_values, serialize_cart, serialize_orders, serialize_products
+)
+from .fieldsets import FieldSelection
+from .identity import identity_map, prime
+from .metrics import metrics
+from .sku_index import index as sku_index
+from .slugs import bulk_create_with_slugs
+from .inventory import InsufficientStock, release_stock, reserve_stock
+from .middleware import LoadSheddingMiddleware
+from . import guest_carts, passwords
+from .models import *
+from .renderers import FastJSONRenderer
+from .serializers import CartSerializer, OrderSerializer, ProductSerializer
+from .throttling import LocalBucketStore, get_store
+
+
+class ShopTestCase(APITestCase):
+    """
+    A small catalogue (two products with one variant each), an admin and a
+    shopper with an address. Rate limits and caches start empty.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='manager', password='secret')
+        UserProfile.objects.create(user=cls.admin, role='ADMIN')
+        cls.user = User.objects.create_user(username='shopper', password='secret')
+        UserProfile.objects.create(user=cls.user)
+        cls.phones = Category.objects.create(name='Phones')
+        cls.cases = Category.objects.create(name='Cases')
+        cls.brand = Brand.objects.create(name='Acme')
+        cls.phone = Product.objects.create(name='Phone', category=cls.phones, brand=cls.brand, base_price=10)
+        cls.case = Product.objects.create(name='Case', category=cls.cases, brand=cls.brand, base_price=5)
+        cls.phone_variant = ProductVariant.objects.create(
+            product=cls.phone, sku='PHONE-1', name='Black', price=Decimal('10.00'), stock=100
+        )
+        cls.case_variant = ProductVariant.objects.create(
+            product=cls.case, sku='CASE-1', name='Clear', price=Decimal('5.00'), stock=100
+        )
+        cls.address = Address.objects.create(
+            user=cls.user, name='Home', street='1 Main St', city='Pune',
+            state='MH', country='India', zipcode='411001'
+        )
+
+    def setUp(self):
+        cache.clear()
+        get_store().clear()
+
+    def add_to_cart(self, variant, quantity=1, **headers):
+        return self.client.post(
+            '/cart/add/', {'product_variant': variant.id, 'quantity': quantity}, format='json', **headers
+        )
+
+    def checkout(self, lines=None, **data):
+        """
+        Order ``lines`` of (variant, quantity) as the shopper; by default two
+        phones and one case, 25.00 in all.
+        """
+        self.client.force_authenticate(self.user)
+        for variant, quantity in lines or [(self.phone_variant, 2), (self.case_variant, 1)]:
+            self.assertEqual(self.add_to_cart(variant, quantity).status_code, 201)
+        response = self.client.post('/orders/create/', {'address': self.address.id, **data}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def set_status(self, order_id, order_status):
+        self.client.force_authenticate(self.admin)
+        return self.client.put(
+            f'/orders/{order_id}/update-status/', {'order_status': order_status}, format='json'
+        )
+
+
+@override_settings(MEDIA_ROOT='/tmp/ecommerce-test-media')
+class FastSerializerTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', password='secret')
+        UserProfile.objects.create(user=cls.user)
+        category = Category.objects.create(name='Phones')
+        brand = Brand.objects.create(name='Acme')
+        address = Address.objects.create(
+            user=cls.user, name='Home', street='1 Main St', city='Pune',
+            state='MH', country='India', zipcode='411001'
+        )
+
+        cls.variants = []
+        for index in range(3):
+            product = Product.objects.create(
+                name=f'Phone {index}', description='Caf\u00e9 \u2028 line' if index else None,
+                category=category, brand=brand, base_price=Decimal('199.90'), stock=index
+            )
+            ProductImage.objects.create(
+                product=product,
+                image_url=SimpleUploadedFile(f'phone-{index}.png', b'png', content_type='image/png')
+            )
+            cls.variants.append(ProductVariant.objects.create(
+                product=product, sku=f'SKU-{index}', name='Black',
+                price=Decimal('10.5'), stock=5
+            ))
+        Product.objects.create(name='No variants', category=category, brand=brand, base_price=1)
+
+        cart = Cart.objects.create(user=cls.user)
+        CartItem.objects.create(cart=cart, product_variant=cls.variants[0], quantity=3)
+        CartItem.objects.create(cart=cart, product_variant=cls.variants[1], quantity=1)
+        Cart.objects.create(user=User.objects.create_user(username='empty', password='secret'))
+
+        for _ in range(2):
+            order = Order.objects.create(
+                user=cls.user, address=address, total_amount=Decimal('42.00'),
+                discount=Decimal('2.5'), grand_total=Decimal('39.50'), approved_by=cls.user
+            )
+            for variant in cls.variants[:2]:
+                OrderItem.objects.create(
+                    order=order, product_variant=variant, quantity=2, price=variant.price
+                )
+
+    def assertSameJSON(self, expected, actual):
+        self.assertEqual(JSONRenderer().render(expected), JSONRenderer().render(actual))
+        self.assertEqual(JSONRenderer().render(expected), FastJSONRenderer().render(actual))
+
+    def test_products_match_product_serializer(self):
+        request = Request(APIRequestFactory().get('/products/'))
+        queryset = Product.objects.order_by('id')
+        expected = ProductSerializer(queryset, many=True, context={'request': request}).data
+        self.assertSameJSON(expected, serialize_products(product_values(queryset), request))
+
+    def test_orders_match_order_serializer(self):
+        queryset = Order.objects.order_by('id')
+        expected = OrderSerializer(queryset, many=True).data
+        self.assertSameJSON(expected, serialize_orders(order_values(queryset)))
+
+    def test_cart_matches_cart_serializer(self):
+        for cart in Cart.objects.all():
+            self.assertSameJSON(CartSerializer(cart).data, serialize_cart(cart))
+
+    def test_hot_list_endpoints(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/orders/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+        response = self.client.get('/products/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 4)
+
+    def test_sparse_fieldsets_match_serializers(self):
+        request = Request(APIRequestFactory().get('/products/'))
+        selection = FieldSelection({'id': {}, 'name': {}, 'variants': {'sku': {}}}, None)
+        products = Product.objects.order_by('id')
+        expected = ProductSerializer(products, many=True, context={'request': request}, selection=selection).data
+        self.assertSameJSON(expected, serialize_products(product_values(products, selection), request, selection))
+
+        selection = FieldSelection({'id': {}, 'items': {}}, set())
+        orders = Order.objects.order_by('id')
+        expected = OrderSerializer(orders, many=True, selection=selection).data
+        self.assertSameJSON(expected, serialize_orders(order_values(orders, selection), selection))
+        self.assertEqual(expected[0]['items'][0]['product_variant'], self.variants[0].id)
+
+
+class SalesRollupTests(ShopTestCase):
+    def dashboard(self, query=''):
+        self.client.force_authenticate(self.admin)
+        return self.client.get(f'/dashboard/sales/{query}', HTTP_ACCEPT='application/json')
+
+    def test_checkout_and_cancellation_update_rollups(self):
+        order = self.checkout()
+        response = self.dashboard('?group_by=category')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.json()['totals']['gross']), Decimal('25'))
+        self.assertEqual(
+            {row['category__name']: Decimal(row['gross']) for row in response.json()['rows']},
+            {'Phones': Decimal('20'), 'Cases': Decimal('5')}
+        )
+
+        self.set_status(order['id'], 'CANCELLED')
+        self.assertEqual(Decimal(self.dashboard().json()['totals']['gross']), Decimal('0'))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.checkout()
+        incremental = sorted(SalesRollup.objects.values_list('category_id', 'units', 'gross'))
+        SalesRollup.objects.all().delete()
+        call_command('rebuild_sales_rollups', '--workers', '1', stdout=StringIO())
+        self.assertEqual(sorted(SalesRollup.objects.values_list('category_id', 'units', 'gross')), incremental)
+
+    def test_dashboard_rejects_bad_parameters(self):
+        for query in ('?start=2024-02-30', '?end=yesterday', '?start=2024-03-02&end=2024-03-01', '?group_by=user'):
+            self.assertEqual(self.dashboard(query).status_code, 400, query)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/dashboard/sales/').status_code, 403)
+
+    def test_rebuild_command_rejects_impossible_dates(self):
+        with self.assertRaises(CommandError):
+            call_command('rebuild_sales_rollups', '--start', '2024-02-30', stdout=StringIO())
+
+
+class OrderWorkflowTests(ShopTestCase):
+    def transition(self, ids, order_status, **data):
+        self.client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                '/orders/bulk-transition/', {'ids': ids, 'order_status': order_status, **data}, format='json'
+            )
+
+    def test_bulk_transition_reports_each_order(self):
+        first, second = self.checkout(), self.checkout()
+        response = self.transition([first['id'], second['id'], 999], 'APPROVED')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual([result['result'] for result in response.data['results']], ['ok', 'ok', 'not_found'])
+        self.assertEqual(Notification.objects.filter(title='Order Approved').count(), 2)
+        self.assertEqual(Order.objects.get(id=first['id']).approved_by, self.admin)
+
+        response = self.transition([first['id']], 'DELIVERED')
+        self.assertEqual(response.data['results'][0], {
+            'id': first['id'], 'result': 'invalid_transition', 'order_status': 'APPROVED'
+        })
+        response = self.transition([first['id']], 'SHIPPED', expected_status='PENDING')
+        self.assertEqual(response.data['updated'], 0)
+
+    def test_cancelling_restores_stock_once(self):
+        order = self.checkout()
+        self.assertEqual(self.set_status(order['id'], 'CANCELLED').status_code, 200)
+        self.assertEqual(self.transition([order['id']], 'CANCELLED').data['updated'], 0)
+        self.phone_variant.refresh_from_db()
+        self.phone.refresh_from_db()
+        self.assertEqual((self.phone_variant.stock, self.phone.stock), (100, 100))
+        self.assertEqual(self.client.post(f'/orders/{order["id"]}/approve/').status_code, 400)
+
+    def test_bad_requests(self):
+        order = self.checkout()
+        self.assertEqual(self.set_status(order['id'], 'BOGUS').status_code, 400)
+        self.assertEqual(self.transition([order['id']], 'BOGUS').status_code, 400)
+        self.assertEqual(self.transition([], 'APPROVED').status_code, 400)
+        self.assertEqual(self.transition(['x'], 'APPROVED').status_code, 400)
+        self.assertEqual(self.client.post('/orders/bulk-transition/', [1], format='json').status_code, 400)
+        response = self.client.put(f'/orders/{order["id"]}/update-status/', ['APPROVED'], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.get(pk=order['id']).order_status, 'PENDING')
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/orders/bulk-transition/', {'ids': [order['id']], 'order_status': 'APPROVED'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class IdempotencyTests(ShopTestCase):
+    def test_retried_cart_add_is_replayed(self):
+        self.client.force_authenticate(self.user)
+        first = self.add_to_cart(self.phone_variant, 2, HTTP_IDEMPOTENCY_KEY='add-1')
+        retry = self.add_to_cart(self.phone_variant, 2, HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+        response = self.add_to_cart(self.phone_variant, 3, HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(response.status_code, 422)
+        response = self.add_to_cart(self.phone_variant, 1, HTTP_IDEMPOTENCY_KEY='x' * 256)
+        self.assertEqual(response.status_code, 400)
+
+    def test_retried_checkout_creates_one_order(self):
+        self.checkout()
+        self.add_to_cart(self.phone_variant, 1)
+        data = {'address': self.address.id}
+        first = self.client.post('/orders/create/', data, format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+        retry = self.client.post('/orders/create/', data, format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_record_commits_with_the_order(self):
+        self.client.force_authenticate(self.user)
+        self.add_to_cart(self.phone_variant, 1)
+        data = {'address': self.address.id}
+        save = IdempotencyKey.save
+
+        def fail_on_response(record, *args, **kwargs):
+            if 'response_body' in kwargs.get('update_fields', ()):
+                raise RuntimeError('lost')
+            return save(record, *args, **kwargs)
+
+        # A failure writing the response rolls the order back with it
+        with mock.patch.object(IdempotencyKey, 'save', fail_on_response):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/orders/create/', data, format='json', HTTP_IDEMPOTENCY_KEY='order-2')
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(ProductVariant.objects.get(pk=self.phone_variant.pk).stock, 100)
+
+        response = self.client.post('/orders/create/', data, format='json', HTTP_IDEMPOTENCY_KEY='order-2')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_replay_keeps_the_cart_token(self):
+        token = self.add_to_cart(self.phone_variant)['X-Cart-Token']
+        first = self.add_to_cart(self.case_variant, 1, HTTP_X_CART_TOKEN=token, HTTP_IDEMPOTENCY_KEY='guest-1')
+        retry = self.add_to_cart(self.case_variant, 1, HTTP_X_CART_TOKEN=token, HTTP_IDEMPOTENCY_KEY='guest-1')
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry['X-Cart-Token'], first['X-Cart-Token'])
+        self.assertEqual(CartItem.objects.get(product_variant=self.case_variant).quantity, 1)
+
+    def test_keys_are_scoped_per_user(self):
+        self.client.force_authenticate(self.user)
+        self.add_to_cart(self.phone_variant, 1, HTTP_IDEMPOTENCY_KEY='shared')
+        self.client.force_authenticate(self.admin)
+        response = self.add_to_cart(self.phone_variant, 1, HTTP_IDEMPOTENCY_KEY='shared')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_in_flight_and_stale_keys(self):
+        self.client.force_authenticate(self.user)
+        self.add_to_cart(self.phone_variant, 1, HTTP_IDEMPOTENCY_KEY='slow')
+        IdempotencyKey.objects.update(status_code=None, locked_at=timezone.now())
+        response = self.add_to_cart(self.phone_variant, 1, HTTP_IDEMPOTENCY_KEY='slow')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+
+        # A crashed request's lock is taken over once it times out
+        IdempotencyKey.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.add_to_cart(self.phone_variant, 1, HTTP_IDEMPOTENCY_KEY='slow').status_code, 201)
+
+        # Expired keys are claimed afresh
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.add_to_cart(self.phone_variant, 1, HTTP_IDEMPOTENCY_KEY='slow')
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(CartItem.objects.get().quantity, 3)
+
+    def test_purge_command_removes_expired_keys(self):
+        self.client.force_authenticate(self.user)
+        self.add_to_cart(self.phone_variant, 1, HTTP_IDEMPOTENCY_KEY='old')
+        self.add_to_cart(self.case_variant, 1, HTTP_IDEMPOTENCY_KEY='new')
+        IdempotencyKey.objects.filter(key='old').update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('purge_idempotency_keys', stdout=StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+
+
+class RateLimitTests(ShopTestCase):
+    def login(self, username, **headers):
+        return self.client.post('/auth/login/', {'username': username, 'password': 'wrong'}, format='json', **headers)
+
+    def test_login_bucket_per_ip_and_username(self):
+        codes = [self.login('shopper').status_code for _ in range(6)]
+        self.assertEqual(codes, [401] * 5 + [429])
+        self.assertGreater(int(self.login('shopper')['Retry-After']), 0)
+
+        # The username bucket holds from another address, the IP bucket for another username
+        self.assertEqual(self.login('shopper', REMOTE_ADDR='10.0.0.2').status_code, 429)
+        self.assertEqual(self.login('manager').status_code, 429)
+        self.assertEqual(self.login('manager', REMOTE_ADDR='10.0.0.3').status_code, 401)
+
+    @override_settings(RATE_LIMIT_BUCKETS={'auth': {'capacity': 5, 'refill_rate': 1}, 'catalog': {'capacity': 2, 'refill_rate': 0.001}})
+    def test_catalog_bucket_is_per_client(self):
+        codes = [self.client.get('/categories/').status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/categories/').status_code, 200)
+
+    def test_forwarded_for_is_not_trusted(self):
+        # New usernames and forged addresses still share the REMOTE_ADDR bucket
+        codes = [self.login(f'nobody{n}', HTTP_X_FORWARDED_FOR=f'10.1.0.{n}').status_code for n in range(6)]
+        self.assertEqual(codes, [401] * 5 + [429])
+
+    def test_local_store_evicts_least_recently_used(self):
+        store = LocalBucketStore(max_keys=2)
+        self.assertEqual(store.consume('a', 1, 0.001, 0), 0)
+        self.assertEqual(store.consume('b', 1, 0.001, 0), 0)
+        # A new key pushes out the oldest bucket, not the others
+        self.assertEqual(store.consume('c', 1, 0.001, 0), 0)
+        self.assertGreater(store.consume('b', 1, 0.001, 0), 0)
+        self.assertGreater(store.consume('c', 1, 0.001, 0), 0)
+        self.assertEqual(store.consume('a', 1, 0.001, 0), 0)
+
+    @override_settings(RATE_LIMIT_STORE='cache')
+    def test_cache_store_shares_buckets(self):
+        codes = [self.login('shopper').status_code for _ in range(6)]
+        self.assertEqual(codes, [401] * 5 + [429])
+
+
+class LoadSheddingTests(TestCase):
+    @override_settings(LOAD_SHED_MAX_CONCURRENCY=1, LOAD_SHED_QUEUE_TIMEOUT=0, LOAD_SHED_RETRY_AFTER=3)
+    def test_rejects_when_all_slots_are_busy(self):
+        middleware = LoadSheddingMiddleware(lambda request: HttpResponse('ok'))
+        request = RequestFactory().get('/categories/')
+        self.assertEqual(middleware(request).status_code, 200)
+
+        middleware.slots.acquire()
+        response = middleware(request)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+        middleware.slots.release()
+        self.assertEqual(middleware(request).status_code, 200)
+        self.assertEqual((middleware.in_flight, middleware.waiting), (0, 0))
+
+    @override_settings(LOAD_SHED_MAX_CONCURRENCY=0)
+    def test_disabled(self):
+        middleware = LoadSheddingMiddleware(lambda request: HttpResponse('ok'))
+        middleware.slots.acquire()
+        self.assertEqual(middleware(RequestFactory().get('/')).status_code, 200)
+
+
+class ConditionalGetTests(ShopTestCase):
+    def get(self, path, etag=None, **extra):
+        if etag:
+            extra['HTTP_IF_NONE_MATCH'] = etag
+        return self.client.get(path, HTTP_ACCEPT='application/json', **extra)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'shop.example.com'])
+    def test_product_detail_revalidates(self):
+        path = f'/products/{self.phone.id}/'
+        response = self.get(path)
+        etag = response['ETag']
+        self.assertIn('public', response['Cache-Control'])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get(path, etag).status_code, 304)
+        self.assertNotEqual(self.get(f'{path}?fields=id', etag).status_code, 304)
+        self.assertEqual(self.get(path, etag, HTTP_HOST='shop.example.com').status_code, 200)
+
+        self.phone.name = 'Phone 2'
+        self.phone.save()
+        self.assertEqual(self.get(path, etag).status_code, 200)
+
+    def test_category_list_revalidates(self):
+        etag = self.get('/categories/')['ETag']
+        self.assertEqual(self.get('/categories/', etag).status_code, 304)
+        Category.objects.create(name='Tablets')
+        self.assertEqual(self.get('/categories/', etag).status_code, 200)
+
+    def test_lists_change_when_rows_go_away(self):
+        # Removing rows cannot move the newest updated_at, so lists must not
+        # answer If-Modified-Since with 304
+        since = http_date(time.time() + 60)
+        products, categories = self.get('/products/'), self.get('/categories/')
+        self.assertNotIn('Last-Modified', products)
+        self.assertNotIn('Last-Modified', categories)
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.patch(f'/products/{self.case.id}/', {'is_active': False}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.client.force_authenticate(None)
+        response = self.get('/products/', HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual((response.status_code, response.json()['count']), (200, 1))
+        self.assertEqual(self.get('/products/', products['ETag']).status_code, 200)
+
+        self.assertEqual(self.get('/categories/', categories['ETag']).status_code, 304)
+        Category.objects.filter(pk=self.cases.pk).delete()
+        response = self.get('/categories/', HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual((response.status_code, response.json()['count']), (200, 1))
+        self.assertEqual(self.get('/categories/', categories['ETag']).status_code, 200)
+
+    def test_cart_etag_follows_variant_stock(self):
+        self.client.force_authenticate(self.user)
+        self.add_to_cart(self.phone_variant, 1)
+        response = self.get('/cart/')
+        etag = response['ETag']
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.get('/cart/', etag).status_code, 304)
+
+        ProductVariant.objects.filter(pk=self.phone_variant.pk).update(
+            stock=7, updated_at=timezone.now() + timedelta(seconds=1)
+        )
+        response = self.get('/cart/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items'][0]['product_variant']['stock'], 7)
+
+    def test_order_detail_is_private_and_revalidates(self):
+        order = self.checkout()
+        response = self.get(f'/orders/{order["id"]}/')
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.get(f'/orders/{order["id"]}/', response['ETag']).status_code, 304)
+        self.assertEqual(self.get('/orders/999/').status_code, 404)
+
+
+class RecommendationTests(ShopTestCase):
+    def scores(self):
+        return dict(
+            ((product, related), score) for product, related, score in
+            ProductRecommendation.objects.values_list('product_id', 'related_product_id', 'score')
+        )
+
+    def test_orders_count_pairs_and_cancellations_remove_them(self):
+        first = self.checkout()
+        self.checkout()
+        self.assertEqual(self.scores(), {(self.phone.id, self.case.id): 2, (self.case.id, self.phone.id): 2})
+        self.set_status(first['id'], 'CANCELLED')
+        self.assertEqual(self.scores()[(self.phone.id, self.case.id)], 1)
+
+        second = Order.objects.exclude(id=first['id']).get()
+        self.set_status(second.id, 'CANCELLED')
+        self.assertEqual(self.scores(), {})
+
+    @override_settings(RECOMMENDATIONS_TOP_K=1)
+    def test_incremental_updates_keep_top_k(self):
+        charger = Product.objects.create(name='Charger', category=self.cases, brand=self.brand, base_price=3)
+        charger_variant = ProductVariant.objects.create(product=charger, sku='CHG-1', name='USB-C', price=3, stock=10)
+        self.checkout([(self.phone_variant, 1), (self.case_variant, 1)])
+        self.checkout([(self.phone_variant, 1), (self.case_variant, 1), (charger_variant, 1)])
+        self.assertEqual(ProductRecommendation.objects.filter(product=self.phone).count(), 1)
+        self.assertEqual(ProductRecommendation.objects.get(product=self.phone).related_product, self.case)
+
+    def test_rebuild_matches_incremental_counts(self):
+        self.checkout()
+        self.checkout()
+        incremental = self.scores()
+        ProductRecommendation.objects.all().delete()
+        call_command('build_recommendations', stdout=StringIO())
+        self.assertEqual(self.scores(), incremental)
+
+    def test_related_endpoint(self):
+        self.checkout()
+        expected = [{'id': self.case.id, 'name': 'Case', 'slug': 'case', 'base_price': '5.00', 'score': 1}]
+        for key in (self.phone.id, self.phone.slug):
+            response = self.client.get(f'/products/{key}/related/', HTTP_ACCEPT='application/json')
+            self.assertEqual(response.json(), expected)
+        self.assertEqual(self.client.get('/products/nope/related/').status_code, 404)
+        self.assertEqual(self.client.get(f'/products/{self.phone.id}/related/?limit=x').status_code, 400)
+
+        Product.objects.filter(pk=self.case.pk).update(is_active=False)
+        self.assertEqual(self.client.get(f'/products/{self.phone.id}/related/', HTTP_ACCEPT='application/json').json(), [])
+
+
+class InventoryTests(ShopTestCase):
+    def stock(self):
+        self.phone_variant.refresh_from_db()
+        self.phone.refresh_from_db()
+        return self.phone_variant.stock, self.phone.stock
+
+    def test_product_stock_is_sum_of_variants(self):
+        ProductVariant.objects.create(product=self.phone, sku='PHONE-2', name='White', price=10, stock=5)
+        self.assertEqual(self.stock(), (100, 105))
+        self.phone_variant.delete()
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 5)
+
+    def test_reserve_is_all_or_nothing(self):
+        reserve_stock({self.phone_variant.id: 30, self.case_variant.id: 1})
+        self.assertEqual(self.stock(), (70, 70))
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_stock({self.phone_variant.id: 1, self.case_variant.id: 100})
+        self.assertEqual(raised.exception.variant_ids, [self.case_variant.id])
+        self.assertEqual(self.stock(), (70, 70))
+
+        release_stock({self.phone_variant.id: 30})
+        release_stock({})
+        self.assertEqual(self.stock(), (100, 100))
+
+    def test_checkout_over_stock_is_rejected(self):
+        ProductVariant.objects.filter(pk=self.phone_variant.pk).update(stock=1)
+        self.client.force_authenticate(self.user)
+        self.add_to_cart(self.phone_variant, 1)
+        CartItem.objects.filter(cart__user=self.user).update(quantity=2)
+        Cart.objects.filter(user=self.user).update(item_count=2)
+        response = self.client.post('/orders/create/', {'address': self.address.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['product_variants'], [self.phone_variant.id])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.stock()[0], 1)
+        self.assertEqual(CartItem.objects.filter(cart__user=self.user).count(), 1)
+
+
+class StockForecastTests(ShopTestCase):
+    def forecast(self, *args):
+        out = StringIO()
+        call_command('forecast_stock', *args, stdout=out)
+        return out.getvalue()
+
+    def test_fast_sellers_are_flagged(self):
+        self.checkout([(self.phone_variant, 50)])
+        from .stock_forecast import forecast
+        rows = forecast(windows=(1,), threshold=0, lead_days=2)
+        self.assertEqual([row['sku'] for row in rows], ['PHONE-1'])
+        self.assertEqual(rows[0]['velocity'], 50)
+        self.assertEqual(rows[0]['days_until_stockout'], 1)
+
+    def test_alerts_are_not_repeated_while_unread(self):
+        ProductVariant.objects.filter(pk=self.phone_variant.pk).update(stock=3)
+        self.assertIn('PHONE-1: stock 3', self.forecast('--dry-run'))
+        self.assertFalse(Notification.objects.exists())
+
+        self.forecast()
+        self.forecast()
+        alerts = Notification.objects.filter(user=self.admin, title='Low Stock: PHONE-1')
+        self.assertEqual(alerts.count(), 1)
+        self.assertFalse(Notification.objects.filter(user=self.user).exists())
+
+        alerts.update(is_read=True)
+        self.forecast()
+        self.assertEqual(alerts.count(), 2)
+
+    def test_bad_windows(self):
+        with self.assertRaises(CommandError):
+            self.forecast('--windows', '0,7')
+        with self.assertRaises(CommandError):
+            self.forecast('--windows', 'week')
+
+
+class ArchiveTests(ShopTestCase):
+    def archive(self):
+        out = StringIO()
+        call_command('archive_history', '--order-days', '-1', '--notification-days', '-1', stdout=out)
+        return out.getvalue()
+
+    def deliver(self, order_id):
+        Order.objects.filter(id=order_id).update(order_status='DELIVERED')
+
+    def test_archived_orders_still_open(self):
+        order = self.checkout()
+        pending = self.checkout()
+        self.deliver(order['id'])
+        Notification.objects.create(user=self.user, title='Read', message='m', is_read=True)
+        Notification.objects.create(user=self.user, title='Unread', message='m')
+        self.client.force_authenticate(self.user)
+        before = self.client.get(f'/orders/{order["id"]}/', HTTP_ACCEPT='application/json').json()
+
+        self.assertIn('1 notifications and 1 orders', self.archive())
+        self.assertEqual(list(Order.objects.values_list('id', flat=True)), [pending['id']])
+        self.assertEqual(list(Notification.objects.values_list('title', flat=True)), ['Unread'])
+        response = self.client.get(f'/orders/{order["id"]}/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), before)
+        self.assertEqual(self.client.get(
+            f'/orders/{order["id"]}/', HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=response['ETag']
+        ).status_code, 304)
+
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(f'/orders/{order["id"]}/').status_code, 200)
+        stranger = User.objects.create_user(username='stranger')
+        self.client.force_authenticate(stranger)
+        self.assertEqual(self.client.get(f'/orders/{order["id"]}/').status_code, 404)
+
+    def test_rebuilds_keep_archived_sales(self):
+        for _ in range(2):
+            self.deliver(self.checkout()['id'])
+        self.checkout([(self.phone_variant, 1)])
+        rollups = sorted(SalesRollup.objects.values_list('category_id', 'orders', 'units', 'gross', 'net'))
+        recommendations = sorted(ProductRecommendation.objects.values_list('product_id', 'related_product_id', 'score'))
+        self.archive()
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+
+        call_command('rebuild_sales_rollups', '--workers', '1', stdout=StringIO())
+        call_command('build_recommendations', stdout=StringIO())
+        self.assertEqual(sorted(SalesRollup.objects.values_list('category_id', 'orders', 'units', 'gross', 'net')), rollups)
+        self.assertEqual(sorted(ProductRecommendation.objects.values_list('product_id', 'related_product_id', 'score')), recommendations)
+
+    def test_rebuild_range_covers_archive_only_days(self):
+        order = self.checkout()
+        self.deliver(order['id'])
+        self.archive()
+        SalesRollup.objects.all().delete()
+        call_command('rebuild_sales_rollups', '--workers', '1', stdout=StringIO())
+        self.assertEqual(SalesRollup.objects.aggregate(total=Sum('gross'))['total'], Decimal('25'))
+
+
+class OrderSnapshotTests(ShopTestCase):
+    def test_lines_keep_what_was_bought(self):
+        ProductImage.objects.create(product=self.phone, image_url='products/phone.png')
+        order = self.checkout()
+        line = order['items'][0]
+        self.assertEqual(line['product_variant'], {
+            'id': self.phone_variant.id, 'sku': 'PHONE-1', 'name': 'Black', 'price': '10.00'
+        })
+        self.assertEqual(line['product_name'], 'Phone')
+        self.assertTrue(line['image_url'].endswith('products/phone.png'))
+
+        ProductVariant.objects.filter(pk=self.phone_variant.pk).update(name='Renamed', sku='PHONE-X', price=99)
+        Product.objects.filter(pk=self.phone.pk).update(name='Renamed phone')
+        detail = self.client.get(f'/orders/{order["id"]}/', HTTP_ACCEPT='application/json').json()
+        self.assertEqual(detail['items'][0], line)
+        listed = self.client.get('/orders/', HTTP_ACCEPT='application/json').json()
+        self.assertEqual(listed[0], detail)
+
+    def test_lines_without_images(self):
+        order = self.checkout([(self.case_variant, 1)])
+        self.assertEqual(order['items'][0]['image_url'], '')
+        self.assertEqual(OrderItem.objects.get().sku, 'CASE-1')
+
+
+class SlugTests(ShopTestCase):
+    def create(self, name):
+        return Product.objects.create(name=name, category=self.phones, brand=self.brand, base_price=1)
+
+    def test_duplicate_names_get_numbered_slugs(self):
+        self.assertEqual([self.create('iPhone Case').slug for _ in range(2)], ['iphone-case', 'iphone-case-2'])
+        created = bulk_create_with_slugs(Product, [
+            Product(name=name, category=self.phones, brand=self.brand, base_price=1)
+            for name in ['iPhone Case', 'iPhone Case', 'iPhone Case 2', '!!!']
+        ])
+        self.assertEqual([product.slug for product in created], ['iphone-case-3', 'iphone-case-4', 'iphone-case-2-2', 'item'])
+        self.assertEqual(Category.objects.create(name='Phones!').slug, 'phones-2')
+
+    def test_products_resolve_by_slug(self):
+        product = self.create('Desk Lamp')
+        response = self.client.get('/products/desk-lamp/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['id'], product.id)
+        self.assertEqual(self.client.get('/products/nope/').status_code, 404)
+
+    def test_renamed_and_deleted_slugs_stop_resolving(self):
+        product = self.create('Desk Lamp')
+        self.assertEqual(self.client.get('/products/desk-lamp/').status_code, 200)
+        product.slug = 'table-lamp'
+        product.save()
+        self.assertEqual(self.client.get('/products/desk-lamp/').status_code, 404)
+        self.assertEqual(self.client.get('/products/table-lamp/').status_code, 200)
+
+        product.delete()
+        self.assertEqual(self.client.get('/products/table-lamp/').status_code, 404)
+
+
+# Worker threads would use their own connections, outside the test transaction
+@override_settings(BATCH_MAX_WORKERS=1)
+class BatchTests(ShopTestCase):
+    def batch(self, requests):
+        return self.client.post('/batch/', {'requests': requests}, format='json')
+
+    def test_sub_requests_run_in_order_with_their_own_permissions(self):
+        self.client.force_authenticate(self.user)
+        response = self.batch([
+            {'method': 'GET', 'path': '/categories/'},
+            {'method': 'POST', 'path': '/cart/add/', 'body': {'product_variant': self.phone_variant.id, 'quantity': 2}},
+            {'method': 'GET', 'path': '/cart/'},
+            {'method': 'GET', 'path': '/nope/'},
+            {'method': 'POST', 'path': '/batch/', 'body': {}},
+            {'method': 'POST', 'path': '/orders/bulk-transition/', 'body': {'ids': [1], 'order_status': 'APPROVED'}},
+        ])
+        self.assertEqual(response.status_code, 200)
+        responses = response.data['responses']
+        self.assertEqual([sub['status'] for sub in responses], [200, 201, 200, 404, 400, 403])
+        self.assertEqual(responses[2]['body']['item_count'], 2)
+        self.assertIn('ETag', responses[0]['headers'])
+
+    def test_idempotency_key_is_not_shared_with_sub_requests(self):
+        self.client.force_authenticate(self.user)
+        add = {'method': 'POST', 'path': '/cart/add/', 'body': {'product_variant': self.phone_variant.id}}
+        response = self.client.post('/batch/', {'requests': [add, add]}, format='json', HTTP_IDEMPOTENCY_KEY='batch')
+        self.assertEqual([sub['status'] for sub in response.data['responses']], [201, 201])
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+    @override_settings(BATCH_MAX_REQUESTS=2)
+    def test_invalid_batches(self):
+        for requests in (
+            [], 'GET /', [{'path': '/'}] * 3, ['GET /'], [{'method': 'TRACE', 'path': '/'}],
+            [{'path': 'categories/'}], [{'path': '/', 'headers': []}],
+        ):
+            self.assertEqual(self.batch(requests).status_code, 400, requests)
+        self.assertEqual(self.client.post('/batch/', [1], format='json').status_code, 400)
+
+
+class ThreadedBatchTests(APITransactionTestCase):
+    def test_concurrent_reads(self):
+        user = User.objects.create_user(username='reader')
+        UserProfile.objects.create(user=user)
+        Category.objects.create(name='Phones')
+        self.client.force_authenticate(user)
+        requests = [{'method': 'GET', 'path': '/categories/'}] * 3 + [{'method': 'GET', 'path': '/auth/profile/'}]
+        response = self.client.post('/batch/', {'requests': requests}, format='json')
+        self.assertEqual([sub['status'] for sub in response.data['responses']], [200] * 4)
+        self.assertEqual(response.data['responses'][3]['body']['user']['username'], 'reader')
+
+    def test_access_log_counts_worker_queries(self):
+        user = User.objects.create_user(username='reader')
+        Category.objects.create(name='Phones')
+        self.client.force_authenticate(user)
+        with self.assertLogs('core.access', 'INFO') as logs:
+            self.client.get('/categories/')
+            self.client.post('/batch/', {'requests': [{'method': 'GET', 'path': '/categories/'}] * 3}, format='json')
+        single, batch = (record.payload['queries'] for record in logs.records)
+        self.assertGreater(single, 0)
+        self.assertGreaterEqual(batch, 3 * single)
+
+
+class IdentityMapTests(ShopTestCase):
+    def test_lookups_share_one_instance(self):
+        with identity_map():
+            with self.assertNumQueries(1):
+                variant = ProductVariant.objects.get(pk=self.phone_variant.pk)
+                self.assertIs(ProductVariant.objects.get(id=str(self.phone_variant.pk)), variant)
+            with self.assertNumQueries(1):
+                self.assertIs(ProductVariant.objects.get(sku='CASE-1'), ProductVariant.objects.get(sku='CASE-1'))
+            # Filtered querysets and misses go to the database
+            with self.assertNumQueries(2):
+                ProductVariant.objects.filter(stock__gt=0).get(pk=self.phone_variant.pk)
+                with self.assertRaises(ProductVariant.DoesNotExist):
+                    ProductVariant.objects.get(pk=0)
+        with self.assertNumQueries(2):
+            ProductVariant.objects.get(pk=self.phone_variant.pk)
+            ProductVariant.objects.get(pk=self.phone_variant.pk)
+
+    def test_saves_evict(self):
+        with identity_map():
+            variant = ProductVariant.objects.get(pk=self.phone_variant.pk)
+            variant.stock = 5
+            variant.save()
+            fresh = ProductVariant.objects.get(pk=variant.pk)
+            self.assertIsNot(fresh, variant)
+            self.assertEqual(fresh.stock, 5)
+
+    def test_primed_foreign_keys_load_together(self):
+        cart = Cart.objects.create(user=self.user)
+        items = [
+            CartItem.objects.create(cart=cart, product_variant=variant, quantity=1)
+            for variant in (self.phone_variant, self.case_variant)
+        ]
+        with identity_map():
+            items = list(CartItem.objects.filter(cart=cart))
+            prime(items, 'product_variant')
+            with self.assertNumQueries(1):
+                self.assertEqual({item.product_variant.sku for item in items}, {'PHONE-1', 'CASE-1'})
+
+
+class PasswordTests(ShopTestCase):
+    def login(self, username, password):
+        return self.client.post('/auth/login/', {'username': username, 'password': password}, format='json')
+
+    def test_legacy_hashes_are_upgraded_on_login(self):
+        from django.contrib.auth.hashers import make_password
+        user = User.objects.create(username='legacy', password=make_password('Secret-pw-123', hasher='pbkdf2_sha256'))
+        UserProfile.objects.create(user=user)
+        self.assertEqual(self.login('legacy', 'wrong').status_code, 401)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+
+        self.assertEqual(self.login('legacy', 'Secret-pw-123').status_code, 200)
+        user.refresh_from_db()
+        self.assertFalse(passwords.must_update(user.password))
+        self.assertTrue(user.check_password('Secret-pw-123'))
+        self.assertEqual(self.login('nobody', 'Secret-pw-123').status_code, 401)
+
+    def test_register_hashes_with_the_preferred_hasher(self):
+        response = self.client.post(
+            '/auth/register/', {'username': 'new', 'email': 'New@EXAMPLE.com', 'password': 'Secret-pw-123'}, format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        user = User.objects.get(username='new')
+        self.assertEqual(user.email, 'New@example.com')
+        self.assertFalse(passwords.must_update(user.password))
+        self.assertTrue(user.check_password('Secret-pw-123'))
+
+    def test_helpers(self):
+        encoded = passwords.make_password('pw')
+        self.assertTrue(passwords.check_password('pw', encoded))
+        self.assertFalse(passwords.check_password('other', encoded))
+        self.assertTrue(asyncio.run(passwords.acheck_password('pw', asyncio.run(passwords.amake_password('pw')))))
+        self.assertTrue(passwords.must_update('pbkdf2_sha256$1$salt$hash'))
+        self.assertFalse(passwords.must_update('not a hash'))
+        self.assertFalse(passwords.create_user('nopassword').has_usable_password())
+
+    # Inline hashing: pool workers keep the settings they started with
+    @skipIf(find_spec('argon2'), 'Argon2 is the preferred hasher when installed')
+    @override_settings(
+        PASSWORD_HASH_WORKERS=0,
+        PASSWORD_HASHER_PROFILE={'scrypt': {'work_factor': 2 ** 10, 'block_size': 8, 'parallelism': 1}}
+    )
+    def test_profile_changes_trigger_rehash(self):
+        cheap = passwords.make_password('pw')
+        self.assertIn('$1024$', cheap)
+        with override_settings(PASSWORD_HASHER_PROFILE={'scrypt': {'work_factor': 2 ** 11, 'block_size': 8, 'parallelism': 1}}):
+            self.assertTrue(passwords.must_update(cheap))
+
+
+class AdminChangelistTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.browser = Client()
+        self.browser.force_login(User.objects.create_superuser('root', 'root@example.com', 'secret'))
+
+    def test_changelists_render(self):
+        self.checkout()
+        for model in ['order', 'orderitem', 'product', 'productvariant', 'review', 'notification', 'changeevent']:
+            self.assertEqual(self.browser.get(f'/admin/core/{model}/').status_code, 200, model)
+        self.assertEqual(self.browser.get('/admin/core/order/add/').status_code, 200)
+
+    def changelist_queries(self, model):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.browser.get(f'/admin/core/{model}/').status_code, 200)
+        return len(queries)
+
+    def test_changelists_do_not_query_per_row(self):
+        models = ['order', 'orderitem', 'productvariant', 'review', 'cartitem']
+        self.checkout()
+        Review.objects.create(user=self.user, product=self.phone, rating=5, comment='Good')
+        self.client.force_authenticate(self.user)
+        self.add_to_cart(self.phone_variant, 1)
+        before = {model: self.changelist_queries(model) for model in models}
+
+        self.checkout()
+        self.checkout()
+        Review.objects.create(user=self.admin, product=self.case, rating=4, comment='Fine')
+        ProductVariant.objects.create(product=self.case, sku='CASE-2', name='Black', price=5, stock=1)
+        self.client.force_authenticate(self.admin)
+        self.add_to_cart(self.case_variant, 1)
+        after = {model: self.changelist_queries(model) for model in models}
+        self.assertEqual(after, before)
+
+        # Rows join only what the columns show
+        with CaptureQueriesContext(connection) as queries:
+            self.browser.get('/admin/core/orderitem/')
+        rows = next(query['sql'] for query in queries.captured_queries if '"core_orderitem"."sku"' in query['sql'])
+        self.assertIn('"auth_user"', rows)
+        self.assertNotIn('"core_productvariant"', rows)
+
+    def test_counts_are_estimated_only_past_the_threshold(self):
+        self.checkout()
+        self.checkout()
+        with override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1):
+            self.assertContains(self.browser.get('/admin/core/order/'), '2 orders')
+        response = self.browser.get('/admin/core/order/?order_status__exact=PENDING')
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_csv_export_streams_selected_rows(self):
+        orders = [self.checkout()['id'] for _ in range(2)]
+        response = self.browser.post('/admin/core/order/', {'action': 'export_as_csv', '_selected_action': orders})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith('id,user_id,user__username'))
+        self.assertEqual(len(lines), 3)
+
+
+class GuestCartTests(ShopTestCase):
+    def add_as_guest(self, variant, quantity=1, token=None):
+        headers = {'HTTP_X_CART_TOKEN': token} if token else {}
+        return self.add_to_cart(variant, quantity, **headers)
+
+    def login(self, token):
+        return self.client.post('/auth/login/', {'username': 'shopper', 'password': 'secret', 'cart_token': token}, format='json')
+
+    def guest_cart(self):
+        response = self.add_as_guest(self.phone_variant, 2)
+        token = response['X-Cart-Token']
+        self.add_as_guest(self.case_variant, 1, token)
+        return token
+
+    def test_first_add_creates_cart_and_token(self):
+        response = self.add_as_guest(self.phone_variant, 2)
+        self.assertEqual(response.status_code, 201)
+        cart = guest_carts.get_guest_cart(response['X-Cart-Token'])
+        self.assertIsNone(cart.user)
+        self.assertEqual((cart.item_count, cart.subtotal), (2, Decimal('20.00')))
+
+    def test_unknown_variant_creates_no_cart(self):
+        response = self.client.post('/cart/add/', {'product_variant': 999999}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('X-Cart-Token', response)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_writes_slide_expiry_and_reissue_token(self):
+        token = self.add_as_guest(self.phone_variant)['X-Cart-Token']
+        cart = guest_carts.get_guest_cart(token)
+        Cart.objects.filter(pk=cart.pk).update(expires_at=timezone.now() + timedelta(minutes=1))
+
+        response = self.add_as_guest(self.case_variant, 1, token)
+        self.assertEqual(guest_carts.guest_cart_id(response['X-Cart-Token']), cart.pk)
+        cart.refresh_from_db()
+        self.assertGreater(cart.expires_at, timezone.now() + timedelta(days=6))
+
+    def test_bad_or_expired_token_gets_a_new_cart(self):
+        token = self.add_as_guest(self.phone_variant)['X-Cart-Token']
+        self.assertIsNone(guest_carts.guest_cart_id(token + 'x'))
+        Cart.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(guest_carts.get_guest_cart(token))
+
+        response = self.add_as_guest(self.case_variant, 1, token)
+        self.assertNotEqual(guest_carts.guest_cart_id(response['X-Cart-Token']), guest_carts.guest_cart_id(token))
+        self.assertEqual(Cart.objects.count(), 2)
+
+    def test_login_adopts_guest_cart(self):
+        token = self.guest_cart()
+        guest_id = guest_carts.guest_cart_id(token)
+        self.assertEqual(self.login(token).status_code, 200)
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(cart.pk, guest_id)
+        self.assertIsNone(cart.expires_at)
+        self.assertIsNone(guest_carts.get_guest_cart(token))
+
+    def assert_merged(self):
+        token = self.guest_cart()
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product_variant=self.phone_variant, quantity=1, unit_price=Decimal('10.00'))
+        self.assertEqual(self.login(token).status_code, 200)
+
+        cart.refresh_from_db()
+        quantities = dict(cart.items.values_list('product_variant__sku', 'quantity'))
+        self.assertEqual(quantities, {'PHONE-1': 3, 'CASE-1': 1})
+        self.assertEqual((cart.item_count, cart.subtotal), (4, Decimal('35.00')))
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertEqual(CartItem.objects.count(), 2)
+
+    def test_login_merges_into_existing_cart(self):
+        self.assert_merged()
+
+    def test_merge_without_upsert_statement(self):
+        with mock.patch.dict(guest_carts.MERGE_SQL, clear=True):
+            self.assert_merged()
+
+    def test_purge_deletes_expired_guest_carts(self):
+        token = self.guest_cart()
+        self.add_as_guest(self.phone_variant)
+        Cart.objects.filter(pk=guest_carts.guest_cart_id(token)).update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('purge_guest_carts', stdout=StringIO())
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertEqual(CartItem.objects.count(), 1)
+
+    @override_settings(RATE_LIMIT_BUCKETS={'cart': {'capacity': 2, 'refill_rate': 0.001}})
+    def test_anonymous_writes_are_throttled(self):
+        codes = [self.add_as_guest(self.phone_variant).status_code for _ in range(3)]
+        self.assertEqual(codes, [201, 201, 429])
+        self.assertEqual(self.client.get('/cart/').status_code, 200)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.add_to_cart(self.phone_variant).status_code, 201)
+
+
+class CartLinesTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def patch_lines(self, items):
+        return self.client.patch('/cart/', {'items': items}, format='json')
+
+    def test_replaces_cart_contents(self):
+        self.add_to_cart(self.phone_variant, 3)
+        response = self.patch_lines([
+            {'product_variant': self.case_variant.id, 'quantity': 2},
+            {'product_variant': self.case_variant.id},
+        ])
+        self.assertEqual(response.status_code, 200)
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(dict(cart.items.values_list('product_variant__sku', 'quantity')), {'CASE-1': 3})
+        self.assertEqual((cart.item_count, cart.subtotal), (3, Decimal('15.00')))
+
+    def test_updates_and_removes_existing_lines(self):
+        self.add_to_cart(self.phone_variant, 3)
+        self.add_to_cart(self.case_variant, 1)
+        self.patch_lines([{'product_variant': self.phone_variant.id, 'quantity': 1}])
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(dict(cart.items.values_list('product_variant__sku', 'quantity')), {'PHONE-1': 1})
+        self.assertEqual((cart.item_count, cart.subtotal), (1, Decimal('10.00')))
+
+        self.patch_lines([])
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal, cart.items.count()), (0, Decimal('0.00'), 0))
+
+    def test_rejects_invalid_lines_without_changes(self):
+        self.add_to_cart(self.phone_variant, 1)
+        cases = [
+            ('not a list', None),
+            ([{'quantity': 1}], None),
+            ([{'product_variant': True, 'quantity': 2}], None),
+            ([{'product_variant': self.phone_variant.id, 'quantity': 2.7}], None),
+            ([{'product_variant': float(self.phone_variant.id)}], None),
+            ([{'product_variant': self.phone_variant.id, 'quantity': False}], None),
+            ([[self.phone_variant.id, 1]], None),
+            ([{'product_variant': self.phone_variant.id, 'quantity': -1}], [self.phone_variant.id]),
+            ([{'product_variant': 999999}], [999999]),
+            ([{'product_variant': self.case_variant.id, 'quantity': 101}], [self.case_variant.id]),
+        ]
+        for items, variant_ids in cases:
+            response = self.patch_lines(items)
+            self.assertEqual(response.status_code, 400, items)
+            self.assertEqual(response.json().get('product_variants'), variant_ids)
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual((cart.item_count, cart.subtotal), (1, Decimal('10.00')))
+
+    def test_non_object_body_is_rejected(self):
+        response = self.client.patch('/cart/', [{'product_variant': self.phone_variant.id}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_guest_patch_creates_cart_only_when_valid(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.patch_lines([{'product_variant': 999999}]).status_code, 400)
+        self.assertFalse(Cart.objects.exists())
+        response = self.patch_lines([{'product_variant': self.phone_variant.id, 'quantity': 2}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(guest_carts.get_guest_cart(response['X-Cart-Token']).item_count, 2)
+
+
+class CartTotalsTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def cart(self):
+        return Cart.objects.get(user=self.user)
+
+    def test_add_update_remove_keep_totals(self):
+        item = self.add_to_cart(self.phone_variant, 2).json()
+        self.add_to_cart(self.phone_variant, 1)
+        self.add_to_cart(self.case_variant, 1)
+        self.assertEqual((self.cart().item_count, self.cart().subtotal), (4, Decimal('35.00')))
+
+        response = self.client.put(f'/cart/update/{item["id"]}/', {'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((self.cart().item_count, self.cart().subtotal), (2, Decimal('15.00')))
+
+        self.assertEqual(self.client.delete(f'/cart/remove/{item["id"]}/').status_code, 204)
+        self.assertEqual((self.cart().item_count, self.cart().subtotal), (1, Decimal('5.00')))
+        self.assertEqual(self.client.get('/cart/summary/').json(), {'item_count': 1, 'subtotal': 5.0})
+
+    def test_invalid_quantities_are_rejected(self):
+        for quantity in [0, -1, 'abc', 2.5, True, None]:
+            response = self.add_to_cart(self.phone_variant, quantity)
+            self.assertEqual(response.status_code, 400, quantity)
+        self.assertFalse(CartItem.objects.exists())
+
+        item = self.add_to_cart(self.phone_variant, 2).json()
+        for data in [{'quantity': 0}, {'quantity': -3}, {'quantity': 'x'}, {}]:
+            response = self.client.put(f'/cart/update/{item["id"]}/', data, format='json')
+            self.assertEqual(response.status_code, 400, data)
+        self.assertEqual(self.cart().item_count, 2)
+
+    def test_saved_items_take_the_variant_price(self):
+        # Lines created outside the cart helpers (admin, scripts) used to cost nothing
+        cart = Cart.objects.create(user=self.user)
+        item = CartItem.objects.create(cart=cart, product_variant=self.phone_variant, quantity=2)
+        self.assertEqual(item.unit_price, Decimal('10.00'))
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (2, Decimal('20.00')))
+
+        order = self.client.post('/orders/create/', {'address': self.address.id}, format='json').json()
+        self.assertEqual(Decimal(order['total_amount']), Decimal('20.00'))
+
+    def test_checkout_charges_the_variant_price(self):
+        self.add_to_cart(self.phone_variant, 2)
+        CartItem.objects.update(unit_price=0)
+        order = self.checkout(lines=[(self.case_variant, 1)])
+        self.assertEqual(Decimal(order['total_amount']), Decimal('25.00'))
+        self.assertEqual(
+            sorted(OrderItem.objects.filter(order_id=order['id']).values_list('sku', 'price')),
+            [('CASE-1', Decimal('5.00')), ('PHONE-1', Decimal('10.00'))]
+        )
+        self.assertEqual((self.cart().item_count, self.cart().subtotal, self.cart().items.count()), (0, 0, 0))
+
+    def test_checkout_without_a_cart(self):
+        response = self.client.post('/orders/create/', {'address': self.address.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_checkout_rejects_non_object_bodies(self):
+        self.add_to_cart(self.phone_variant, 1)
+        response = self.client.post('/orders/create/', [self.address.id], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_price_changes_reprice_lines(self):
+        self.add_to_cart(self.phone_variant, 2)
+        self.phone_variant.price = Decimal('12.50')
+        self.phone_variant.save()
+        self.assertEqual(self.cart().subtotal, Decimal('25.00'))
+        ProductVariant.objects.filter(pk=self.phone_variant.pk).update(price=Decimal('11.00'))
+        self.assertEqual(self.cart().subtotal, Decimal('25.00'))
+
+    def test_model_deletes_recount_the_cart(self):
+        self.add_to_cart(self.phone_variant, 2)
+        self.add_to_cart(self.case_variant, 1)
+        CartItem.objects.get(product_variant=self.case_variant).delete()
+        self.assertEqual((self.cart().item_count, self.cart().subtotal), (2, Decimal('20.00')))
+
+
+class CouponTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        # The index outlives the rolled-back rows of earlier tests
+        coupon_index.invalidate()
+
+    def make_coupon(self, code='SAVE10', **fields):
+        fields = {
+            'discount_type': 'PERCENT', 'value': Decimal('10'), 'usage_limit': 1,
+            'expiry_date': timezone.now() + timedelta(days=1), **fields
+        }
+        return Coupon.objects.create(code=code, **fields)
+
+    def validate(self, code):
+        self.client.force_authenticate(self.user)
+        return self.client.get('/coupons/validate_coupon/', {'code': code})
+
+    def test_validate_only_live_coupons(self):
+        self.make_coupon()
+        self.make_coupon('OLD', expiry_date=timezone.now() - timedelta(seconds=1))
+        self.make_coupon('USED', used_count=1)
+        self.assertEqual(self.validate('SAVE10').json()['code'], 'SAVE10')
+        for code in ['OLD', 'USED', 'NOPE', '']:
+            self.assertEqual(self.validate(code).status_code, 404, code)
+
+    def test_non_string_codes_match_nothing(self):
+        self.make_coupon()
+        for code in [['SAVE10'], {'code': 'SAVE10'}, 10]:
+            self.assertIsNone(coupon_index.lookup(code))
+        order = self.checkout(coupon_code=['SAVE10'])
+        self.assertEqual(Decimal(order['discount']), 0)
+
+    def test_checkout_applies_and_redeems(self):
+        coupon = self.make_coupon(usage_limit=2)
+        order = self.checkout(coupon_code='SAVE10')
+        self.assertEqual(
+            (Decimal(order['total_amount']), Decimal(order['discount']), Decimal(order['grand_total'])),
+            (Decimal('25.00'), Decimal('2.50'), Decimal('22.50'))
+        )
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 1)
+
+    def test_below_minimum_is_not_redeemed(self):
+        coupon = self.make_coupon('FIVE', discount_type='FIXED', value=Decimal('5'), min_amount=Decimal('30'))
+        order = self.checkout(coupon_code='FIVE')
+        self.assertEqual(Decimal(order['discount']), 0)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 0)
+
+    def test_usage_limit_holds_across_checkouts(self):
+        coupon = self.make_coupon()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.checkout(coupon_code='SAVE10')
+        # This process's copy caught up, so the coupon is no longer offered
+        self.assertEqual(self.validate('SAVE10').status_code, 404)
+        order = self.checkout(coupon_code='SAVE10')
+        self.assertEqual(Decimal(order['discount']), 0)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 1)
+
+    def test_stale_index_cannot_overspend(self):
+        coupon = self.make_coupon()
+        coupon_index.lookup('SAVE10')
+        # Redeemed by another process: no signal reaches this index
+        Coupon.objects.filter(pk=coupon.pk).update(used_count=1)
+        self.client.force_authenticate(self.user)
+        self.add_to_cart(self.phone_variant, 2)
+        response = self.client.post('/orders/create/', {'address': self.address.id, 'coupon_code': 'SAVE10'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(ProductVariant.objects.get(pk=self.phone_variant.pk).stock, 100)
+        self.assertEqual(Cart.objects.get(user=self.user).item_count, 2)
+        # The failed redemption dropped the index
+        self.assertIsNone(coupon_index.lookup('SAVE10'))
+
+    def test_expired_while_indexed(self):
+        coupon = self.make_coupon(usage_limit=5)
+        coupon_index.lookup('SAVE10')
+        Coupon.objects.filter(pk=coupon.pk).update(expiry_date=timezone.now() - timedelta(seconds=1))
+        self.client.force_authenticate(self.user)
+        self.add_to_cart(self.case_variant, 1)
+        response = self.client.post('/orders/create/', {'address': self.address.id, 'coupon_code': 'SAVE10'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 0)
+
+    def test_index_follows_saves_and_ttl(self):
+        coupon = self.make_coupon()
+        self.assertIsNotNone(coupon_index.lookup('SAVE10'))
+        coupon.usage_limit = 0
+        coupon.save()
+        self.assertIsNone(coupon_index.lookup('SAVE10'))
+
+        Coupon.objects.filter(pk=coupon.pk).update(usage_limit=5)
+        self.assertIsNone(coupon_index.lookup('SAVE10'))
+        with override_settings(COUPON_INDEX_TTL=-1):
+            self.assertIsNotNone(coupon_index.lookup('SAVE10'))
+
+
+class AccessLogTests(ShopTestCase):
+    def logged(self, path='/categories/', **headers):
+        with self.assertLogs('core.access', 'INFO') as logs:
+            response = self.client.get(path, **headers)
+        return response, logs.records[-1].payload
+
+    def test_request_id_is_echoed_or_generated(self):
+        response, payload = self.logged(HTTP_X_REQUEST_ID='abc-1')
+        self.assertEqual((response['X-Request-ID'], payload['request_id']), ('abc-1', 'abc-1'))
+
+        for bad in ['bad id!', 'x' * 65]:
+            response, payload = self.logged(HTTP_X_REQUEST_ID=bad)
+            self.assertNotEqual(response['X-Request-ID'], bad)
+            self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+            self.assertEqual(payload['request_id'], response['X-Request-ID'])
+
+    @override_settings(ACCESS_LOG_SQL_SAMPLE_RATE=0, ACCESS_LOG_SLOW_MS=10 ** 6)
+    def test_payload_without_sql(self):
+        self.client.force_authenticate(self.user)
+        response, payload = self.logged('/cart/')
+        self.assertEqual(
+            {key: payload[key] for key in ['method', 'path', 'view', 'status', 'user_id']},
+            {'method': 'GET', 'path': '/cart/', 'view': 'view-cart', 'status': 200, 'user_id': self.user.pk}
+        )
+        self.assertGreater(payload['queries'], 0)
+        self.assertNotIn('sql', payload)
+
+        response, payload = self.logged('/no-such-page/')
+        self.assertEqual((payload['status'], payload['view'], payload['user_id']), (404, None, None))
+
+    @override_settings(ACCESS_LOG_SQL_SAMPLE_RATE=0, ACCESS_LOG_SLOW_MS=0, ACCESS_LOG_MAX_QUERIES=1)
+    def test_slow_requests_carry_capped_sql(self):
+        self.client.force_authenticate(self.user)
+        response, payload = self.logged('/cart/')
+        self.assertTrue(payload['slow'])
+        self.assertGreater(payload['queries'], 1)
+        self.assertEqual(len(payload['sql']), 1)
+        self.assertEqual(set(payload['sql'][0]), {'sql', 'ms'})
+
+    @override_settings(ACCESS_LOG_SQL_SAMPLE_RATE=1, ACCESS_LOG_SLOW_MS=10 ** 6)
+    def test_sampled_requests_carry_sql(self):
+        response, payload = self.logged()
+        self.assertFalse(payload['slow'])
+        self.assertEqual(len(payload['sql']), payload['queries'])
+
+    def test_background_handler_writes_json_lines(self):
+        stream = StringIO()
+        handler = BackgroundStreamHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        handler.addFilter(RequestIdFilter())
+        record = logging.LogRecord('core.access', logging.INFO, __file__, 1, 'hello %s', ('world',), None)
+        record.payload = {'status': 200}
+        token = request_id.set('rid-1')
+        try:
+            handler.handle(record)
+        finally:
+            request_id.reset(token)
+        handler.close()
+        entry = json.loads(stream.getvalue())
+        self.assertEqual(
+            {key: entry[key] for key in ['message', 'request_id', 'status', 'level']},
+            {'message': 'hello world', 'request_id': 'rid-1', 'status': 200, 'level': 'INFO'}
+        )
+
+    def test_full_queue_drops_records(self):
+        handler = BackgroundStreamHandler(StringIO(), queue_size=1)
+        handler.close()
+        before = metrics.snapshot()['counters'].get('access_log.dropped', 0)
+        record = logging.LogRecord('core.access', logging.INFO, __file__, 1, 'x', None, None)
+        handler.enqueue(record)
+        handler.enqueue(record)
+        self.assertEqual(metrics.snapshot()['counters']['access_log.dropped'], before + 1)
+
+
+class DatagenTests(TestCase):
+    sizes = {'users': 5, 'categories': 4, 'brands': 3, 'products': 12, 'orders': 30, 'reviews': 10, 'batch_size': 7}
+
+    def fingerprint(self, prefix):
+        orders = Order.objects.filter(user__username__startswith=f'{prefix}-').order_by('id')
+        ids = list(orders.values_list('id', flat=True))
+        return (
+            [ids.index(pk) for pk in orders.order_by('created_at', 'id').values_list('id', flat=True)],
+            list(orders.values_list('order_status', 'payment_status', 'total_amount')),
+            list(OrderItem.objects.filter(order__in=orders).order_by('id').values_list('quantity', 'price')),
+            list(Review.objects.filter(user__username__startswith=f'{prefix}-').order_by('id').values_list('rating', flat=True)),
+        )
+
+    def test_creates_consistent_rows(self):
+        created = generate(prefix='a', **self.sizes)
+        self.assertEqual(
+            {name: created[name] for name in ['users', 'categories', 'brands', 'products', 'orders', 'reviews']},
+            {name: self.sizes[name] for name in ['users', 'categories', 'brands', 'products', 'orders', 'reviews']}
+        )
+        self.assertEqual(ProductVariant.objects.filter(sku__startswith='a-').count(), created['variants'])
+        self.assertEqual(User.objects.filter(username__startswith='a-', profile__role='USER', addresses__isnull=False).count(), 5)
+        for order in Order.objects.annotate(lines=Sum(F('items__quantity') * F('items__price'))):
+            self.assertEqual(order.total_amount, order.lines)
+            self.assertEqual(order.grand_total, order.total_amount)
+            self.assertEqual(order.payment_status == 'PAID', order.order_status not in ('PENDING', 'CANCELLED'))
+        self.assertFalse(Review.objects.exclude(rating__in=range(1, 6)).exists())
+        dates = Order.objects.dates('created_at', 'day')
+        self.assertGreater(len(dates), 1)
+        self.assertGreater(dates.last() - dates.first(), timedelta(days=1))
+        self.assertFalse(Order.objects.filter(created_at__lt=timezone.now() - timedelta(days=365)).exists())
+
+    def test_same_seed_gives_the_same_rows(self):
+        generate(prefix='a', seed=3, **self.sizes)
+        generate(prefix='b', seed=3, **self.sizes)
+        generate(prefix='c', seed=4, **self.sizes)
+        self.assertEqual(self.fingerprint('a'), self.fingerprint('b'))
+        self.assertNotEqual(self.fingerprint('a'), self.fingerprint('c'))
+
+    def test_sqlite_generates_in_process(self):
+        log = []
+        generate(prefix='a', workers=4, log=log.append, **self.sizes)
+        self.assertIn('one writer', log[0])
+        self.assertEqual(Order.objects.count(), 30)
+
+    def test_command_validates_arguments(self):
+        for args in [['--users', '0'], ['--orders', '-1'], ['--batch-size', '0'], ['--days', '-1']]:
+            with self.assertRaises(CommandError):
+                call_command('generate_data', *args, stdout=StringIO())
+        out = StringIO()
+        call_command(
+            'generate_data', '--users', '2', '--categories', '2', '--brands', '1', '--products', '3',
+            '--orders', '4', '--reviews', '2', '--prefix', 'cmd', stdout=out
+        )
+        self.assertIn('4 orders', out.getvalue())
+        self.assertEqual(Order.objects.filter(user__username__startswith='cmd-').count(), 4)
+
+
+class LazyJWTTests(ShopTestCase):
+    def login(self):
+        response = self.client.post('/auth/login/', {'username': 'shopper', 'password': 'secret'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_bearer_tokens_authenticate(self):
+        tokens = self.login()
+        response = self.client.get('/auth/profile/', HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+        self.assertEqual(response.json()['user']['username'], 'shopper')
+
+    def test_bad_tokens_are_rejected(self):
+        response = self.client.get('/auth/profile/', HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(response['WWW-Authenticate'].startswith('Bearer'))
+        self.assertEqual(self.client.get('/auth/profile/').status_code, 401)
+
+    def test_token_refresh(self):
+        tokens = self.login()
+        response = self.client.post('/auth/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/auth/profile/', HTTP_AUTHORIZATION=f'Bearer {response.json()["access"]}')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/auth/token/refresh/', {'refresh': tokens['access']}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_simplejwt_is_not_loaded_at_boot(self):
+        code = (
+            'import sys, django; django.setup(); '
+            'from django.urls import resolve; resolve("/categories/"); '
+            'print("rest_framework_simplejwt" in sys.modules)'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'ecommerce_project.settings'}
+        )
+        self.assertEqual(result.stdout.strip(), 'False')
+
+
+class ProfileStartupTests(TestCase):
+    report = (
+        'import time: self [us] | cumulative | imported package\n'
+        'import time:       120 |        120 |   json.decoder\n'
+        'import time:      3000 |       5000 | core.views\n'
+        'import time:       900 |      90000 | django\n'
+        'unrelated line\n'
+    )
+
+    def test_parse_importtime(self):
+        self.assertEqual(
+            profile_startup.parse_importtime(self.report),
+            [('json.decoder', 120, 120), ('core.views', 3000, 5000), ('django', 900, 90000)]
+        )
+
+    def run_command(self, *args):
+        probe = mock.patch.object(
+            profile_startup.Command, 'probe',
+            return_value=({'setup': 0.2, 'request': 0.1, 'status': '200 OK', 'total': 0.4}, self.report)
+        )
+        out = StringIO()
+        with probe:
+            call_command('profile_startup', *args, stdout=out)
+        return out.getvalue()
+
+    def test_reports_boot_time_and_imports(self):
+        output = self.run_command('--repeat', '2', '--top', '1')
+        self.assertIn('median 400 ms', output)
+        self.assertIn('90.0', output)
+        self.assertNotIn('json.decoder', output)
+        self.assertIn('core.views', output.split('Project modules')[1])
+
+    def test_budget_and_arguments(self):
+        self.assertIn('median', self.run_command('--repeat', '1', '--budget-ms', '500'))
+        with self.assertRaisesMessage(CommandError, 'over the 300 ms budget'):
+            self.run_command('--repeat', '1', '--budget-ms', '300')
+        with self.assertRaises(CommandError):
+            self.run_command('--repeat', '0')
+
+
+class SkuIndexTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        sku_index.clear()
+
+    def resolve(self, data):
+        return self.client.post('/variants/resolve/', data, format='json')
+
+    def test_resolves_in_request_order(self):
+        response = self.resolve({'skus': ['CASE-1', 'NOPE', 'PHONE-1', 'CASE-1']})
+        self.assertEqual(response.json(), {
+            'variants': [
+                {'sku': 'CASE-1', 'id': self.case_variant.id, 'price': '5.00', 'stock': 100},
+                {'sku': 'PHONE-1', 'id': self.phone_variant.id, 'price': '10.00', 'stock': 100},
+            ],
+            'missing': ['NOPE'],
+        })
+
+    @override_settings(SKU_RESOLVE_MAX=2)
+    def test_rejects_bad_bodies(self):
+        for data in [['PHONE-1'], {'skus': 'PHONE-1'}, {'skus': ['PHONE-1', 1]}, {}, {'skus': ['A', 'B', 'C']}]:
+            self.assertEqual(self.resolve(data).status_code, 400, data)
+
+    def test_hits_skip_the_database(self):
+        sku_index.resolve(['PHONE-1', 'NOPE'])
+        with self.assertNumQueries(0):
+            self.assertEqual(list(sku_index.resolve(['PHONE-1'])), ['PHONE-1'])
+        # Misses are not remembered, so a new variant shows up at once
+        with self.assertNumQueries(1):
+            self.assertEqual(sku_index.resolve(['NOPE']), {})
+
+    def test_variant_and_stock_changes_evict(self):
+        sku_index.resolve(['PHONE-1', 'CASE-1'])
+        self.phone_variant.price = Decimal('12.00')
+        self.phone_variant.save()
+        reserve_stock({self.case_variant.id: 4})
+        found = sku_index.resolve(['PHONE-1', 'CASE-1'])
+        self.assertEqual((found['PHONE-1']['price'], found['CASE-1']['stock']), ('12.00', 96))
+
+        self.case_variant.delete()
+        self.assertEqual(list(sku_index.resolve(['CASE-1'])), [])
+
+    def test_ttl_and_size_limit(self):
+        sku_index.resolve(['PHONE-1'])
+        ProductVariant.objects.filter(pk=self.phone_variant.pk).update(stock=7)
+        self.assertEqual(sku_index.resolve(['PHONE-1'])['PHONE-1']['stock'], 100)
+        with override_settings(SKU_INDEX_TTL=-1):
+            self.assertEqual(sku_index.resolve(['PHONE-1'])['PHONE-1']['stock'], 7)
+
+        with override_settings(SKU_INDEX_MAX_SIZE=1):
+            sku_index.resolve(['CASE-1'])
+            with self.assertNumQueries(1):
+                sku_index.resolve(['PHONE-1'])
+
+
+class ChangeFeedTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        self.start = ChangeEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    def feed(self, since=None, **params):
+        response = self.client.get('/changes/', {'since': self.start if since is None else since, **params})
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        return response, lines
+
+    def test_admins_only(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/changes/').status_code, 401)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/changes/').status_code, 403)
+
+    def test_bad_parameters(self):
+        for params in [{'since': 'x'}, {'limit': 'y'}, {'since': -1}, {'limit': 0}]:
+            self.assertEqual(self.client.get('/changes/', params).status_code, 400, params)
+
+    def test_initial_feed_covers_the_catalogue(self):
+        response, lines = self.feed(since=0)
+        self.assertEqual(
+            {(line['entity'], line['id']) for line in lines},
+            {('product', self.phone.id), ('product', self.case.id),
+             ('variant', self.phone_variant.id), ('variant', self.case_variant.id)}
+        )
+        self.assertEqual(response['X-More-Changes'], 'false')
+        self.assertEqual(int(response['X-Next-Cursor']), lines[-1]['cursor'])
+
+    def test_compacts_to_the_latest_state(self):
+        for price in ['11.00', '12.00', '13.00']:
+            self.phone_variant.price = Decimal(price)
+            self.phone_variant.save()
+        reserve_stock({self.phone_variant.id: 5})
+        response, lines = self.feed()
+        variants = [line for line in lines if line['entity'] == 'variant']
+        self.assertEqual(len(variants), 1)
+        self.assertEqual(variants[0]['op'], 'upsert')
+        self.assertEqual((variants[0]['data']['price'], variants[0]['data']['stock']), ('13.00', 95))
+        self.assertEqual(ChangeEvent.objects.filter(id__gt=self.start, entity='variant').count(), 4)
+        self.assertEqual(len(lines), len({(line['entity'], line['id']) for line in lines}))
+
+    def test_pages_follow_the_cursor(self):
+        for product in [self.phone, self.case]:
+            product.name += ' v2'
+            product.save()
+        self.phone_variant.save()
+        _, everything = self.feed()
+        self.assertGreater(len(everything), 2)
+
+        pages, since, more = [], self.start, 'true'
+        while more == 'true':
+            response, lines = self.feed(since=since, limit=2)
+            self.assertLessEqual(len(lines), 2)
+            pages.extend(lines)
+            since, more = response['X-Next-Cursor'], response['X-More-Changes']
+        self.assertEqual(pages, everything)
+        self.assertEqual([line['cursor'] for line in pages], sorted(line['cursor'] for line in pages))
+
+        response, empty = self.feed(since=since)
+        self.assertEqual((empty, response['X-Next-Cursor']), ([], str(pages[-1]['cursor'])))
+
+    def test_deletes_and_inactive_rows(self):
+        discount = Discount.objects.create(
+            name='Sale', discount_type='PERCENT', value=10, is_active=False,
+            start_date=timezone.now(), end_date=timezone.now() + timedelta(days=1)
+        )
+        variant_id = self.case_variant.id
+        self.case_variant.delete()
+        response, lines = self.feed()
+        by_entity = {line['entity']: line for line in lines}
+        self.assertEqual((by_entity['variant']['id'], by_entity['variant']['op']), (variant_id, 'delete'))
+        self.assertIsNone(by_entity['variant']['data'])
+        self.assertEqual((by_entity['discount']['id'], by_entity['discount']['data']['is_active']), (discount.id, False))
+
+    def test_settle_holds_back_recent_events(self):
+        self.phone.save()
+        with override_settings(CHANGES_SETTLE_SECONDS=60):
+            response, lines = self.feed()
+            self.assertEqual((lines, int(response['X-Next-Cursor'])), ([], self.start))
+        ChangeEvent.objects.filter(id__gt=self.start).update(created_at=timezone.now() - timedelta(minutes=2))
+        with override_settings(CHANGES_SETTLE_SECONDS=60):
+            response, lines = self.feed()
+        self.assertEqual([line['id'] for line in lines], [self.phone.id])
+
+    def test_purge_keeps_recent_events(self):
+        self.phone.save()
+        ChangeEvent.objects.filter(id__lte=self.start).update(created_at=timezone.now() - timedelta(days=31))
+        out = StringIO()
+        call_command('purge_change_events', '--batch-size', '1', stdout=out)
+        self.assertIn(f'Deleted {self.start} change events', out.getvalue())
+        self.assertEqual(list(ChangeEvent.objects.values_list('entity_id', flat=True)), [self.phone.id])
+
+
+class SparseFieldsetEndpointTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        ProductImage.objects.create(product=self.phone, image_url='products/phone.jpg')
+
+    def fetch(self, path, **params):
+        """
+        The response data and the SQL that built it, leaving out the ETag
+        version lookup, which joins the related tables on purpose.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        sql = [query['sql'] for query in queries.captured_queries]
+        return response.json(), ' '.join(query for query in sql if 'AS "pk"' not in query)
+
+    def test_product_fields_prune_queries(self):
+        data, sql = self.fetch(f'/products/{self.phone.id}/', fields='id,name')
+        self.assertEqual(set(data), {'id', 'name'})
+        for skipped in ['core_productimage', 'core_productvariant', 'core_category', '"description"']:
+            self.assertNotIn(skipped, sql)
+
+        data, sql = self.fetch(f'/products/{self.phone.id}/', fields='id,category_name,variants.sku')
+        self.assertEqual(data, {'id': self.phone.id, 'category_name': 'Phones', 'variants': [{'sku': 'PHONE-1'}]})
+        self.assertIn('core_category', sql)
+        self.assertNotIn('core_productimage', sql)
+        self.assertNotIn('core_brand', sql)
+
+    def test_full_product_fetches_everything(self):
+        data, sql = self.fetch(f'/products/{self.phone.id}/')
+        self.assertIn('description', data)
+        self.assertEqual(len(data['images']), 1)
+        for table in ['core_productimage', 'core_productvariant', 'core_category', 'core_brand']:
+            self.assertIn(table, sql)
+
+    def test_order_detail_fields_and_expand(self):
+        order = self.checkout()
+        data, sql = self.fetch(f'/orders/{order["id"]}/', fields='id,grand_total')
+        self.assertEqual(data, {'id': order['id'], 'grand_total': '25.00'})
+        self.assertNotIn('core_orderitem', sql)
+        self.assertNotIn('auth_user', sql.split('FROM "core_order"')[-1])
+
+        data, _ = self.fetch(f'/orders/{order["id"]}/', fields='id,items.quantity,items.product_variant', expand='')
+        self.assertEqual(
+            sorted(data['items'], key=lambda item: item['quantity']),
+            [{'quantity': 1, 'product_variant': self.case_variant.id},
+             {'quantity': 2, 'product_variant': self.phone_variant.id}]
+        )
+        data, _ = self.fetch(f'/orders/{order["id"]}/', fields='items.product_variant', expand='items.product_variant')
+        self.assertEqual(
+            {item['product_variant']['sku'] for item in data['items']}, {'PHONE-1', 'CASE-1'}
+        )
+
+    def test_order_list_fields(self):
+        self.checkout()
+        self.checkout()
+        data, sql = self.fetch('/orders/', fields='id,order_status')
+        self.assertEqual([set(order) for order in data], [{'id', 'order_status'}] * 2)
+        self.assertNotIn('core_orderitem', sql)
+        self.assertNotIn('"grand_total"', sql)
+
+        data, sql = self.fetch('/orders/')
+        self.assertIn('core_orderitem', sql)
+        self.assertEqual(len(data[0]['items']), 2)
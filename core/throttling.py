@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from .metrics import metrics
+
+
+class LocalBucketStore:
+    """
+    Token buckets kept in this process. Fast, but every worker counts separately.
+    Past ``max_keys`` the least recently used bucket is dropped, so a flood of
+    new clients cannot reset the buckets of active ones.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, now):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens, wait = take_token(tokens, updated, capacity, refill_rate, now)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Token buckets shared by all workers through the default cache. The
+    read-modify-write is not atomic, so bursts across workers can slightly
+    exceed the configured capacity.
+    """
+
+    prefix = "ratelimit"
+
+    def consume(self, key, capacity, refill_rate, now):
+        cache_key = f"{self.prefix}:{key}"
+        tokens, updated = cache.get(cache_key, (capacity, now))
+        tokens, wait = take_token(tokens, updated, capacity, refill_rate, now)
+        cache.set(cache_key, (tokens, now), timeout=int(capacity / refill_rate) + 1)
+        return wait
+
+    def clear(self):
+        pass
+
+
+def take_token(tokens, updated, capacity, refill_rate, now):
+    """
+    Refill the bucket for the time elapsed since ``updated`` and take one
+    token. Returns the new token count and the seconds to wait (0 if allowed).
+    """
+    tokens = min(capacity, tokens + (now - updated) * refill_rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / refill_rate
+
+
+_stores = {"local": LocalBucketStore(), "cache": CacheBucketStore()}
+
+
+def get_store():
+    return _stores[getattr(settings, "RATE_LIMIT_STORE", "local")]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket rate limit keyed by client (user id, or IP for anonymous
+    requests) and endpoint. Buckets are configured per scope in
+    settings.RATE_LIMIT_BUCKETS as {'capacity': ..., 'refill_rate': ...}
+    with refill_rate in tokens per second.
+    """
+
+    scope = None
+
+    def __init__(self):
+        self.wait_seconds = 0
+
+    def get_bucket(self):
+        return settings.RATE_LIMIT_BUCKETS[self.scope]
+
+    def get_idents(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return [f"user:{request.user.pk}"]
+        return [f"ip:{self.get_ident(request)}"]
+
+    def allow_request(self, request, view):
+        bucket = self.get_bucket()
+        store = get_store()
+        now = time.monotonic() if store is _stores["local"] else time.time()
+        endpoint = view.__class__.__name__
+
+        for ident in self.get_idents(request, view):
+            key = f"{self.scope}:{endpoint}:{ident}"
+            wait = store.consume(key, bucket["capacity"], bucket["refill_rate"], now)
+            if wait:
+                self.wait_seconds = wait
+                metrics.incr(f"throttle.{self.scope}.throttled")
+                return False
+
+        metrics.incr(f"throttle.{self.scope}.allowed")
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class CatalogRateThrottle(TokenBucketThrottle):
+    scope = "catalog"
+
+
+class GuestCartRateThrottle(TokenBucketThrottle):
+    """
+    Cart writes by anonymous clients, which can create a guest cart each.
+    Reads and signed-in users are not limited.
+    """
+
+    scope = "cart"
+
+    def allow_request(self, request, view):
+        if request.method in SAFE_METHODS or request.user.is_authenticated:
+            return True
+        return super().allow_request(request, view)
+
+
+class AuthRateThrottle(TokenBucketThrottle):
+    """
+    Stricter bucket for login and registration, which spend most of their
+    time hashing passwords. Login attempts are limited per IP and per username.
+    """
+
+    scope = "auth"
+
+    def get_idents(self, request, view):
+        idents = [f"ip:{self.get_ident(request)}"]
+        username = request.data.get("username") if hasattr(request, "data") else None
+        if isinstance(username, str) and username:
+            idents.append(f"username:{username.lower()}")
+        return idents
@@ -1,6 +1,5 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import TokenRefreshView
 from . import views
 
 router = DefaultRouter()
@@ -16,13 +15,14 @@ urlpatterns = [
 
     path("auth/register/", views.RegisterView.as_view(), name="register"),
     path("auth/login/", views.LoginView.as_view(), name="login"),
-    path("auth/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("auth/token/refresh/", views.token_refresh, name="token_refresh"),
     path("auth/profile/", views.ProfileView.as_view(), name="profile"),
     path("auth/create-admin/", views.CreateAdminView.as_view(), name="create-admin"),
     path("auth/users/", views.ListUsersView.as_view(), name="list-users"),
 
     # Cart
     path("cart/", views.CartView.as_view(), name="view-cart"),
+    path("cart/summary/", views.CartSummaryView.as_view(), name="cart-summary"),
     path("cart/add/", views.AddToCartView.as_view(), name="add-to-cart"),
     path("cart/update/<int:item_id>/", views.UpdateCartItemView.as_view(), name="update-cart-item"),
     path("cart/remove/<int:item_id>/", views.RemoveCartItemView.as_view(), name="remove-cart-item"),
@@ -30,11 +30,21 @@ urlpatterns = [
     # Orders
     path("orders/create/", views.CreateOrderView.as_view(), name="create-order"),
     path("orders/", views.ListOrdersView.as_view(), name="list-orders"),
+    path("orders/bulk-transition/", views.BulkOrderTransitionView.as_view(), name="bulk-order-transition"),
     path("orders/<int:order_id>/", views.OrderDetailView.as_view(), name="order-detail"),
     path("orders/<int:order_id>/update-status/", views.UpdateOrderStatusView.as_view(), name="update-order-status"),
     path("orders/<int:order_id>/approve/", views.ApproveOrderView.as_view(), name="approve-order"),
 
+    # Batch
+    path("batch/", views.BatchView.as_view(), name="batch"),
+
+    # Dashboard
+    path("metrics/", views.MetricsView.as_view(), name="metrics"),
+    path("dashboard/sales/", views.SalesDashboardView.as_view(), name="sales-dashboard"),
+
     # Reviews
+    path("variants/resolve/", views.ResolveSkusView.as_view(), name="resolve-skus"),
+    path("changes/", views.ChangesView.as_view(), name="changes"),
     path("products/<int:product_id>/reviews/", views.CreateReviewView.as_view(), name="create-review"),
     path("reviews/<int:review_id>/", views.DeleteReviewView.as_view(), name="delete-review"),
 
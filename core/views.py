@@ -1,18 +1,65 @@
+from decimal import Decimal
+
 from rest_framework import viewsets, status, views
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.http import StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.models import User
-from .models import *
-from .serializers import *
-from .permissions import *
-from datetime import datetime
+from .models import (
+    Address, ArchivedOrder, Brand, Cart, CartItem, Category, Coupon, Discount, Notification, Order,
+    OrderItem, Product, ProductImage, ProductRecommendation, ProductVariant, Review, SalesRollup,
+    UserProfile
+)
+from .serializers import (
+    AddressSerializer, BrandSerializer, CartItemSerializer, CategorySerializer, CouponSerializer,
+    DiscountSerializer, NotificationSerializer, OrderSerializer, ProductSerializer,
+    ProductVariantSerializer, RegisterSerializer, ReviewSerializer, UserProfileSerializer,
+    UserSerializer
+)
+from .permissions import IsAdminOrSuperAdmin, IsSuperAdmin
+from .guest_carts import (
+    HEADER as GUEST_CART_HEADER, attach_token, get_guest_cart, get_request_cart, guest_cart_id,
+    guest_carts, merge_guest_cart
+)
+from .coupons import CouponUnavailable, discount_for, index as coupon_index, redeem as redeem_coupon
+from .cart_totals import add_item, clear_cart, remove_item, set_quantity
+from .cart_lines import CartLinesError, apply_lines, parse_lines, parse_quantity
+from .inventory import InsufficientStock, reserve_stock
+from .passwords import create_user
+from .rollups import apply_order
+from .snapshots import line_snapshots
+from .slugs import resolve_slug
+from .sku_index import index as sku_index
+from .changes import compacted_changes, ndjson_lines
+from .batch import BatchError, run_batch, validate as validate_batch
+from .recommendations import record_order
+from .order_workflow import InvalidStatus, transition_orders
+from .idempotency import idempotent
+from .throttling import AuthRateThrottle, CatalogRateThrottle, GuestCartRateThrottle
+from .metrics import metrics
+from .renderers import fast_renderer_classes
+from .conditional import (
+    PRIVATE_NO_CACHE, ConditionalGetMixin, conditional_get
+)
+from .fieldsets import FieldSelection, includes, only_fields, select_fields
+from .fast_serializers import (
+    order_values, price, product_values, serialize_cart, serialize_orders, serialize_products
+)
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
 # Authentication Views
 class RegisterView(views.APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [AuthRateThrottle]
     
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
@@ -29,6 +76,7 @@ class RegisterView(views.APIView):
 
 class LoginView(views.APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [AuthRateThrottle]
     
     def post(self, request):
         username = request.data.get('username')
@@ -37,6 +85,13 @@ class LoginView(views.APIView):
         user = authenticate(username=username, password=password)
         
         if user:
+            guest = get_guest_cart(request.headers.get(GUEST_CART_HEADER) or request.data.get('cart_token'))
+            if guest is not None:
+                merge_guest_cart(guest, user)
+            
+            # simplejwt's token machinery is only needed once someone logs in
+            from rest_framework_simplejwt.tokens import RefreshToken
+            
             refresh = RefreshToken.for_user(user)
             return Response({
                 'refresh': str(refresh),
@@ -51,6 +106,13 @@ class LoginView(views.APIView):
         
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
+@csrf_exempt
+def token_refresh(request, *args, **kwargs):
+    # simplejwt's TokenRefreshView, imported on first use
+    from rest_framework_simplejwt.views import TokenRefreshView
+    
+    return TokenRefreshView.as_view()(request, *args, **kwargs)
+
 class ProfileView(views.APIView):
     permission_classes = [IsAuthenticated]
     
@@ -84,7 +146,7 @@ class CreateAdminView(views.APIView):
         if role not in ['ADMIN', 'SUPER_ADMIN']:
             return Response({'error': 'Invalid role'}, status=status.HTTP_400_BAD_REQUEST)
         
-        user = User.objects.create_user(username=username, email=email, password=password)
+        user = create_user(username=username, email=email, password=password)
         UserProfile.objects.create(user=user, role=role)
         
         return Response({
@@ -111,9 +173,10 @@ class ListUsersView(views.APIView):
         return Response(data)
 
 # Category ViewSet
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    throttle_classes = [CatalogRateThrottle]
     
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -121,9 +184,10 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return [AllowAny()]
 
 # Brand ViewSet
-class BrandViewSet(viewsets.ModelViewSet):
+class BrandViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
+    throttle_classes = [CatalogRateThrottle]
     
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -131,15 +195,70 @@ class BrandViewSet(viewsets.ModelViewSet):
         return [AllowAny()]
 
 # Product ViewSet
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Product.objects.filter(is_active=True)
     serializer_class = ProductSerializer
+    throttle_classes = [CatalogRateThrottle]
+    renderer_classes = fast_renderer_classes()
+    # Product payloads embed the category and brand names
+    version_fields = ['updated_at', 'category__updated_at', 'brand__updated_at']
+    only_field_map = {
+        'name': 'name', 'slug': 'slug', 'description': 'description',
+        'category': 'category', 'category_name': 'category__name',
+        'brand': 'brand', 'brand_name': 'brand__name', 'base_price': 'base_price',
+        'stock': 'stock', 'is_active': 'is_active', 'created_at': 'created_at',
+    }
+    
+    def dispatch(self, request, *args, **kwargs):
+        # /products/<slug>/ resolves to the id through the cached slug map
+        pk = kwargs.get('pk')
+        if pk is not None and not pk.isdigit():
+            product_id = resolve_slug(Product, pk)
+            if product_id is not None:
+                kwargs['pk'] = str(product_id)
+        return super().dispatch(request, *args, **kwargs)
     
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy', 'add_variant', 'add_image']:
             return [IsAdminOrSuperAdmin()]
         return [AllowAny()]
     
+    def get_selection(self):
+        if self.action not in ['list', 'retrieve']:
+            return None
+        return FieldSelection.from_request(self.request)
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            # Only join and prefetch what the selected fields render
+            selection = self.get_selection()
+            related = [name for name in ['category', 'brand'] if includes(selection, f'{name}_name')]
+            if related:
+                queryset = queryset.select_related(*related)
+            queryset = queryset.prefetch_related(*[
+                name for name in ['images', 'variants'] if includes(selection, name)
+            ])
+            only = only_fields(selection, self.only_field_map)
+            if only:
+                queryset = queryset.only(*only)
+        return queryset
+    
+    def get_serializer(self, *args, **kwargs):
+        if self.action == 'retrieve':
+            kwargs.setdefault('selection', self.get_selection())
+        return super().get_serializer(*args, **kwargs)
+    
+    @conditional_get
+    def list(self, request, *args, **kwargs):
+        # Read-only fast path, same output as ProductSerializer
+        selection = self.get_selection()
+        queryset = product_values(self.filter_queryset(self.get_queryset()), selection)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serialize_products(page, request, selection))
+        return Response(serialize_products(queryset, request, selection))
+    
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
     
@@ -161,6 +280,27 @@ class ProductViewSet(viewsets.ModelViewSet):
             return Response({'message': 'Image uploaded successfully'}, status=status.HTTP_201_CREATED)
         return Response({'error': 'No image provided'}, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        if not pk.isdigit():
+            # dispatch() found no product with this slug
+            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        rows = ProductRecommendation.objects.filter(
+            product_id=pk, related_product__is_active=True
+        ).order_by('-score').values_list(
+            'related_product_id', 'related_product__name', 'related_product__slug',
+            'related_product__base_price', 'score'
+        )[:limit]
+        return Response([
+            {'id': id, 'name': name, 'slug': slug, 'base_price': price(base_price), 'score': score}
+            for id, name, slug, base_price, score in rows
+        ])
+    
     @action(detail=True, methods=['get'])
     def reviews(self, request, pk=None):
         product = self.get_object()
@@ -168,60 +308,159 @@ class ProductViewSet(viewsets.ModelViewSet):
         serializer = ReviewSerializer(reviews, many=True)
         return Response(serializer.data)
 
+# Bulk variant lookup by SKU for POS and warehouse integrations
+class ResolveSkusView(views.APIView):
+    permission_classes = [AllowAny]
+    throttle_classes = [CatalogRateThrottle]
+    renderer_classes = fast_renderer_classes()
+    
+    def post(self, request):
+        skus = request.data.get('skus') if isinstance(request.data, dict) else None
+        limit = getattr(settings, 'SKU_RESOLVE_MAX', 5000)
+        if not isinstance(skus, list) or not all(isinstance(sku, str) for sku in skus):
+            return Response({'error': 'skus must be a list of strings'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(skus) > limit:
+            return Response({'error': f'At most {limit} skus per request'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        skus = list(dict.fromkeys(skus))
+        found = sku_index.resolve(skus)
+        return Response({
+            'variants': [{'sku': sku, **found[sku]} for sku in skus if sku in found],
+            'missing': [sku for sku in skus if sku not in found],
+        })
+
+# Catalogue change feed, one NDJSON line per changed row
+# Inactive products and discounts are included, so it is for admins only
+class ChangesView(views.APIView):
+    permission_classes = [IsAdminOrSuperAdmin]
+    throttle_classes = [CatalogRateThrottle]
+    
+    def get(self, request):
+        max_page = getattr(settings, 'CHANGES_MAX_PAGE', 1000)
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = min(int(request.query_params.get('limit', max_page)), max_page)
+        except ValueError:
+            return Response({'error': 'since and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if since < 0 or limit < 1:
+            return Response({'error': 'since must be 0 or more and limit at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        ids = compacted_changes(since, limit + 1, getattr(settings, 'CHANGES_SETTLE_SECONDS', 0))
+        more = len(ids) > limit
+        ids = ids[:limit]
+        response = StreamingHttpResponse(ndjson_lines(ids), content_type='application/x-ndjson')
+        response['X-Next-Cursor'] = ids[-1] if ids else since
+        response['X-More-Changes'] = 'true' if more else 'false'
+        return response
+
 # Cart Views
+# Anonymous shoppers use a guest cart named by the X-Cart-Token header
 class CartView(views.APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
+    throttle_classes = [GuestCartRateThrottle]
+    renderer_classes = fast_renderer_classes()
+    cache_control = PRIVATE_NO_CACHE
     
+    def get_version(self, request):
+        if request.user.is_authenticated:
+            carts = Cart.objects.filter(user=request.user)
+        else:
+            carts = guest_carts().filter(pk=guest_cart_id(request.headers.get(GUEST_CART_HEADER)))
+        # Lines show each variant's live price and stock, so variant changes count too
+        cart = carts.annotate(
+            variants_updated_at=Max('items__product_variant__updated_at')
+        ).values_list('id', 'updated_at', 'variants_updated_at').first()
+        if cart is None:
+            return None
+        return '-'.join(map(str, cart)), max(filter(None, cart[1:]))
+    
+    @conditional_get
     def get(self, request):
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        cart = get_request_cart(request, create=request.user.is_authenticated)
+        if cart is None:
+            return Response({'id': None, 'user': None, 'items': [], 'item_count': 0, 'total': 0, 'created_at': None})
+        return Response(serialize_cart(cart))
+    
+    def patch(self, request):
+        # Replace the cart's contents with the given lines in one round trip
+        if not isinstance(request.data, dict):
+            return Response({'error': 'Expected a JSON object'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            quantities = parse_lines(request.data.get('items'))
+            with transaction.atomic():
+                cart = get_request_cart(request, create=True)
+                apply_lines(cart, quantities)
+                cart.refresh_from_db(fields=['item_count', 'subtotal'])
+        except CartLinesError as exc:
+            data = {'error': exc.message}
+            if exc.variant_ids:
+                data['product_variants'] = exc.variant_ids
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        return attach_token(Response(serialize_cart(cart)), cart)
+
+class CartSummaryView(views.APIView):
+    # Cart badge: item count and subtotal straight from the Cart row
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        if request.user.is_authenticated:
+            carts = Cart.objects.filter(user=request.user)
+        else:
+            carts = guest_carts().filter(pk=guest_cart_id(request.headers.get(GUEST_CART_HEADER)))
+        summary = carts.values('item_count', 'subtotal').first()
+        return Response(summary or {'item_count': 0, 'subtotal': 0})
 
 class AddToCartView(views.APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
+    throttle_classes = [GuestCartRateThrottle]
     
+    @idempotent
     def post(self, request):
-        cart, created = Cart.objects.get_or_create(user=request.user)
+        if not isinstance(request.data, dict):
+            return Response({'error': 'Expected a JSON object'}, status=status.HTTP_400_BAD_REQUEST)
         variant_id = request.data.get('product_variant')
-        quantity = request.data.get('quantity', 1)
+        sku = request.data.get('sku')
+        quantity = parse_quantity(request.data.get('quantity', 1))
+        if quantity is None:
+            return Response({'error': 'quantity must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            variant = ProductVariant.objects.get(id=variant_id)
+            if variant_id is None and sku:
+                variant = ProductVariant.objects.get(sku=sku)
+            else:
+                variant = ProductVariant.objects.get(id=variant_id)
         except ProductVariant.DoesNotExist:
             return Response({'error': 'Product variant not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, product_variant=variant)
-        if not created:
-            cart_item.quantity += int(quantity)
-        else:
-            cart_item.quantity = int(quantity)
-        cart_item.save()
+        # Only a valid request may create a guest cart
+        cart = get_request_cart(request, create=True)
+        cart_item = add_item(cart, variant, quantity)
         
         serializer = CartItemSerializer(cart_item)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return attach_token(Response(serializer.data, status=status.HTTP_201_CREATED), cart)
 
 class UpdateCartItemView(views.APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
     
     def put(self, request, item_id):
         try:
-            cart_item = CartItem.objects.get(id=item_id, cart__user=request.user)
-            quantity = request.data.get('quantity')
-            if quantity:
-                cart_item.quantity = int(quantity)
-                cart_item.save()
+            cart_item = CartItem.objects.get(id=item_id, cart=get_request_cart(request))
+            quantity = parse_quantity(request.data.get('quantity') if isinstance(request.data, dict) else None)
+            if quantity is None:
+                return Response({'error': 'quantity must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+            set_quantity(cart_item, quantity)
             serializer = CartItemSerializer(cart_item)
             return Response(serializer.data)
         except CartItem.DoesNotExist:
             return Response({'error': 'Cart item not found'}, status=status.HTTP_404_NOT_FOUND)
 
 class RemoveCartItemView(views.APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
     
     def delete(self, request, item_id):
         try:
-            cart_item = CartItem.objects.get(id=item_id, cart__user=request.user)
-            cart_item.delete()
+            cart_item = CartItem.objects.get(id=item_id, cart=get_request_cart(request))
+            remove_item(cart_item)
             return Response({'message': 'Item removed'}, status=status.HTTP_204_NO_CONTENT)
         except CartItem.DoesNotExist:
             return Response({'error': 'Cart item not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -230,9 +469,12 @@ class RemoveCartItemView(views.APIView):
 class CreateOrderView(views.APIView):
     permission_classes = [IsAuthenticated]
     
+    @idempotent
     def post(self, request):
-        cart = Cart.objects.get(user=request.user)
-        if not cart.items.exists():
+        if not isinstance(request.data, dict):
+            return Response({'error': 'Expected a JSON object'}, status=status.HTTP_400_BAD_REQUEST)
+        cart = Cart.objects.filter(user=request.user).first()
+        if cart is None or not cart.item_count:
             return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
         
         address_id = request.data.get('address')
@@ -244,52 +486,69 @@ class CreateOrderView(views.APIView):
             return Response({'error': 'Address not found'}, status=status.HTTP_404_NOT_FOUND)
         
         # Calculate totals
-        total_amount = sum(item.subtotal for item in cart.items.all())
+        items = list(cart.items.all())
+        snapshots = line_snapshots({item.product_variant_id for item in items})
+        # Charge the variants' current prices, not the cart's copy of them
+        total_amount = sum(
+            (item.quantity * snapshots[item.product_variant_id]['price'] for item in items), Decimal('0.00')
+        )
         discount = 0
         
         # Apply coupon if provided
-        if coupon_code:
-            try:
-                coupon = Coupon.objects.get(code=coupon_code, expiry_date__gte=datetime.now())
-                if total_amount >= coupon.min_amount:
-                    if coupon.discount_type == 'PERCENT':
-                        discount = (total_amount * coupon.value) / 100
-                    else:
-                        discount = coupon.value
-            except Coupon.DoesNotExist:
-                pass
+        coupon = coupon_index.lookup(coupon_code)
+        if coupon is not None:
+            discount = discount_for(coupon, total_amount)
         
         grand_total = total_amount - discount
         
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            address=address,
-            total_amount=total_amount,
-            discount=discount,
-            grand_total=grand_total
-        )
+        quantities = {}
+        for item in items:
+            quantities[item.product_variant_id] = quantities.get(item.product_variant_id, 0) + item.quantity
         
-        # Create order items and reduce stock
-        for item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product_variant=item.product_variant,
-                quantity=item.quantity,
-                price=item.product_variant.price
+        try:
+            with transaction.atomic():
+                # Create order
+                order = Order.objects.create(
+                    user=request.user,
+                    address=address,
+                    total_amount=total_amount,
+                    discount=discount,
+                    grand_total=grand_total
+                )
+                
+                # Create order items and reduce stock
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product_variant_id=item.product_variant_id,
+                        quantity=item.quantity,
+                        **snapshots[item.product_variant_id]
+                    )
+                    for item in items
+                ])
+                reserve_stock(quantities)
+                if discount:
+                    redeem_coupon(coupon)
+                
+                # Clear cart
+                clear_cart(cart)
+                
+                apply_order(order)
+                record_order(order.id)
+        except InsufficientStock as exc:
+            return Response(
+                {'error': 'Insufficient stock', 'product_variants': exc.variant_ids},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            # Reduce stock
-            item.product_variant.stock -= item.quantity
-            item.product_variant.save()
-        
-        # Clear cart
-        cart.items.all().delete()
+        except CouponUnavailable:
+            return Response({'error': 'Coupon is no longer available'}, status=status.HTTP_400_BAD_REQUEST)
         
         serializer = OrderSerializer(order)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 class ListOrdersView(views.APIView):
     permission_classes = [IsAuthenticated]
+    renderer_classes = fast_renderer_classes()
     
     def get(self, request):
         if hasattr(request.user, 'profile') and request.user.profile.role in ['ADMIN', 'SUPER_ADMIN']:
@@ -297,22 +556,62 @@ class ListOrdersView(views.APIView):
         else:
             orders = Order.objects.filter(user=request.user)
         
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        selection = FieldSelection.from_request(request)
+        return Response(serialize_orders(order_values(orders, selection), selection))
 
 class OrderDetailView(views.APIView):
     permission_classes = [IsAuthenticated]
-    
+    cache_control = PRIVATE_NO_CACHE
+    only_field_map = {
+        'user': 'user', 'user_name': 'user__username', 'address': 'address',
+        'total_amount': 'total_amount', 'discount': 'discount', 'grand_total': 'grand_total',
+        'payment_status': 'payment_status', 'order_status': 'order_status',
+        'created_at': 'created_at', 'approved_by': 'approved_by',
+    }
+    
+    def get_queryset(self, selection):
+        orders = Order.objects.all()
+        if includes(selection, 'user_name'):
+            orders = orders.select_related('user')
+        if includes(selection, 'items'):
+            orders = orders.prefetch_related('items')
+        only = only_fields(selection, self.only_field_map)
+        if only:
+            orders = orders.only(*only)
+        return orders
+    
+    def get_version(self, request, order_id):
+        orders = Order.objects.filter(id=order_id)
+        archived = ArchivedOrder.objects.filter(id=order_id)
+        if not (hasattr(request.user, 'profile') and request.user.profile.role in ['ADMIN', 'SUPER_ADMIN']):
+            orders = orders.filter(user=request.user)
+            archived = archived.filter(user=request.user)
+        updated_at = orders.values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            # Archived orders never change
+            updated_at = archived.values_list('archived_at', flat=True).first()
+            if updated_at is None:
+                return None
+        return f'{order_id}-{updated_at}', updated_at
+    
+    @conditional_get
     def get(self, request, order_id):
+        selection = FieldSelection.from_request(request)
+        orders = self.get_queryset(selection)
+        archived = ArchivedOrder.objects.filter(id=order_id)
         try:
             if hasattr(request.user, 'profile') and request.user.profile.role in ['ADMIN', 'SUPER_ADMIN']:
-                order = Order.objects.get(id=order_id)
+                order = orders.get(id=order_id)
             else:
-                order = Order.objects.get(id=order_id, user=request.user)
+                archived = archived.filter(user=request.user)
+                order = orders.get(id=order_id, user=request.user)
             
-            serializer = OrderSerializer(order)
+            serializer = OrderSerializer(order, selection=selection)
             return Response(serializer.data)
         except Order.DoesNotExist:
+            payload = archived.values_list('payload', flat=True).first()
+            if payload is not None:
+                return Response(select_fields(payload, selection))
             return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
 
 class UpdateOrderStatusView(views.APIView):
@@ -321,40 +620,131 @@ class UpdateOrderStatusView(views.APIView):
     def put(self, request, order_id):
         try:
             order = Order.objects.get(id=order_id)
-            order_status = request.data.get('order_status')
-            
-            if order_status:
-                order.order_status = order_status
-                order.save()
-            
-            return Response({
-                'id': order.id,
-                'order_status': order.order_status,
-                'updated_by': request.user.username
-            })
         except Order.DoesNotExist:
             return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        if not isinstance(request.data, dict):
+            return Response({'error': 'Expected a JSON object'}, status=status.HTTP_400_BAD_REQUEST)
+        order_status = request.data.get('order_status')
+        if order_status and order_status != order.order_status:
+            try:
+                result, = transition_orders([order.id], order_status, request.user)
+            except InvalidStatus as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if result['result'] != 'ok':
+                return Response({
+                    'error': f'Cannot change order status from {order.order_status} to {order_status}'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            order.order_status = order_status
+        
+        return Response({
+            'id': order.id,
+            'order_status': order.order_status,
+            'updated_by': request.user.username
+        })
 
 class ApproveOrderView(views.APIView):
     permission_classes = [IsAdminOrSuperAdmin]
     
     def post(self, request, order_id):
-        try:
-            order = Order.objects.get(id=order_id)
-            order.order_status = 'APPROVED'
-            order.approved_by = request.user
-            order.save()
-            
-            # Create notification
-            Notification.objects.create(
-                user=order.user,
-                title='Order Approved',
-                message=f'Your order #{order.id} has been approved.'
-            )
-            
-            return Response({'message': 'Order approved successfully'})
-        except Order.DoesNotExist:
+        result, = transition_orders([order_id], 'APPROVED', request.user)
+        if result['result'] == 'not_found':
             return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+        if result['result'] != 'ok':
+            return Response({
+                'error': f"Cannot approve an order with status {result['order_status']}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({'message': 'Order approved successfully'})
+
+class BulkOrderTransitionView(views.APIView):
+    permission_classes = [IsAdminOrSuperAdmin]
+    max_orders = 5000
+    
+    def post(self, request):
+        if not isinstance(request.data, dict):
+            return Response({'error': 'Expected a JSON object'}, status=status.HTTP_400_BAD_REQUEST)
+        ids = request.data.get('ids')
+        order_status = request.data.get('order_status')
+        expected_status = request.data.get('expected_status')
+        
+        if not isinstance(ids, list) or not ids:
+            return Response({'error': 'ids must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.max_orders:
+            return Response({'error': f'At most {self.max_orders} orders per request'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = [int(order_id) for order_id in ids]
+        except (TypeError, ValueError):
+            return Response({'error': 'ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            results = transition_orders(ids, order_status, request.user, expected_status)
+        except InvalidStatus as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'order_status': order_status,
+            'updated': sum(1 for result in results if result['result'] == 'ok'),
+            'results': results
+        })
+
+# Metrics Views
+class MetricsView(views.APIView):
+    permission_classes = [IsAdminOrSuperAdmin]
+    
+    def get(self, request):
+        return Response(metrics.snapshot())
+
+# Sales Dashboard Views
+class SalesDashboardView(views.APIView):
+    permission_classes = [IsAdminOrSuperAdmin]
+    group_fields = {
+        'day': ['day'],
+        'month': ['month'],
+        'category': ['category', 'category__name'],
+        'brand': ['brand', 'brand__name'],
+    }
+    
+    def get(self, request):
+        today = timezone.localdate()
+        start = request.query_params.get('start')
+        end = request.query_params.get('end')
+        try:
+            # parse_date returns None for a malformed date and raises for an impossible one
+            start = parse_date(start) if start else today - timedelta(days=29)
+            end = parse_date(end) if end else today
+        except ValueError:
+            start = end = None
+        if start is None or end is None:
+            return Response({'error': 'Dates must be valid and in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+        if start > end:
+            return Response({'error': 'start must not be after end'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        group_by = request.query_params.get('group_by', 'day')
+        if group_by not in self.group_fields:
+            return Response({'error': 'Invalid group_by'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        totals = {
+            'orders': Sum('orders'),
+            'units': Sum('units'),
+            'gross': Sum('gross'),
+            'discount': Sum('discount'),
+            'net': Sum('net'),
+        }
+        rollups = SalesRollup.objects.filter(day__gte=start, day__lte=end)
+        if group_by == 'month':
+            rollups = rollups.annotate(month=TruncMonth('day'))
+        fields = self.group_fields[group_by]
+        rows = rollups.values(*fields).annotate(**totals).order_by(*fields)
+        
+        # Orders spanning several categories or brands count once per bucket
+        return Response({
+            'start': start,
+            'end': end,
+            'group_by': group_by,
+            'totals': rollups.aggregate(**totals),
+            'rows': list(rows),
+        })
 
 # Review Views
 class CreateReviewView(views.APIView):
@@ -411,12 +801,11 @@ class CouponViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def validate_coupon(self, request):
         code = request.query_params.get('code')
-        try:
-            coupon = Coupon.objects.get(code=code, expiry_date__gte=datetime.now())
-            serializer = CouponSerializer(coupon)
-            return Response(serializer.data)
-        except Coupon.DoesNotExist:
+        coupon = coupon_index.lookup(code)
+        if coupon is None:
             return Response({'error': 'Invalid or expired coupon'}, status=status.HTTP_404_NOT_FOUND)
+        serializer = CouponSerializer(coupon)
+        return Response(serializer.data)
 
 # Notification Views
 class ListNotificationsView(views.APIView):
@@ -468,4 +857,22 @@ class AddressViewSet(viewsets.ModelViewSet):
         return Address.objects.filter(user=self.request.user)
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
\ No newline at end of file
+        serializer.save(user=self.request.user)
+
+# Batch View
+class BatchView(views.APIView):
+    """
+    Run several API requests in one round trip:
+    {"requests": [{"method": "GET", "path": "/products/?page=2"}, ...]}.
+    Each sub-request still goes through its own view's permissions.
+    """
+    permission_classes = [AllowAny]
+    
+    def post(self, request):
+        operations = request.data.get('requests') if isinstance(request.data, dict) else None
+        try:
+            validate_batch(operations)
+        except BatchError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({'responses': run_batch(request, operations)})
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import importlib.util
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -30,6 +31,10 @@ ALLOWED_HOSTS = []
 
 # Application definition
 
+# Switch off on API-only workers to skip the admin and its module graph. This
+# is a toggle, not lazy loading: when enabled the admin loads at startup.
+ADMIN_ENABLED = True
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -40,10 +45,16 @@ INSTALLED_APPS = [
     'core',
     'corsheaders',
     'rest_framework',
-    'rest_framework_simplejwt',
+    # rest_framework_simplejwt is not listed so that it is not imported at
+    # startup. The app only ships translations, so its messages stay English.
 ]
+if not ADMIN_ENABLED:
+    INSTALLED_APPS.remove('django.contrib.admin')
 
 MIDDLEWARE = [
+    'core.access_log.RequestLogMiddleware',
+    'core.middleware.LoadSheddingMiddleware',
+    'core.middleware.IdentityMapMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -103,6 +114,30 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing: scrypt (or Argon2 when argon2-cffi is installed) with the
+# cost from PASSWORD_HASHER_PROFILE; run `python manage.py tune_password_hasher`
+# on the production host to pick it. PBKDF2 hashes still verify and are
+# upgraded on the next login.
+PASSWORD_HASHERS = [
+    'core.hashers.TunedScryptPasswordHasher',
+    'core.hashers.TunedArgon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+if importlib.util.find_spec('argon2') is not None:
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(1))
+
+PASSWORD_HASHER_PROFILE = {
+    'scrypt': {'work_factor': 2 ** 14, 'block_size': 8, 'parallelism': 1},
+    'argon2': {'time_cost': 2, 'memory_cost': 65536, 'parallelism': 4},
+}
+
+# Hashing process pool (0 hashes on the request thread)
+PASSWORD_HASH_WORKERS = 2
+PASSWORD_HASH_QUEUE_SIZE = 32
+
+AUTHENTICATION_BACKENDS = ['core.backends.OffloadedModelBackend']
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -130,17 +165,122 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.LazyJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # Trusted reverse proxies in front of the app. With 0, clients are
+    # identified by REMOTE_ADDR and X-Forwarded-For is ignored, so it cannot
+    # be forged to dodge the per-IP rate limits; behind one proxy use 1.
+    'NUM_PROXIES': 0,
 }
 
 from datetime import timedelta
 
+from corsheaders.defaults import default_headers
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=5),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
 
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'x-cart-token')
+CORS_EXPOSE_HEADERS = ['X-Cart-Token']
+
+# Idempotency-Key handling for checkout and cart mutations
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+IDEMPOTENCY_LOCK_TIMEOUT = timedelta(seconds=30)
+
+# Token bucket rate limits per scope (refill_rate is in tokens per second).
+# RATE_LIMIT_STORE is 'local' (per process) or 'cache' (shared through CACHES).
+RATE_LIMIT_STORE = 'local'
+RATE_LIMIT_BUCKETS = {
+    'auth': {'capacity': 5, 'refill_rate': 5 / 60},
+    'catalog': {'capacity': 120, 'refill_rate': 20},
+    'cart': {'capacity': 30, 'refill_rate': 0.5},
+}
+
+# Requests handled concurrently per process before shedding load with 503
+LOAD_SHED_MAX_CONCURRENCY = 64
+LOAD_SHED_QUEUE_TIMEOUT = 0.05
+LOAD_SHED_RETRY_AFTER = 1
+
+# Neighbours kept per product by build_recommendations
+RECOMMENDATIONS_TOP_K = 20
+
+# Low-stock alerts (forecast_stock)
+LOW_STOCK_THRESHOLD = 10
+STOCKOUT_LEAD_DAYS = 7
+
+# Retention for archive_history
+ARCHIVE_NOTIFICATIONS_AFTER_DAYS = 90
+ARCHIVE_ORDERS_AFTER_DAYS = 365
+
+# Seconds a product slug -> id lookup stays cached
+SLUG_CACHE_TIMEOUT = 300
+
+# /batch/: sub-requests per batch and threads for concurrent reads
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+
+# Admin changelists show the table size estimate above this many rows
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 10000
+
+# Guest carts expire after this long without activity (purge_guest_carts)
+GUEST_CART_TTL = timedelta(days=7)
+
+# Seconds the in-process coupon index is used before it is reloaded
+COUPON_INDEX_TTL = 60
+
+# Structured JSON access log (core.access_log). SQL with per-query timings is
+# attached for a sample of requests and for every request slower than
+# ACCESS_LOG_SLOW_MS.
+ACCESS_LOG_SQL_SAMPLE_RATE = 0.01
+ACCESS_LOG_SLOW_MS = 500
+ACCESS_LOG_MAX_QUERIES = 200
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'core.access_log.RequestIdFilter'},
+    },
+    'formatters': {
+        'json': {'()': 'core.access_log.JsonFormatter'},
+    },
+    'handlers': {
+        'json': {
+            'class': 'core.access_log.BackgroundStreamHandler',
+            'stream': 'ext://sys.stderr',
+            'queue_size': 10000,
+            'filters': ['request_id'],
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'core': {'handlers': ['json'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# profile_startup fails when booting a worker and serving the first request
+# takes longer than this (milliseconds)
+STARTUP_BUDGET_MS = 2000
+
+# /variants/resolve/: SKUs per request, and the in-process SKU index size and
+# entry lifetime in seconds
+SKU_RESOLVE_MAX = 5000
+SKU_INDEX_MAX_SIZE = 100000
+SKU_INDEX_TTL = 60
+
+# /changes/: most rows per response, and how many days of change events
+# purge_change_events keeps
+CHANGES_MAX_PAGE = 1000
+CHANGE_EVENT_RETENTION_DAYS = 30
+# Events younger than this are not served yet. SQLite commits them in id
+# order; on PostgreSQL/MySQL set it above the longest catalogue transaction
+CHANGES_SETTLE_SECONDS = 0